@@ -0,0 +1,289 @@
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from data_loader import POLITIFACT_DATASET, REPORT_COLUMN, SUMMARY_COLUMN, iter_records
+from fact_checking import DEFAULT_CHECKPOINT, TaskKey, iter_prompt_tasks, iter_tasks, load_completed, result_record
+from metrics import call_tags
+from models import BaseModel, get_client, get_model, getenv
+from text_processing import get_prompt_messages
+
+DEFAULT_WORK_DIR = "data/output/batch"
+CHAT_ENDPOINT = "/v1/chat/completions"
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+# Batch states after which nothing more will happen.
+FINAL_STATES = {"completed", "failed", "expired", "cancelled"}
+
+
+def custom_id(key: TaskKey) -> str:
+    row_number, model_name, repetition = key
+    # Model names contain "/" and ":", so they go last.
+    return f"{row_number}:{repetition}:{model_name}"
+
+
+def parse_custom_id(value: str) -> TaskKey:
+    row_number, repetition, model_name = value.split(":", 2)
+    return int(row_number), model_name, int(repetition)
+
+
+def _request(key: TaskKey, messages: List[Dict]) -> Dict:
+    return {
+        "custom_id": custom_id(key),
+        "method": "POST",
+        "url": CHAT_ENDPOINT,
+        "body": {"model": key[1], "temperature": 0, "messages": messages},
+    }
+
+
+def build_requests(model_names: Iterable[str],
+                   dataset: str = POLITIFACT_DATASET,
+                   repetitions: int = 5,
+                   checkpoint: str = DEFAULT_CHECKPOINT,
+                   limit: Optional[int] = None,
+                   max_report_tokens: Optional[int] = None,
+                   workers: Optional[int] = None) -> Iterator[Dict]:
+    """Yields one batch request line per call that `checkpoint` does not hold yet.
+
+    The messages are the ones `fact_checking.classify` would send, so batch
+    and per-request runs give comparable results. With `workers`, the sheet
+    is streamed and prompts are built in that many processes
+    (`fact_checking.iter_prompt_tasks`), which pays off for large exports.
+    """
+    model_names = list(model_names)
+    completed = load_completed(checkpoint)
+    if workers is None:
+        for key, row in iter_tasks(dataset, model_names, repetitions, completed, limit):
+            messages = get_prompt_messages(row.get(REPORT_COLUMN) or "",
+                                           max_report_tokens=max_report_tokens,
+                                           summary=row.get(SUMMARY_COLUMN))
+            yield _request(key, messages)
+        return
+    for key, _, messages, _ in iter_prompt_tasks(dataset, model_names, repetitions, completed, limit,
+                                                 workers=workers, max_report_tokens=max_report_tokens):
+        yield _request(key, messages)
+
+
+def write_batch_file(requests: Iterable[Dict], path: str) -> int:
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for request in requests:
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+class BatchBackend(ABC):
+    @abstractmethod
+    def submit(self, path: str) -> str:
+        """Uploads a batch request file and returns the batch id."""
+
+    @abstractmethod
+    def status(self, batch_id: str) -> str:
+        """Returns the batch state, e.g. "in_progress" or "completed"."""
+
+    @abstractmethod
+    def download(self, batch_id: str, path: str) -> str:
+        """Saves the output lines of a finished batch to `path`."""
+
+
+class OpenAIBatchBackend(BatchBackend):
+    """The OpenAI Batch API; requests run within 24 hours at a reduced price."""
+
+    def __init__(self, api_key_name: str = "OPENAI_API_KEY", base_url: str = OPENAI_BASE_URL):
+        self.client = get_client(base_url, getenv(api_key_name))
+
+    def submit(self, path: str) -> str:
+        with open(path, "rb") as f:
+            uploaded = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(input_file_id=uploaded.id, endpoint=CHAT_ENDPOINT,
+                                           completion_window="24h")
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        return self.client.batches.retrieve(batch_id).status
+
+    def download(self, batch_id: str, path: str) -> str:
+        batch = self.client.batches.retrieve(batch_id)
+        with open(path, "w", encoding="utf-8") as out:
+            # Requests that failed outright are listed in a separate error file.
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if file_id:
+                    out.write(self.client.files.content(file_id).text)
+        return path
+
+
+class LocalBatchBackend(BatchBackend):
+    """Runs a batch file in a background thread through `models.get_model`.
+
+    Output lines follow the OpenAI batch format, so it stands in for a real
+    batch endpoint in tests and with the replay or local backends. Requests
+    run `max_concurrency` at a time with their repetition and, given the
+    `dataset`, the url of their row, as `fact_checking.classify` sends them.
+    A batch with any failed request ends as "failed".
+    """
+
+    def __init__(self, work_dir: str = DEFAULT_WORK_DIR, dataset: Optional[str] = None,
+                 max_concurrency: int = 8):
+        self.work_dir = work_dir
+        self.max_concurrency = max_concurrency
+        self.urls = [row["url"] for row in iter_records(dataset, columns=["url"])] if dataset else None
+        self.states: Dict[str, str] = {}
+        self._models: Dict[str, BaseModel] = {}
+        self._models_lock = threading.Lock()
+
+    def _output_path(self, batch_id: str) -> str:
+        return os.path.join(self.work_dir, f"{batch_id}.output.jsonl")
+
+    def _model(self, name: str) -> BaseModel:
+        with self._models_lock:
+            if name not in self._models:
+                self._models[name] = get_model(name)
+            return self._models[name]
+
+    def _answer(self, request: Dict) -> Dict:
+        row_number, _, repetition = parse_custom_id(request["custom_id"])
+        body = request["body"]
+        url = self.urls[row_number - 1] if self.urls else None
+        try:
+            with call_tags(url=url):
+                content, response = self._model(body["model"]).complete(body["messages"], repetition=repetition)
+            response = response.model_dump() if hasattr(response, "model_dump") else {}
+            response.setdefault("choices", [{"message": {"role": "assistant", "content": content}}])
+            result = {"status_code": 200, "body": response}
+            error = None
+        except Exception as failure:
+            result = None
+            error = {"code": type(failure).__name__, "message": str(failure)}
+        return {"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request["custom_id"],
+                "response": result, "error": error}
+
+    def _run(self, path: str, batch_id: str):
+        state = "failed"
+        try:
+            with open(path, encoding="utf-8") as f:
+                requests = [json.loads(line) for line in f if line.strip()]
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                lines = list(executor.map(self._answer, requests))
+            with open(self._output_path(batch_id), "w", encoding="utf-8") as out:
+                for line in lines:
+                    out.write(json.dumps(line, ensure_ascii=False) + "\n")
+            if not any(line["error"] for line in lines):
+                state = "completed"
+        finally:
+            self.states[batch_id] = state
+
+    def submit(self, path: str) -> str:
+        os.makedirs(self.work_dir, exist_ok=True)
+        batch_id = f"local_batch_{uuid.uuid4().hex}"
+        self.states[batch_id] = "in_progress"
+        threading.Thread(target=self._run, args=(path, batch_id), daemon=True).start()
+        return batch_id
+
+    def status(self, batch_id: str) -> str:
+        if batch_id not in self.states:
+            # Submitted by an earlier process, whose outcome was not kept.
+            return "completed" if os.path.exists(self._output_path(batch_id)) else "failed"
+        return self.states[batch_id]
+
+    def download(self, batch_id: str, path: str) -> str:
+        if os.path.abspath(path) != os.path.abspath(self._output_path(batch_id)):
+            with open(self._output_path(batch_id), encoding="utf-8") as src, \
+                    open(path, "w", encoding="utf-8") as out:
+                out.writelines(src)
+        return path
+
+
+def wait_for_batch(backend: BatchBackend, batch_id: str, poll_interval: float = 60.0) -> str:
+    """Polls until the batch reaches a final state and returns that state."""
+    while True:
+        state = backend.status(batch_id)
+        if state in FINAL_STATES:
+            return state
+        time.sleep(poll_interval)
+
+
+def _output_content(line: Dict) -> Tuple[Optional[str], Optional[str], Optional[Dict]]:
+    response = line.get("response") or {}
+    body = response.get("body") or {}
+    if line.get("error") or response.get("status_code", 200) != 200:
+        error = line.get("error") or body.get("error") or {"code": response.get("status_code")}
+        return None, None, {"kind": error.get("code"), "message": error.get("message")}
+    return body["choices"][0]["message"]["content"], body.get("id"), None
+
+
+def merge_results(output_path: str, dataset: str = POLITIFACT_DATASET,
+                  checkpoint: str = DEFAULT_CHECKPOINT) -> int:
+    """Appends the results of a batch output file to the runner's checkpoint.
+
+    Lines are matched to dataset rows through their custom_id; calls the
+    checkpoint already holds are skipped. Returns the number of new results.
+    """
+    completed = load_completed(checkpoint)
+    urls = [row["url"] for row in iter_records(dataset, columns=["url"])]
+    if os.path.dirname(checkpoint):
+        os.makedirs(os.path.dirname(checkpoint), exist_ok=True)
+    written = 0
+    with open(output_path, encoding="utf-8") as f, open(checkpoint, "a", encoding="utf-8") as out:
+        for line in f:
+            if not line.strip():
+                continue
+            line = json.loads(line)
+            key = parse_custom_id(line["custom_id"])
+            if key in completed:
+                continue
+            content, response_id, error = _output_content(line)
+            result = result_record(key[0], urls[key[0] - 1], key[1], key[2], content, response_id, error)
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            completed.add(key)
+            written += 1
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify fact-check reports through a batch API.")
+    parser.add_argument("--models", nargs="+", required=True)
+    parser.add_argument("--backend", choices=["openai", "local"], default="openai")
+    parser.add_argument("--dataset", default=POLITIFACT_DATASET)
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--limit", type=int, default=None, help="Only process the first N rows.")
+    parser.add_argument("--max-report-tokens", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Stream the sheet and build prompts in this many processes.")
+    parser.add_argument("--work-dir", default=DEFAULT_WORK_DIR)
+    parser.add_argument("--batch-id", default=None, help="Resume waiting for an already submitted batch.")
+    parser.add_argument("--poll-interval", type=float, default=60.0)
+    args = parser.parse_args()
+
+    backend = (LocalBatchBackend(args.work_dir, args.dataset) if args.backend == "local"
+               else OpenAIBatchBackend())
+    batch_id = args.batch_id
+    if batch_id is None:
+        input_path = os.path.join(args.work_dir, "requests.jsonl")
+        count = write_batch_file(build_requests(args.models, args.dataset, args.repetitions, args.checkpoint,
+                                                args.limit, args.max_report_tokens, args.workers), input_path)
+        if not count:
+            print("Nothing to do: every call is already in the checkpoint.")
+            return
+        batch_id = backend.submit(input_path)
+        print(f"Submitted {count} requests as batch {batch_id}")
+
+    state = wait_for_batch(backend, batch_id, args.poll_interval)
+    if state != "completed":
+        print(f"Batch {batch_id} ended as {state}")
+        return
+    output_path = backend.download(batch_id, os.path.join(args.work_dir, f"{batch_id}.output.jsonl"))
+    written = merge_results(output_path, args.dataset, args.checkpoint)
+    print(f"Merged {written} results into {args.checkpoint}")
+
+
+if __name__ == "__main__":
+    main()
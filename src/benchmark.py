@@ -0,0 +1,276 @@
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from data_loader import (MAIN_EXPERIMENT_DATASET, POLITIFACT_DATASET, REPORT_COLUMN, SUMMARY_COLUMN, iter_records,
+                         iter_rows, load_table, stream_rows)
+from explanation_graphs import EXPLANATION_SUFFIX
+from text_processing import extract_bracketed_text, get_prompt_messages, parse_verdict
+
+DEFAULT_OUTPUT_DIR = "data/output/benchmarks"
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+# Modules whose import time is tracked, from the lightest entry points up.
+IMPORT_MODULES = ("text_processing", "models", "fact_checking", "evaluation", "graph_rendering")
+# CLI invocations whose wall-clock start-up is tracked.
+STARTUP_COMMANDS = {
+    "startup/help": ["--help"],
+    "startup/score_help": ["score", "--help"],
+    "startup/classify_help": ["classify", "--help"],
+}
+GRAPH_SCRIPTS_DIR = os.path.join(SRC_DIR, "..", "automatic_entity_graphs")
+SUITES = ["startup", "load", "prompts", "parser", "render", "end_to_end"]
+
+
+def measure(function: Callable[[], int], repeats: int = 5, warmup: int = 1) -> Dict:
+    """Times `function`, which returns how many items it processed.
+
+    Reports the median and fastest of `repeats` runs after `warmup`
+    untimed runs, plus items per second at the median.
+    """
+    for _ in range(warmup):
+        function()
+    runs = []
+    items = 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        items = function()
+        runs.append(time.perf_counter() - start)
+    return _result(runs, items)
+
+
+def _result(runs: List[float], items: int) -> Dict:
+    median = statistics.median(runs)
+    return {
+        "seconds": median,
+        "min_seconds": min(runs),
+        "runs": runs,
+        "items": items,
+        "items_per_second": items / median if median else None,
+    }
+
+
+def recorded_responses(dataset: str = MAIN_EXPERIMENT_DATASET) -> List[str]:
+    """Model explanations stored in the main experiment workbook."""
+    columns = [name for name in load_table(dataset, "main_experiment").column_names
+               if name.endswith(EXPLANATION_SUFFIX)]
+    return [row[column] for row in iter_records(dataset, "main_experiment", columns=columns)
+            for column in columns if row[column]]
+
+
+def _load_graph_scripts() -> Dict:
+    """Graphs and hand-made positions of the automatic_entity_graphs scripts."""
+    graphs = {}
+    for filename in sorted(os.listdir(GRAPH_SCRIPTS_DIR)):
+        if not filename.endswith(".py"):
+            continue
+        spec = importlib.util.spec_from_file_location(filename[:-3], os.path.join(GRAPH_SCRIPTS_DIR, filename))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        if hasattr(module, "create_argumentation_graph"):
+            graphs[filename[:-3]] = module.create_argumentation_graph()
+        else:
+            graphs[filename[:-3]] = (module.graph, module.pos)
+    return graphs
+
+
+def import_seconds(module: str) -> float:
+    """Time to import `module` in a fresh interpreter, without the interpreter's own start-up."""
+    code = (f"import sys, time; sys.path.insert(0, {SRC_DIR!r}); start = time.perf_counter(); "
+            f"import {module}; print(time.perf_counter() - start)")
+    return float(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout)
+
+
+def bench_startup(repeats: int) -> Dict:
+    """Import time of the main modules and start-up time of the fact_checking CLI.
+
+    These process no items, so they report seconds only.
+    """
+    results = {f"import/{module}": _result([import_seconds(module) for _ in range(repeats)], 0)
+               for module in IMPORT_MODULES}
+    cli = [sys.executable, os.path.join(SRC_DIR, "fact_checking.py")]
+    for name, args in STARTUP_COMMANDS.items():
+        results[name] = measure(lambda args=args: subprocess.run(cli + args, capture_output=True, check=True) and 0,
+                                repeats)
+    return results
+
+
+def bench_load(dataset: str, repeats: int) -> Dict:
+    return {
+        "load/xlsx": measure(lambda: sum(1 for _ in iter_rows(dataset)), repeats),
+        "load/xlsx_stream": measure(lambda: sum(1 for _ in stream_rows(dataset)), repeats),
+        "load/arrow_cache": measure(lambda: load_table(dataset).num_rows, repeats),
+    }
+
+
+def bench_prompts(dataset: str, repeats: int) -> Dict:
+    from fact_checking import iter_prompts
+
+    rows = list(iter_records(dataset, columns=[SUMMARY_COLUMN, REPORT_COLUMN]))
+
+    def assemble(max_report_tokens: Optional[int] = None):
+        for row in rows:
+            get_prompt_messages(row[REPORT_COLUMN] or "", max_report_tokens, row[SUMMARY_COLUMN])
+        return len(rows)
+
+    return {
+        "prompts/full": measure(assemble, repeats),
+        "prompts/truncated_1000": measure(lambda: assemble(1000), repeats),
+        # Streams the sheet and builds prompts and token counts in a process pool.
+        "prompts/parallel_stream": measure(lambda: sum(1 for _ in iter_prompts(dataset, max_report_tokens=1000)),
+                                           repeats),
+    }
+
+
+def bench_parser(responses: List[str], repeats: int) -> Dict:
+    def extract():
+        for response in responses:
+            extract_bracketed_text(response)
+        return len(responses)
+
+    def verdicts():
+        for response in responses:
+            parse_verdict(response)
+        return len(responses)
+
+    return {
+        "parser/extract_bracketed_text": measure(extract, repeats),
+        "parser/parse_verdict": measure(verdicts, repeats),
+    }
+
+
+def bench_render(repeats: int) -> Dict:
+    from graph_rendering import render_graph
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, (graph, pos) in _load_graph_scripts().items():
+            path = os.path.join(directory, f"{name}.png")
+
+            def render(pos=pos):
+                render_graph(graph, path, pos=pos)
+                return 1
+
+            # The script's hand-placed positions and the default layered layout.
+            results[f"render/{name}"] = measure(render, repeats)
+            results[f"render/{name}/layered"] = measure(lambda: render(None), repeats)
+    return results
+
+
+def bench_end_to_end(dataset: str, responses: List[str], limit: int, repeats: int) -> Dict:
+    from fact_checking import run_experiment
+
+    with tempfile.TemporaryDirectory() as directory:
+        replay_path = os.path.join(directory, "replay.jsonl")
+        # The replay backend answers by url, so each benchmarked row gets a response.
+        with open(replay_path, "w", encoding="utf-8") as f:
+            for number, row in enumerate(iter_records(dataset, columns=["url"])):
+                if limit is not None and number >= limit:
+                    break
+                record = {"url": row["url"], "repetition": 0, "content": responses[number % len(responses)]}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        def run():
+            checkpoint = os.path.join(directory, "results.jsonl")
+            if os.path.exists(checkpoint):
+                os.remove(checkpoint)
+            return run_experiment([f"replay:{replay_path}"], dataset, repetitions=1,
+                                  checkpoint=checkpoint, limit=limit)
+
+        return {"end_to_end/replay": measure(run, repeats)}
+
+
+def git_commit() -> Dict:
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(status) if status is not None else None}
+
+
+def run_benchmarks(dataset: str = POLITIFACT_DATASET,
+                   experiment_dataset: str = MAIN_EXPERIMENT_DATASET,
+                   suites: Optional[List[str]] = None,
+                   repeats: int = 5,
+                   limit: Optional[int] = None) -> Dict:
+    """Runs the selected suites ("startup", "load", "prompts", "parser",
+    "render", "end_to_end"; all by default) and returns the results with run
+    metadata."""
+    suites = suites or SUITES
+    responses = recorded_responses(experiment_dataset) if {"parser", "end_to_end"} & set(suites) else []
+    results = {}
+    if "startup" in suites:
+        results.update(bench_startup(repeats))
+    if "load" in suites:
+        results.update(bench_load(dataset, repeats))
+    if "prompts" in suites:
+        results.update(bench_prompts(dataset, repeats))
+    if "parser" in suites:
+        results.update(bench_parser(responses, repeats))
+    if "render" in suites:
+        results.update(bench_render(repeats))
+    if "end_to_end" in suites:
+        results.update(bench_end_to_end(dataset, responses, limit, repeats))
+    return {
+        **git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "repeats": repeats,
+        "results": results,
+    }
+
+
+def compare(current: Dict, baseline: Dict) -> List[str]:
+    """One line per benchmark with the median time relative to `baseline`."""
+    lines = []
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before and before["seconds"]:
+            ratio = result["seconds"] / before["seconds"]
+            lines.append(f"{name:45} {before['seconds']:9.4f}s -> {result['seconds']:9.4f}s  x{ratio:.2f}")
+    return lines
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark the classification pipeline.")
+    parser.add_argument("--dataset", default=POLITIFACT_DATASET)
+    parser.add_argument("--experiment-dataset", default=MAIN_EXPERIMENT_DATASET)
+    parser.add_argument("--suites", nargs="+", default=None,
+                        choices=SUITES)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=None, help="Rows used by the end-to-end benchmark.")
+    parser.add_argument("--output", default=None,
+                        help=f"Results file (default: {DEFAULT_OUTPUT_DIR}/<commit>.json).")
+    parser.add_argument("--compare", default=None, help="Earlier results file to compare against.")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.dataset, args.experiment_dataset, args.suites, args.repeats, args.limit)
+    output = args.output or os.path.join(DEFAULT_OUTPUT_DIR, f"{(results['commit'] or 'unknown')[:12]}.json")
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    for name, result in results["results"].items():
+        rate = f"{result['items_per_second']:12.1f}/s" if result["items_per_second"] else ""
+        print(f"{name:45} {result['seconds']:9.4f}s {rate}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print("\n".join(compare(results, json.load(f))))
+    print(f"Saved results to {output}")
+
+
+if __name__ == "__main__":
+    main()
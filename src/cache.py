@@ -0,0 +1,148 @@
+import dataclasses
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from models import BaseModel
+
+
+def cache_key(model: str, temperature: float, messages: List[Dict], repetition: int = 0, **options) -> str:
+    # Request options such as `structured` only enter the key when set, so
+    # keys of plain requests stay the same.
+    request = [model, temperature, messages, repetition] + ([options] if options else [])
+    payload = json.dumps(request, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed store of completions keyed by a content hash.
+
+    Entries are evicted least-recently-used first once the cache holds more
+    than `max_entries` rows or `max_bytes` of stored content.
+    """
+
+    def __init__(self,
+                 path: str = "data/cache/responses.sqlite",
+                 max_entries: Optional[int] = None,
+                 max_bytes: Optional[int] = None):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                content TEXT,
+                response TEXT,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT content, response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return {"content": row[0], "response": json.loads(row[1]) if row[1] else None}
+
+    def put(self, key: str, content: Optional[str], response: Optional[Dict] = None):
+        response_json = json.dumps(response, ensure_ascii=False) if response is not None else None
+        size = len(content or "") + len(response_json or "")
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, content, response, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, content, response_json, size, time.time()))
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        if self.max_entries is not None:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,))
+        if self.max_bytes is not None:
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for key, size in self._conn.execute(
+                    "SELECT key, size FROM responses ORDER BY last_access ASC").fetchall():
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def close(self):
+        self._conn.close()
+
+
+def response_dict(response) -> Optional[Dict]:
+    """A JSON-serializable form of a model's response, or None if it has none.
+
+    Client responses are pydantic models, `CascadeModel` returns a dataclass
+    and `ReplayModel` a plain dict.
+    """
+    if hasattr(response, "model_dump"):
+        return response.model_dump()
+    if dataclasses.is_dataclass(response) and not isinstance(response, type):
+        response = dataclasses.asdict(response)
+    try:
+        json.dumps(response)
+    except (TypeError, ValueError):
+        return None
+    return response
+
+
+class CachedModel(BaseModel):
+    """Serves completions from a `ResponseCache` and only calls `inner` on a miss.
+
+    On a hit the second element of the returned tuple is the stored response
+    as a plain dict rather than the client's response object.
+    """
+
+    def __init__(self, inner: BaseModel, cache: ResponseCache):
+        self.inner = inner
+        self.cache = cache
+        self.model = inner.model
+        self.temperature = inner.temperature
+
+    def complete(self, user_messages: List, repetition: int = 0, **kwargs):
+        key = cache_key(self.model, self.temperature, user_messages, repetition,
+                        **{name: value for name, value in kwargs.items() if value})
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached["content"], cached["response"]
+
+        content, response = self.inner.complete(user_messages, repetition=repetition, **kwargs)
+        if content is not None:
+            self.cache.put(key, content, response_dict(response))
+        return content, response
@@ -0,0 +1,178 @@
+import argparse
+from collections import Counter
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from data_loader import MAIN_EXPERIMENT_DATASET, POLITIFACT_DATASET, REPORT_COLUMN, SUMMARY_COLUMN, iter_records
+from evaluation import (CONSENSUS_COLUMN, EXPERIMENT_MODELS, N_LABELS, REPETITIONS, correctness, encode_label_sets,
+                        encode_labels, load_experiment)
+from metrics import MetricsRecorder, load_records, set_recorder, summarize
+from models import CascadeModel, get_model, settle_vote
+from text_processing import get_prompt_messages
+
+
+def vote(codes: np.ndarray, min_votes: int):
+    """Replays the vote of a `CascadeModel` stage over `codes.shape[1]` samples per row.
+
+    Samples are drawn in recorded order until `models.settle_vote` settles
+    the outcome. Returns the accepted verdict code (-1 if the claim is
+    escalated), the agreement over the full sample budget and the samples
+    drawn per row.
+    """
+    rows, samples = codes.shape
+    verdict = np.full(rows, -1)
+    agreement = np.zeros(rows)
+    drawn = np.full(rows, samples)
+    for row in range(rows):
+        votes = Counter()
+        for sample, code in enumerate(codes[row], start=1):
+            if code >= 0:
+                votes[code] += 1
+            settled, accepted = settle_vote(votes, sample, samples, min_votes)
+            if settled:
+                break
+        drawn[row] = sample
+        verdict[row] = accepted if accepted is not None else -1
+        agreement[row] = max(votes.values(), default=0) / samples
+    return verdict, agreement, drawn
+
+
+def simulate(data: Dict[str, np.ndarray], stages: Sequence[str], samples: int = 3,
+             min_votes: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """Replays a cascade over the recorded verdicts of `load_experiment`.
+
+    Every stage but the last votes over its first `samples` repetitions the
+    way `CascadeModel` does (see `vote`) and hands the claim on when no
+    verdict gets `min_votes` votes (default: a strict majority) and a strict
+    lead; the last stage answers with its first repetition. Returns the
+    final predictions, the index of the answering stage per claim and the
+    calls made to each stage.
+    """
+    min_votes = min_votes if min_votes is not None else samples // 2 + 1
+    rows = data["consensus"].shape[0]
+    predictions = np.full(rows, -1)
+    answered_by = np.full(rows, len(stages) - 1)
+    open_rows = np.ones(rows, dtype=bool)
+    calls = np.zeros(len(stages), dtype=int)
+    for index, stage in enumerate(stages[:-1]):
+        verdict, _, drawn = vote(data[stage][:, :samples], min_votes)
+        calls[index] = drawn[open_rows].sum()
+        accepted = open_rows & (verdict >= 0)
+        predictions[accepted] = verdict[accepted]
+        answered_by[accepted] = index
+        open_rows &= ~accepted
+    predictions[open_rows] = data[stages[-1]][open_rows, 0]
+    calls[-1] = open_rows.sum()
+    return {"predictions": predictions, "answered_by": answered_by, "calls": calls}
+
+
+def call_costs(records: Sequence) -> pd.DataFrame:
+    """Mean cost and latency per call for each model in `records` (metrics CallRecords)."""
+    if not records:
+        return pd.DataFrame(columns=["cost", "latency"])
+    summary = summarize(records, ["model"])
+    return pd.DataFrame({"cost": summary["cost"] / summary["calls"], "latency": summary["latency_mean"]})
+
+
+def _row(name: str, predictions: np.ndarray, gold: np.ndarray, calls: Dict[str, int],
+         costs: pd.DataFrame, escalated: float) -> Dict:
+    hits = correctness(predictions, gold)
+    rows = len(predictions)
+
+    def per_claim(column: str) -> Optional[float]:
+        known = [costs.at[model, column] * n for model, n in calls.items() if model in costs.index]
+        return sum(known) / rows if len(known) == len(calls) else None
+
+    return {
+        "configuration": name,
+        "exact_accuracy": hits["exact"].mean(),
+        "noun_accuracy": hits["noun"].mean(),
+        "adjective_accuracy": hits["adjective"].mean(),
+        "calls_per_claim": sum(calls.values()) / rows,
+        "escalated": escalated,
+        # Calls within a claim run one after another, so latencies add up.
+        "cost_per_claim": per_claim("cost"),
+        "latency_per_claim": per_claim("latency"),
+    }
+
+
+def tradeoff(data: Dict[str, np.ndarray], stages: Sequence[str], samples: int = 3,
+             min_votes: Optional[int] = None, costs: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """Compares each stage on its own (one call per claim) with the cascade."""
+    costs = costs if costs is not None else call_costs([])
+    gold = data["consensus"]
+    rows = gold.shape[0]
+    table = [_row(stage, data[stage][:, 0], gold, {stage: rows}, costs, 0.0) for stage in stages]
+    result = simulate(data, stages, samples, min_votes)
+    table.append(_row("cascade", result["predictions"], gold, dict(zip(stages, result["calls"])), costs,
+                      (result["answered_by"] > 0).mean()))
+    return pd.DataFrame(table).set_index("configuration")
+
+
+def run_live(stages: Sequence[str], experiment: str = MAIN_EXPERIMENT_DATASET, dataset: str = POLITIFACT_DATASET,
+             samples: int = 3, min_votes: Optional[int] = None, limit: Optional[int] = None,
+             max_concurrency: int = 8) -> Dict:
+    """Runs a live `CascadeModel` over the annotated claims of the main experiment.
+
+    Reports come from `dataset`, matched by url. Returns the accuracy row,
+    the escalation reasons and the per-call metrics records of the run.
+    """
+    reports = {row["url"]: row for row in iter_records(dataset, columns=["url", SUMMARY_COLUMN, REPORT_COLUMN])}
+    claims = [row for row in iter_records(experiment, "main_experiment", columns=["url", CONSENSUS_COLUMN])
+              if row[CONSENSUS_COLUMN] and row["url"] in reports][:limit]
+    batch = [get_prompt_messages(reports[row["url"]][REPORT_COLUMN] or "",
+                                 summary=reports[row["url"]][SUMMARY_COLUMN]) for row in claims]
+
+    recorder = MetricsRecorder()
+    set_recorder(recorder)
+    try:
+        model = CascadeModel([get_model(stage) for stage in stages], samples, min_votes)
+        traces = [trace for _, trace in model.complete_many(batch, max_concurrency=max_concurrency)]
+    finally:
+        set_recorder(None)
+
+    gold = encode_label_sets(row[CONSENSUS_COLUMN] for row in claims)
+    predictions = encode_labels(trace.verdict for trace in traces)
+    calls = Counter()
+    for trace in traces:
+        for step in trace.stages:
+            calls[step["model"]] += step["samples"]
+    reasons = Counter(step["reason"] for trace in traces for step in trace.stages if "reason" in step)
+    costs = call_costs(recorder.records)
+    escalated = np.mean([trace.model != stages[0] for trace in traces]) if traces else 0.0
+    return {"summary": _row("cascade (live)", predictions, gold, dict(calls), costs, escalated),
+            "reasons": dict(reasons),
+            "records": recorder.records}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate a cheap-first cascade against the annotator consensus.")
+    parser.add_argument("--stages", nargs="+", default=list(EXPERIMENT_MODELS),
+                        help="Models from cheapest to most expensive.")
+    parser.add_argument("--samples", type=int, default=3, help="Samples drawn from every stage but the last.")
+    parser.add_argument("--min-votes", type=int, default=None,
+                        help="Agreeing samples needed to accept a verdict (default: a strict majority of --samples).")
+    parser.add_argument("--dataset", default=MAIN_EXPERIMENT_DATASET)
+    parser.add_argument("--metrics", default=None,
+                        help="Runner metrics JSONL used to estimate cost and latency per call.")
+    parser.add_argument("--live", action="store_true",
+                        help="Call the models instead of replaying the recorded experiment verdicts.")
+    parser.add_argument("--reports", default=POLITIFACT_DATASET, help="Fact-check reports for --live.")
+    parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        if args.live:
+            result = run_live(args.stages, args.dataset, args.reports, args.samples, args.min_votes, args.limit)
+            print(pd.DataFrame([result["summary"]]).set_index("configuration").round(4))
+            print(f"Escalations: {result['reasons']}")
+        else:
+            data = load_experiment(args.dataset, args.stages, REPETITIONS)
+            costs = call_costs(list(load_records(args.metrics)) if args.metrics else [])
+            print(tradeoff(data, args.stages, args.samples, args.min_votes, costs).round(4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+import zipfile
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+from xml.etree.ElementTree import iterparse
+
+import pyarrow as pa
+
+POLITIFACT_DATASET = "data/politifact_climate_dataset.xlsx"
+MAIN_EXPERIMENT_DATASET = "data/misinsformation_pattern_detection_main_experiment.xlsx"
+MAIN_EXPERIMENT_SHEETS = ("main_experiment", "consistency_eval")
+# Columns of the PolitiFact export.
+CLAIM_COLUMN = "Claim"
+SUMMARY_COLUMN = "If your time is short"
+REPORT_COLUMN = "Long version of fact-check report"
+CACHE_DIR = "data/cache"
+# Rows per Arrow record batch when converting a sheet.
+BATCH_ROWS = 256
+
+_MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_PACKAGE_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+_COLUMN = re.compile(r"[A-Z]+")
+
+
+def iter_rows(path: str = POLITIFACT_DATASET, sheet: Optional[str] = None) -> Iterator[Dict[str, Optional[str]]]:
+    """Streams the data rows of `sheet` as {header: value} dicts.
+
+    The workbook is opened read-only so rows are produced one at a time
+    rather than loading the whole sheet up front. Blank header cells are
+    skipped.
+    """
+    # openpyxl is slow to import and most reads are served from the Arrow cache.
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet else workbook.worksheets[0]
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        for values in rows:
+            if all(value is None for value in values):
+                continue
+            yield {name: (str(value) if value is not None else None)
+                   for name, value in zip(header, values) if name}
+    finally:
+        workbook.close()
+
+
+class SharedStrings:
+    """The workbook's shared-string table, spilled to a temporary file.
+
+    Strings are decoded one <si> element at a time and appended to the file;
+    only an array of their offsets stays in memory, so memory use does not
+    grow with the length of the fact-check reports.
+    """
+
+    def __init__(self, archive: zipfile.ZipFile, name: Optional[str]):
+        self.file = tempfile.TemporaryFile()
+        self.offsets = array("q", [0])
+        if name is None:
+            return
+        with archive.open(name) as xml:
+            for _, element in iterparse(xml):
+                if element.tag == f"{_MAIN_NS}si":
+                    # Rich text keeps its runs in <r><t>; phonetic hints (<rPh>) are skipped.
+                    parts = [t.text or "" for t in element.iter(f"{_MAIN_NS}t")]
+                    hints = [t.text or "" for ph in element.iter(f"{_MAIN_NS}rPh") for t in ph.iter(f"{_MAIN_NS}t")]
+                    text = "".join(parts[:len(parts) - len(hints)] if hints else parts)
+                    self.offsets.append(self.offsets[-1] + self.file.write(text.encode("utf-8")))
+                    element.clear()
+
+    def __getitem__(self, index: int) -> str:
+        start, end = self.offsets[index], self.offsets[index + 1]
+        self.file.seek(start)
+        return self.file.read(end - start).decode("utf-8")
+
+    def close(self):
+        self.file.close()
+
+
+def _sheet_parts(archive: zipfile.ZipFile, sheet: Optional[str]):
+    """Returns the archive names of the worksheet XML and of the shared strings."""
+    relationships = {}
+    shared_strings = None
+    with archive.open("xl/_rels/workbook.xml.rels") as xml:
+        for _, element in iterparse(xml):
+            if element.tag == f"{_PACKAGE_REL_NS}Relationship":
+                target = element.get("Target")
+                target = target.lstrip("/") if target.startswith("/") else posixpath.join("xl", target)
+                relationships[element.get("Id")] = posixpath.normpath(target)
+                if element.get("Type", "").endswith("/sharedStrings"):
+                    shared_strings = relationships[element.get("Id")]
+    with archive.open("xl/workbook.xml") as xml:
+        sheets = [(element.get("name"), element.get(f"{_REL_NS}id"))
+                  for _, element in iterparse(xml) if element.tag == f"{_MAIN_NS}sheet"]
+    for name, relationship in sheets:
+        if sheet is None or name == sheet:
+            return relationships[relationship], shared_strings
+    raise KeyError(f"Worksheet {sheet} does not exist.")
+
+
+def _column_index(reference: str) -> int:
+    index = 0
+    for letter in _COLUMN.match(reference).group():
+        index = index * 26 + ord(letter) - 64
+    return index - 1
+
+
+def _number(text: str) -> str:
+    # Written the way str() prints the int or float openpyxl would return.
+    try:
+        return str(int(text))
+    except ValueError:
+        return str(float(text))
+
+
+def stream_rows(path: str = POLITIFACT_DATASET, sheet: Optional[str] = None) -> Iterator[Dict[str, Optional[str]]]:
+    """Like `iter_rows`, but decodes the sheet XML incrementally.
+
+    Each <row> is turned into a dict and then cleared from the parse tree,
+    and shared strings live in a temporary file (see `SharedStrings`), so
+    memory stays bounded however long the sheet and its cells are.
+    """
+    with zipfile.ZipFile(path) as archive:
+        sheet_name, strings_name = _sheet_parts(archive, sheet)
+        strings = SharedStrings(archive, strings_name)
+        try:
+            header = None
+            with archive.open(sheet_name) as xml:
+                parent = None
+                for event, element in iterparse(xml, events=("start", "end")):
+                    if event == "start":
+                        if element.tag == f"{_MAIN_NS}sheetData":
+                            parent = element
+                        continue
+                    if element.tag != f"{_MAIN_NS}row":
+                        continue
+                    values = {}
+                    for position, cell in enumerate(element.iter(f"{_MAIN_NS}c")):
+                        reference = cell.get("r")
+                        column = _column_index(reference) if reference else position
+                        cell_type = cell.get("t", "n")
+                        if cell_type == "inlineStr":
+                            value = "".join(t.text or "" for t in cell.iter(f"{_MAIN_NS}t"))
+                        else:
+                            raw = cell.findtext(f"{_MAIN_NS}v")
+                            if raw is None:
+                                continue
+                            if cell_type == "s":
+                                value = strings[int(raw)]
+                            elif cell_type == "b":
+                                value = str(raw == "1")
+                            elif cell_type == "n":
+                                value = _number(raw)
+                            else:
+                                value = raw
+                        values[column] = value
+                    element.clear()
+                    if parent is not None:
+                        parent.remove(element)
+                    if header is None:
+                        header = values
+                        continue
+                    if not values:
+                        continue
+                    yield {name: values.get(column) for column, name in sorted(header.items()) if name}
+        finally:
+            strings.close()
+
+
+def parallel_map_rows(function: Callable[[List[Dict]], List],
+                      rows: Iterable[Dict],
+                      workers: Optional[int] = None,
+                      chunk_size: int = 64) -> Iterator:
+    """Applies `function` to chunks of `rows` in a process pool, yielding results in order.
+
+    `function` must be a module-level function taking a list of rows and
+    returning one result per row. At most two chunks per worker are in
+    flight, so a streamed sheet is never held in memory at once.
+    """
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        limit = 2 * workers
+        pending = []
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                pending.append(executor.submit(function, chunk))
+                chunk = []
+                if len(pending) >= limit:
+                    yield from pending.pop(0).result()
+        if chunk:
+            pending.append(executor.submit(function, chunk))
+        for future in pending:
+            yield from future.result()
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_path(path: str, sheet: Optional[str] = None, cache_dir: str = CACHE_DIR) -> str:
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, f"{stem}.{sheet or 'default'}.arrow")
+
+
+def _read_cached(cached: str, path: str) -> Optional[pa.Table]:
+    """Returns the memory-mapped cache table if it still matches `path`."""
+    if not os.path.exists(cached):
+        return None
+    table = pa.ipc.open_file(pa.memory_map(cached, "r")).read_all()
+    metadata = table.schema.metadata or {}
+    stat = os.stat(path)
+    if (metadata.get(b"source_mtime") == str(stat.st_mtime_ns).encode()
+            and metadata.get(b"source_size") == str(stat.st_size).encode()):
+        return table
+    # The mtime changes on checkout or copy, so fall back to the content hash.
+    if metadata.get(b"source_sha256") == _file_sha256(path).encode():
+        return table
+    return None
+
+
+def convert_to_arrow(path: str, sheet: Optional[str] = None, cache_dir: str = CACHE_DIR) -> str:
+    """Converts one sheet of `path` into an Arrow IPC file and returns its path.
+
+    Rows are streamed with `stream_rows` and written in record batches of
+    BATCH_ROWS, so the sheet is never held in memory as a whole.
+    """
+    stat = os.stat(path)
+    metadata = {
+        "source_mtime": str(stat.st_mtime_ns),
+        "source_size": str(stat.st_size),
+        "source_sha256": _file_sha256(path),
+    }
+    cached = cache_path(path, sheet, cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = cached + ".tmp"
+    rows = stream_rows(path, sheet)
+    first = next(rows, None)
+    names = list(first) if first else []
+    schema = pa.schema([(name, pa.string()) for name in names], metadata=metadata)
+
+    def batch(chunk: List[Dict]) -> pa.RecordBatch:
+        return pa.record_batch([pa.array([row[name] for row in chunk], pa.string()) for name in names],
+                               schema=schema)
+
+    with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+        chunk = [first] if first else []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == BATCH_ROWS:
+                writer.write_batch(batch(chunk))
+                chunk = []
+        if chunk:
+            writer.write_batch(batch(chunk))
+    os.replace(tmp, cached)
+    return cached
+
+
+def load_table(path: str = POLITIFACT_DATASET,
+               sheet: Optional[str] = None,
+               columns: Optional[List[str]] = None,
+               cache_dir: str = CACHE_DIR) -> pa.Table:
+    """Loads a sheet as an Arrow table backed by a memory-mapped columnar cache.
+
+    The workbook is only parsed when the cache is missing or stale. The cache
+    file is memory-mapped, so columns that are not selected in `columns` are
+    never read from disk.
+    """
+    cached = cache_path(path, sheet, cache_dir)
+    table = _read_cached(cached, path)
+    if table is None:
+        table = _read_cached(convert_to_arrow(path, sheet, cache_dir), path)
+    if columns is not None:
+        table = table.select(columns)
+    return table
+
+
+def load_dataframe(path: str = POLITIFACT_DATASET,
+                   sheet: Optional[str] = None,
+                   columns: Optional[List[str]] = None,
+                   cache_dir: str = CACHE_DIR):
+    return load_table(path, sheet, columns, cache_dir).to_pandas()
+
+
+def iter_records(path: str = POLITIFACT_DATASET,
+                 sheet: Optional[str] = None,
+                 columns: Optional[List[str]] = None,
+                 cache_dir: str = CACHE_DIR) -> Iterator[Dict[str, Optional[str]]]:
+    """Like `iter_rows`, but reads from the columnar cache one batch at a time."""
+    for batch in load_table(path, sheet, columns, cache_dir).to_batches():
+        yield from batch.to_pylist()
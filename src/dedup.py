@@ -0,0 +1,246 @@
+import argparse
+import json
+import os
+import re
+import zlib
+from collections import defaultdict
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
+
+import numpy as np
+
+from data_loader import CLAIM_COLUMN, POLITIFACT_DATASET, SUMMARY_COLUMN, iter_records
+
+DEFAULT_INDEX = "data/cache/claim_index.npz"
+NUM_PERM = 128
+BANDS = 32
+# Claims whose estimated Jaccard similarity reaches this are duplicates.
+THRESHOLD = 0.5
+SHINGLE_SIZE = 3
+TEXT_COLUMNS = (CLAIM_COLUMN, SUMMARY_COLUMN)
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_WORD = re.compile(r"\w+")
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """32-bit hashes of the word `size`-grams of `text`, lower-cased."""
+    words = _WORD.findall(text.casefold())
+    grams = {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+    return np.fromiter((zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype=np.uint64, count=len(grams))
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i: int, j: int):
+        i, j = self.find(i), self.find(j)
+        # The earlier row stays the representative of the cluster.
+        if i != j:
+            self.parent[max(i, j)] = min(i, j)
+
+
+class ClaimIndex:
+    """MinHash signatures of claims with LSH banding for near-duplicate search.
+
+    Each entry is keyed by the fact-check url. Adding texts only hashes the
+    new keys, so the index can be updated in place when rows are added to
+    the sheet; `save` and `load` keep it in an .npz file.
+    """
+
+    def __init__(self, num_perm: int = NUM_PERM, bands: int = BANDS, threshold: float = THRESHOLD, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.threshold = threshold
+        self.seed = seed
+        generator = np.random.default_rng(seed)
+        # With a, b and the shingle hashes below 2**32, a * x + b cannot overflow 64 bits.
+        self._a = generator.integers(1, _MAX_HASH, num_perm, dtype=np.uint64)
+        self._b = generator.integers(0, _MAX_HASH, num_perm, dtype=np.uint64)
+        self.keys: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self.signatures = np.zeros((0, num_perm), dtype=np.uint32)
+        self.buckets: Dict[Tuple[int, bytes], List[int]] = defaultdict(list)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = shingles(text)
+        if not len(hashes):
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint32)
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME
+        return (permuted & _MAX_HASH).min(axis=0).astype(np.uint32)
+
+    def _index(self, position: int):
+        rows = self.num_perm // self.bands
+        signature = self.signatures[position]
+        for band in range(self.bands):
+            self.buckets[(band, signature[band * rows:(band + 1) * rows].tobytes())].append(position)
+
+    def add(self, items: Iterable[Tuple[str, str]]) -> int:
+        """Adds (key, text) pairs whose key is not indexed yet; returns how many were new."""
+        new_keys, new_signatures = {}, []
+        for key, text in items:
+            if key in self.positions or key in new_keys:
+                continue
+            new_keys[key] = None
+            new_signatures.append(self.signature(text))
+        if not new_keys:
+            return 0
+        start = len(self.keys)
+        new_keys = list(new_keys)
+        self.keys.extend(new_keys)
+        self.positions.update((key, start + i) for i, key in enumerate(new_keys))
+        self.signatures = np.vstack([self.signatures, np.array(new_signatures, dtype=np.uint32)])
+        for position in range(start, len(self.keys)):
+            self._index(position)
+        return len(new_keys)
+
+    def similarity(self, i: int, j: int) -> float:
+        """Estimated Jaccard similarity of two indexed entries."""
+        return float(np.mean(self.signatures[i] == self.signatures[j]))
+
+    def query(self, text: str) -> List[Tuple[str, float]]:
+        """Indexed keys similar to `text` with their estimated similarity, best first."""
+        signature = self.signature(text)
+        rows = self.num_perm // self.bands
+        candidates = {position for band in range(self.bands)
+                      for position in self.buckets.get((band, signature[band * rows:(band + 1) * rows].tobytes()), ())}
+        if not candidates:
+            return []
+        candidates = np.fromiter(candidates, dtype=np.int64)
+        scores = (self.signatures[candidates] == signature).mean(axis=1)
+        order = np.argsort(-scores, kind="stable")
+        return [(self.keys[candidates[i]], float(scores[i])) for i in order if scores[i] >= self.threshold]
+
+    def clusters(self) -> Dict[str, str]:
+        """Maps every key to the first-added key of its near-duplicate cluster."""
+        union_find = _UnionFind(len(self.keys))
+        for positions in self.buckets.values():
+            if len(positions) < 2:
+                continue
+            members = np.array(positions)
+            first = members[0]
+            scores = (self.signatures[members[1:]] == self.signatures[first]).mean(axis=1)
+            for position in members[1:][scores >= self.threshold]:
+                union_find.union(first, int(position))
+            # Members that do not match the first one may still match each other.
+            for position in members[1:][scores < self.threshold]:
+                matches = (self.signatures[members] == self.signatures[position]).mean(axis=1) >= self.threshold
+                for other in members[matches]:
+                    union_find.union(int(position), int(other))
+        return {key: self.keys[union_find.find(i)] for i, key in enumerate(self.keys)}
+
+    def save(self, path: str = DEFAULT_INDEX):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez_compressed(path, signatures=self.signatures, keys=np.array(self.keys, dtype=str),
+                            params=np.array([self.num_perm, self.bands, self.seed]),
+                            threshold=np.array(self.threshold))
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_INDEX) -> "ClaimIndex":
+        with np.load(path) as data:
+            num_perm, bands, seed = (int(value) for value in data["params"])
+            index = cls(num_perm, bands, float(data["threshold"]), seed)
+            index.keys = data["keys"].tolist()
+            index.signatures = data["signatures"]
+        index.positions = {key: i for i, key in enumerate(index.keys)}
+        for position in range(len(index.keys)):
+            index._index(position)
+        return index
+
+
+def claim_text(row: Dict, columns: Sequence[str] = TEXT_COLUMNS) -> str:
+    return " ".join(row.get(column) or "" for column in columns)
+
+
+def update_index(dataset: str = POLITIFACT_DATASET, path: str = DEFAULT_INDEX,
+                 columns: Sequence[str] = TEXT_COLUMNS) -> ClaimIndex:
+    """Loads the index at `path` (if any), adds rows of `dataset` it lacks and saves it.
+
+    Rows are hashed from the text of `columns`; an index should always be
+    updated with the same columns it was built from.
+    """
+    index = ClaimIndex.load(path) if os.path.exists(path) else ClaimIndex()
+    rows = iter_records(dataset, columns=["url", *columns])
+    if index.add((row["url"], claim_text(row, columns)) for row in rows if row["url"]):
+        index.save(path)
+    return index
+
+
+def duplicate_urls(index: ClaimIndex) -> Set[str]:
+    """Urls that are not the representative of their cluster and need not be classified."""
+    return {key for key, representative in index.clusters().items() if key != representative}
+
+
+def reuse_verdicts(index: ClaimIndex, checkpoint: str, dataset: str = POLITIFACT_DATASET) -> int:
+    """Copies each representative's results in `checkpoint` to the rest of its cluster.
+
+    Copies carry a "reused_from" field with the representative's url; rows
+    that already have their own result are left alone. Returns the number
+    of records appended.
+    """
+    members = defaultdict(list)
+    for key, representative in index.clusters().items():
+        if key != representative:
+            members[representative].append(key)
+    rows = {row["url"]: number for number, row in enumerate(iter_records(dataset, columns=["url"]), start=1)}
+
+    results, done = [], set()
+    with open(checkpoint, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if not record.get("error"):
+                results.append(record)
+                done.add((record["url"], record["model"], record["repetition"]))
+
+    written = 0
+    with open(checkpoint, "a", encoding="utf-8") as out:
+        for record in results:
+            for url in members.get(record["url"], ()):
+                key = (url, record["model"], record["repetition"])
+                if key in done or url not in rows:
+                    continue
+                copy = {**record, "row": rows[url], "url": url, "reused_from": record["url"]}
+                out.write(json.dumps(copy, ensure_ascii=False) + "\n")
+                done.add(key)
+                written += 1
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find near-duplicate claims in a fact-check dataset.")
+    parser.add_argument("--dataset", default=POLITIFACT_DATASET)
+    parser.add_argument("--index", default=DEFAULT_INDEX)
+    parser.add_argument("--columns", nargs="+", default=list(TEXT_COLUMNS),
+                        help="Columns whose text is compared, e.g. only Claim.")
+    parser.add_argument("--show", type=int, default=10, help="Print this many of the largest clusters.")
+    args = parser.parse_args()
+
+    index = update_index(args.dataset, args.index, args.columns)
+    clusters = defaultdict(list)
+    for key, representative in index.clusters().items():
+        clusters[representative].append(key)
+    duplicates = [members for members in clusters.values() if len(members) > 1]
+    print(f"{len(index)} claims, {len(duplicates)} clusters with near-duplicates, "
+          f"{sum(len(members) - 1 for members in duplicates)} rows that can be skipped")
+    for members in sorted(duplicates, key=len, reverse=True)[:args.show]:
+        print(f"  {len(members)}: " + ", ".join(members))
+
+
+if __name__ == "__main__":
+    main()
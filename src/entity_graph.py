@@ -0,0 +1,112 @@
+import json
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+B_OBJECT = "b-object"
+B_RELATIONSHIP = "b-relationship"
+B_ATTRIBUTE = "b-attribute"
+B_VALUE = "b-value"
+VERDICT = "verdict"
+NODE_TYPES = (B_OBJECT, B_RELATIONSHIP, B_ATTRIBUTE, B_VALUE, VERDICT)
+
+# Spellings used by the hand-written graph scripts and by model output.
+NODE_TYPE_ALIASES = {
+    "b-relation": B_RELATIONSHIP,
+    "verdict-or-note": VERDICT,
+    "note": VERDICT,
+}
+
+
+def normalize_node_type(node_type: str) -> str:
+    """Maps e.g. "B-Attribute", "b_object" or "Verdict-or-Note" to a NODE_TYPES entry."""
+    key = node_type.strip().lower().replace("_", "-").replace(" ", "-")
+    key = NODE_TYPE_ALIASES.get(key, key)
+    if key not in NODE_TYPES:
+        raise ValueError(f"Unknown node type: {node_type!r}")
+    return key
+
+
+@dataclass(frozen=True, slots=True)
+class Node:
+    id: str
+    type: str
+    label: str
+
+
+@dataclass(frozen=True, slots=True)
+class Edge:
+    source: str
+    target: str
+    label: str = ""
+
+
+@dataclass(slots=True)
+class EntityGraph:
+    """An argumentation graph of typed nodes and labelled edges.
+
+    The JSON form is {"id", "title", "nodes": [{"id", "type", "label"}],
+    "edges": [{"source", "target", "label"}]}, which is what models are
+    asked to emit and what `graph_rendering` draws.
+    """
+    nodes: List[Node] = field(default_factory=list)
+    edges: List[Edge] = field(default_factory=list)
+    title: str = ""
+    id: Optional[str] = None
+
+    def add_node(self, id: str, type: str, label: Optional[str] = None) -> Node:
+        node = Node(id, normalize_node_type(type), label if label is not None else id)
+        self.nodes.append(node)
+        return node
+
+    def add_edge(self, source: str, target: str, label: str = "") -> Edge:
+        edge = Edge(source, target, label)
+        self.edges.append(edge)
+        return edge
+
+    def node(self, id: str) -> Optional[Node]:
+        return next((node for node in self.nodes if node.id == id), None)
+
+    def nodes_of_type(self, node_type: str) -> List[Node]:
+        node_type = normalize_node_type(node_type)
+        return [node for node in self.nodes if node.type == node_type]
+
+    def to_dict(self) -> Dict:
+        data = {
+            "title": self.title,
+            "nodes": [{"id": n.id, "type": n.type, "label": n.label} for n in self.nodes],
+            "edges": [{"source": e.source, "target": e.target, "label": e.label} for e in self.edges],
+        }
+        if self.id is not None:
+            data = {"id": self.id, **data}
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "EntityGraph":
+        graph = cls(title=data.get("title", ""), id=data.get("id"))
+        for node in data.get("nodes", []):
+            graph.add_node(node["id"], node["type"], node.get("label"))
+        ids = {node.id for node in graph.nodes}
+        for edge in data.get("edges", []):
+            missing = {edge["source"], edge["target"]} - ids
+            if missing:
+                raise ValueError(f"Edge refers to unknown nodes: {sorted(missing)}")
+            graph.add_edge(edge["source"], edge["target"], edge.get("label", ""))
+        return graph
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False, **kwargs)
+
+    @classmethod
+    def from_json(cls, text: str) -> "EntityGraph":
+        return cls.from_dict(json.loads(text))
+
+    def to_networkx(self) -> "nx.DiGraph":
+        # networkx is only needed for drawing, so it is not imported with the module.
+        import networkx as nx
+
+        G = nx.DiGraph()
+        for node in self.nodes:
+            G.add_node(node.id, type=node.type, label=node.label)
+        for edge in self.edges:
+            G.add_edge(edge.source, edge.target, label=edge.label)
+        return G
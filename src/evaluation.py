@@ -0,0 +1,207 @@
+import argparse
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from data_loader import MAIN_EXPERIMENT_DATASET, load_dataframe
+from prompts import ADJECTIVES, NOUNS
+from text_processing import normalize_labels, parse_verdicts
+
+ANNOTATOR_A_COLUMN = "Misinfo pattern (An A)"
+ANNOTATOR_B_COLUMN = "Misinfo pattern (An B)"
+CONSENSUS_COLUMN = "clean annotators solution"
+EXPERIMENT_MODELS = ("deepseek/deepseek-r1-0528", "anthropic/claude-sonnet-4", "google/gemini-2.5-pro-preview")
+REPETITIONS = 5
+
+# Every verdict in the catalogue; a verdict's code is its index in this list.
+VERDICT_LABELS = [f"{adjective} {noun}" for adjective in ADJECTIVES for noun in NOUNS]
+N_LABELS = len(VERDICT_LABELS)
+
+
+def _codes(value: Optional[str]) -> List[int]:
+    return [VERDICT_LABELS.index(verdict.label) for verdict in parse_verdicts(normalize_labels(value))]
+
+
+def encode_labels(values: Iterable[Optional[str]]) -> np.ndarray:
+    """Encodes the first verdict of each cell as its code, or -1 if there is none."""
+    return np.array([next(iter(_codes(value)), -1) for value in values], dtype=np.int64)
+
+
+def encode_label_sets(values: Iterable[Optional[str]]) -> np.ndarray:
+    """Encodes every verdict of each cell as a (rows, N_LABELS) boolean mask.
+
+    Consensus cells can list several acceptable verdicts, e.g.
+    "MISLEADING ASSOCIATION, MISSING ATTRIBUTE".
+    """
+    values = list(values)
+    mask = np.zeros((len(values), N_LABELS), dtype=bool)
+    for row, value in enumerate(values):
+        mask[row, _codes(value)] = True
+    return mask
+
+
+def as_categorical(codes: np.ndarray):
+    """The codes as a pandas Categorical over VERDICT_LABELS."""
+    # pandas is slow to import; only tabular output needs it.
+    import pandas as pd
+
+    return pd.Categorical.from_codes(codes, categories=VERDICT_LABELS)
+
+
+def nouns_of(codes: np.ndarray) -> np.ndarray:
+    return np.where(codes >= 0, codes % len(NOUNS), -1)
+
+
+def adjectives_of(codes: np.ndarray) -> np.ndarray:
+    return np.where(codes >= 0, codes // len(NOUNS), -1)
+
+
+def correctness(predictions: np.ndarray, gold: np.ndarray) -> Dict[str, np.ndarray]:
+    """Returns exact, noun-only and adjective-only hits for every prediction.
+
+    `predictions` has shape (rows,) or (rows, repetitions) and `gold` is the
+    (rows, N_LABELS) mask from `encode_label_sets`. A prediction is correct
+    if it matches any of the row's gold verdicts.
+    """
+    rows = np.arange(gold.shape[0]).reshape((-1,) + (1,) * (predictions.ndim - 1))
+    valid = predictions >= 0
+    safe = np.where(valid, predictions, 0)
+    gold_nouns = gold.reshape(-1, len(ADJECTIVES), len(NOUNS)).any(axis=1)
+    gold_adjectives = gold.reshape(-1, len(ADJECTIVES), len(NOUNS)).any(axis=2)
+    return {
+        "exact": valid & gold[rows, safe],
+        "noun": valid & gold_nouns[rows, safe % len(NOUNS)],
+        "adjective": valid & gold_adjectives[rows, safe // len(NOUNS)],
+    }
+
+
+def cohen_kappa(a: np.ndarray, b: np.ndarray, n_categories: int = N_LABELS) -> float:
+    keep = (a >= 0) & (b >= 0)
+    a, b = a[keep], b[keep]
+    if not len(a):
+        return float("nan")
+    observed = np.mean(a == b)
+    expected = np.dot(np.bincount(a, minlength=n_categories), np.bincount(b, minlength=n_categories)) / len(a) ** 2
+    return float((observed - expected) / (1 - expected)) if expected < 1 else 1.0
+
+
+def category_counts(codes: np.ndarray, n_categories: int = N_LABELS) -> np.ndarray:
+    """Counts per row how many raters chose each category; -1 is ignored."""
+    one_hot = codes[..., None] == np.arange(n_categories)
+    return one_hot.sum(axis=1)
+
+
+def fleiss_kappa(codes: np.ndarray, n_categories: int = N_LABELS) -> float:
+    """Fleiss' kappa over (rows, raters) codes, using rows rated by every rater."""
+    codes = codes[(codes >= 0).all(axis=1)]
+    if len(codes) == 0:
+        return float("nan")
+    raters = codes.shape[1]
+    counts = category_counts(codes, n_categories)
+    per_row = (np.square(counts).sum(axis=1) - raters) / (raters * (raters - 1))
+    proportions = counts.sum(axis=0) / counts.sum()
+    expected = np.square(proportions).sum()
+    return float((per_row.mean() - expected) / (1 - expected)) if expected < 1 else 1.0
+
+
+def self_consistency(codes: np.ndarray) -> np.ndarray:
+    """Share of a row's repetitions that agree with its most common verdict."""
+    counts = category_counts(codes)
+    answered = (codes >= 0).sum(axis=1)
+    return np.divide(counts.max(axis=1), answered, out=np.zeros(len(codes)), where=answered > 0)
+
+
+def confusion_matrix(predictions: np.ndarray, gold: np.ndarray, n_categories: int = N_LABELS) -> np.ndarray:
+    """Counts (gold, predicted) pairs; rows where either is missing are dropped."""
+    keep = (predictions >= 0) & (gold >= 0)
+    flat = gold[keep] * n_categories + predictions[keep]
+    return np.bincount(flat, minlength=n_categories ** 2).reshape(n_categories, n_categories)
+
+
+def bootstrap_ci(hits: np.ndarray,
+                 n_boot: int = 10000,
+                 alpha: float = 0.05,
+                 seed: int = 42,
+                 batch_size: int = 1000) -> tuple:
+    """Percentile bootstrap interval for the mean of `hits`, resampling rows.
+
+    `hits` has shape (rows,) or (rows, repetitions); resamples are drawn as
+    index matrices in batches instead of one at a time.
+    """
+    hits = np.asarray(hits, dtype=float)
+    per_row = hits.mean(axis=1) if hits.ndim > 1 else hits
+    rng = np.random.default_rng(seed)
+    means = np.empty(n_boot)
+    for start in range(0, n_boot, batch_size):
+        size = min(batch_size, n_boot - start)
+        indices = rng.integers(0, len(per_row), size=(size, len(per_row)))
+        means[start:start + size] = per_row[indices].mean(axis=1)
+    return tuple(np.quantile(means, [alpha / 2, 1 - alpha / 2]))
+
+
+def load_experiment(path: str = MAIN_EXPERIMENT_DATASET,
+                    models: Iterable[str] = EXPERIMENT_MODELS,
+                    repetitions: int = REPETITIONS) -> Dict[str, np.ndarray]:
+    """Loads the annotations and model verdicts of the main experiment.
+
+    Only rows with a consensus verdict are kept. Model verdicts are returned
+    as (rows, repetitions) code arrays keyed by model name.
+    """
+    columns = [ANNOTATOR_A_COLUMN, ANNOTATOR_B_COLUMN, CONSENSUS_COLUMN]
+    model_columns = {model: [f"{model}/{repetition}" for repetition in range(repetitions)] for model in models}
+    frame = load_dataframe(path, "main_experiment",
+                           columns=columns + [c for cs in model_columns.values() for c in cs])
+    frame = frame[frame[CONSENSUS_COLUMN].notna()]
+
+    data = {
+        "consensus": encode_label_sets(frame[CONSENSUS_COLUMN]),
+        "annotator_a": encode_labels(frame[ANNOTATOR_A_COLUMN]),
+        "annotator_b": encode_labels(frame[ANNOTATOR_B_COLUMN]),
+    }
+    for model, model_cols in model_columns.items():
+        data[model] = np.stack([encode_labels(frame[column]) for column in model_cols], axis=1)
+    return data
+
+
+def score(data: Dict[str, np.ndarray],
+          models: Iterable[str] = EXPERIMENT_MODELS,
+          n_boot: int = 10000):
+    """Summarises accuracy, agreement and consistency for every model as a DataFrame."""
+    import pandas as pd
+
+    gold = data["consensus"]
+    summary = []
+    for model in models:
+        codes = data[model]
+        hits = correctness(codes, gold)
+        low, high = bootstrap_ci(hits["exact"], n_boot=n_boot)
+        summary.append({
+            "model": model,
+            "exact_accuracy": hits["exact"].mean(),
+            "exact_ci_low": low,
+            "exact_ci_high": high,
+            "noun_accuracy": hits["noun"].mean(),
+            "adjective_accuracy": hits["adjective"].mean(),
+            "fleiss_kappa": fleiss_kappa(codes),
+            "self_consistency": self_consistency(codes).mean(),
+            "unparsed": (codes < 0).mean(),
+        })
+    return pd.DataFrame(summary).set_index("model")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Score model verdicts against the annotator consensus.")
+    parser.add_argument("--dataset", default=MAIN_EXPERIMENT_DATASET)
+    parser.add_argument("--bootstraps", type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    import pandas as pd
+
+    data = load_experiment(args.dataset)
+    print(f"Annotator agreement (Cohen's kappa): {cohen_kappa(data['annotator_a'], data['annotator_b']):.3f}")
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(score(data, n_boot=args.bootstraps).round(3))
+
+
+if __name__ == "__main__":
+    main()
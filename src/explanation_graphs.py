@@ -0,0 +1,263 @@
+import argparse
+import os
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from data_loader import MAIN_EXPERIMENT_DATASET, iter_records, load_table
+from entity_graph import B_ATTRIBUTE, B_OBJECT, B_RELATIONSHIP, B_VALUE, VERDICT, EntityGraph
+from text_processing import parse_analysis, parse_verdict
+
+DEFAULT_OUTPUT = "data/output/explanation_graphs.jsonl"
+EXPLANATION_SUFFIX = "/explanation"
+
+# Longest label kept for relationships written as free-text sentences.
+MAX_LABEL_LENGTH = 40
+
+_MARKDOWN = re.compile(r"[*`_#]+")
+_BULLET = re.compile(r"^\s*(?:[-•]|\d+[.)])\s*")
+_PARENTHETICAL = re.compile(r"\s*\([^)]*\)\s*$")
+_NON_WORD = re.compile(r"[^\w\s$%.-]+")
+_ENTITIES_HEADER = re.compile(r"^(?:b-entities|key entities|entities)\s*:?\s*$", re.IGNORECASE)
+_RELATIONSHIP_HEADER = re.compile(r"^b-relationship\s*(\d*)\s*(?:\([^)]*\))?\s*:?\s*(.*)$", re.IGNORECASE)
+_RELATIONSHIPS_HEADER = re.compile(r"^(?:b-relationships|relationships)\s*:?\s*$", re.IGNORECASE)
+_ATTRIBUTES_HEADER = re.compile(r"^b-attributes?\s*:?\s*$", re.IGNORECASE)
+_ATTRIBUTE_VALUE = re.compile(r"^(.+?)\s*->\s*b-value\s*:\s*(.+)$", re.IGNORECASE)
+_FIELD = re.compile(r"^(subject|object|on what|when|where|agent|target)\s*:\s*(.+)$", re.IGNORECASE)
+_RELATIONSHIP_NAME = re.compile(r"^(?:relationship|nature)\s*:\s*(.+)$", re.IGNORECASE)
+_VERDICT_LINE = re.compile(r"verdict", re.IGNORECASE)
+_OTHER_HEADER = re.compile(r"^[A-Za-z][\w\s'-]{0,40}:\s*$")
+
+
+def normalize_label(label: str) -> str:
+    """Key used to recognise the same entity across explanations."""
+    label = _NON_WORD.sub(" ", label.casefold())
+    label = re.sub(r"^(?:the|a|an)\s+", "", label.strip())
+    return re.sub(r"\s+", " ", label).strip(" .")
+
+
+def _clean(line: str) -> str:
+    return _BULLET.sub("", _MARKDOWN.sub("", line)).strip()
+
+
+class _GraphBuilder:
+    """Adds nodes to an EntityGraph, merging nodes with the same normalized label."""
+
+    def __init__(self, graph: EntityGraph):
+        self.graph = graph
+        self.ids = {node.id for node in graph.nodes}
+        self.edges = {(edge.source, edge.target, edge.label) for edge in graph.edges}
+
+    def node(self, node_type: str, label: str) -> Optional[str]:
+        key = normalize_label(label)
+        if not key:
+            return None
+        node_id = f"{node_type}:{key}"
+        if node_id not in self.ids:
+            self.graph.add_node(node_id, node_type, label.strip())
+            self.ids.add(node_id)
+        return node_id
+
+    def edge(self, source: Optional[str], target: Optional[str], label: str = ""):
+        if source and target and (source, target, label) not in self.edges:
+            self.graph.add_edge(source, target, label)
+            self.edges.add((source, target, label))
+
+
+def parse_explanation(text: str, graph: Optional[EntityGraph] = None) -> EntityGraph:
+    """Parses one free-text model explanation into an entity graph.
+
+    Understands the layout taught by the worked example in
+    `prompts.template`: a "B-Entities:" list, "B-Relationship N: name"
+    blocks with Subject/On what/When fields and "B-Attributes:" lines of the
+    form "Trend -> B-Value: Increasing", and a line holding the verdict.
+    Passing an existing `graph` merges the result into it, which is how
+    repetitions of the same claim are deduplicated. Structured-output
+    answers are read with `analysis_to_graph` instead.
+    """
+    analysis = parse_analysis(text)
+    if analysis is not None:
+        return analysis_to_graph(analysis, graph)
+    graph = graph if graph is not None else EntityGraph()
+    builder = _GraphBuilder(graph)
+    section = None
+    relationships = []
+    verdict_line = None
+    # Lines of the current "B-Relationship" block; the node is created when
+    # the block ends, because its name may come after its fields. Lines that
+    # are not fields, attributes or a name are ignored.
+    block_name = None
+    block_lines = []
+
+    def close_block():
+        nonlocal block_name, block_lines
+        if block_name is None or not (block_name or block_lines):
+            block_name, block_lines = None, []
+            return
+        names = [m.group(1) for m in map(_RELATIONSHIP_NAME.match, block_lines) if m]
+        relationship = builder.node(B_RELATIONSHIP, block_name or (names[0] if names else
+                                                                   f"Relationship {len(relationships) + 1}"))
+        relationships.append(relationship)
+        for line in block_lines:
+            attribute_value = _ATTRIBUTE_VALUE.match(line)
+            field = _FIELD.match(line)
+            if attribute_value:
+                attribute = builder.node(B_ATTRIBUTE, attribute_value.group(1))
+                builder.edge(relationship, attribute)
+                builder.edge(attribute, builder.node(B_VALUE, _PARENTHETICAL.sub("", attribute_value.group(2))))
+            elif field:
+                builder.edge(relationship, builder.node(B_OBJECT, _PARENTHETICAL.sub("", field.group(2))),
+                             field.group(1).lower())
+        block_name, block_lines = None, []
+
+    for raw_line in (text or "").splitlines():
+        line = _clean(raw_line)
+        if not line:
+            continue
+
+        header = _RELATIONSHIP_HEADER.match(line)
+        if header:
+            close_block()
+            section, block_name = "relationship", header.group(2)
+            continue
+        if _ATTRIBUTES_HEADER.match(line):
+            continue
+        is_verdict = bool(_VERDICT_LINE.search(line) and parse_verdict(line))
+        starts_section = (is_verdict or _ENTITIES_HEADER.match(line) or _RELATIONSHIPS_HEADER.match(line)
+                          or _OTHER_HEADER.match(line))
+        if section == "relationship" and not starts_section:
+            block_lines.append(line)
+            continue
+
+        close_block()
+        if _ENTITIES_HEADER.match(line):
+            section = "entities"
+        elif _RELATIONSHIPS_HEADER.match(line):
+            section = "relationships"
+        elif is_verdict:
+            verdict_line = line
+            section = None
+        elif _OTHER_HEADER.match(line):
+            section = None
+        elif section == "entities":
+            builder.node(B_OBJECT, _PARENTHETICAL.sub("", line))
+        elif section == "relationships":
+            label = line if len(line) <= MAX_LABEL_LENGTH else line[:MAX_LABEL_LENGTH].rsplit(" ", 1)[0] + "..."
+            relationships.append(builder.node(B_RELATIONSHIP, label))
+    close_block()
+
+    if verdict_line is not None:
+        verdict = parse_verdict(verdict_line)
+        verdict_id = builder.node(VERDICT, verdict.label)
+        targets = _verdict_targets(graph, verdict_line, relationships)
+        for target in targets:
+            builder.edge(verdict_id, target, "refutes")
+    return graph
+
+
+def analysis_to_graph(analysis: Dict, graph: Optional[EntityGraph] = None) -> EntityGraph:
+    """Builds the entity graph of a structured analysis (`prompts.ANALYSIS_SCHEMA`).
+
+    Nodes are merged like in `parse_explanation`; the verdict refutes the
+    relationships it names, or the first relationship if it names none
+    that exist.
+    """
+    graph = graph if graph is not None else EntityGraph()
+    builder = _GraphBuilder(graph)
+    for entity in analysis["entities"]:
+        builder.node(B_OBJECT, entity)
+    relationships = {}
+    for item in analysis["relationships"]:
+        relationship = builder.node(B_RELATIONSHIP, item["name"])
+        relationships[normalize_label(item["name"])] = relationship
+        for field in ("subject", "object", "on_what", "when"):
+            if item[field]:
+                builder.edge(relationship, builder.node(B_OBJECT, item[field]), field.replace("_", " "))
+        for attribute_value in item["attributes"]:
+            attribute = builder.node(B_ATTRIBUTE, attribute_value["attribute"])
+            builder.edge(relationship, attribute)
+            builder.edge(attribute, builder.node(B_VALUE, attribute_value["value"]))
+
+    verdict = analysis["verdict"]
+    verdict_id = builder.node(VERDICT, f"{verdict['adjective']} {verdict['noun']}")
+    targets = [relationships[key] for key in map(normalize_label, verdict["relationships"]) if key in relationships]
+    for target in targets or list(relationships.values())[:1]:
+        builder.edge(verdict_id, target, "refutes")
+    return graph
+
+
+def _verdict_targets(graph: EntityGraph, verdict_line: str, relationships: List[str]) -> List[str]:
+    """Relationships named after "connecting" in the verdict line, else the first one."""
+    relationships = [r for r in dict.fromkeys(relationships) if r]
+    _, _, connecting = verdict_line.partition("connecting")
+    connecting = normalize_label(connecting)
+    named = [r for r in relationships if connecting and normalize_label(graph.node(r).label) in connecting]
+    return named or relationships[:1]
+
+
+def explanation_columns(path: str = MAIN_EXPERIMENT_DATASET) -> Dict[str, List[str]]:
+    """Groups the "<model>/<repetition>/explanation" columns by model."""
+    columns = defaultdict(list)
+    for name in load_table(path, "main_experiment").column_names:
+        if name.endswith(EXPLANATION_SUFFIX):
+            columns[name[:-len(EXPLANATION_SUFFIX)].rsplit("/", 1)[0]].append(name)
+    return dict(columns)
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^\w-]+", "_", text).strip("_")
+
+
+def iter_explanation_graphs(path: str = MAIN_EXPERIMENT_DATASET,
+                            models: Optional[Iterable[str]] = None) -> Iterator[EntityGraph]:
+    """Streams one graph per (row, model), merging the model's repetitions."""
+    columns = explanation_columns(path)
+    if models is not None:
+        columns = {model: columns[model] for model in models}
+    wanted = ["ID", "Claim"] + [c for cs in columns.values() for c in cs]
+    for row in iter_records(path, "main_experiment", columns=wanted):
+        if not row["ID"]:
+            continue
+        for model, model_columns in columns.items():
+            graph = EntityGraph(id=f"{row['ID']}-{_slug(model)}", title=f"{model}: {(row['Claim'] or '')[:80]}")
+            for column in model_columns:
+                if row[column]:
+                    parse_explanation(row[column], graph)
+            if graph.nodes:
+                yield graph
+
+
+def write_graphs(graphs: Iterable[EntityGraph], output: str = DEFAULT_OUTPUT) -> int:
+    """Writes graphs to a JSONL file (replacing it) as they are produced and returns the count."""
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    written = 0
+    with open(output, "w", encoding="utf-8") as out:
+        for graph in graphs:
+            out.write(graph.to_json() + "\n")
+            out.flush()
+            written += 1
+    return written
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Turn model explanations into entity graphs.")
+    parser.add_argument("--dataset", default=MAIN_EXPERIMENT_DATASET)
+    parser.add_argument("--models", nargs="+", default=None)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--render-dir", default=None, help="Also render every graph into this directory.")
+    parser.add_argument("--format", choices=["png", "svg"], default="png")
+    args = parser.parse_args(argv)
+
+    written = write_graphs(iter_explanation_graphs(args.dataset, args.models), args.output)
+    print(f"Wrote {written} graphs to {args.output}")
+    if args.render_dir:
+        from graph_rendering import load_graphs, render_many
+        jobs = [(graph, os.path.join(args.render_dir, f"{graph.id}.{args.format}"))
+                for graph in load_graphs(args.output)]
+        render_many(jobs)
+        print(f"Rendered {len(jobs)} graphs to {args.render_dir}")
+
+
+if __name__ == "__main__":
+    main()
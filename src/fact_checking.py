@@ -0,0 +1,443 @@
+import argparse
+import importlib
+import json
+import os
+import sys
+import threading
+from collections import deque
+from functools import partial
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from cache import CachedModel, ResponseCache
+from data_loader import (CLAIM_COLUMN, POLITIFACT_DATASET, REPORT_COLUMN, SUMMARY_COLUMN, iter_records,
+                         parallel_map_rows, stream_rows)
+from dedup import duplicate_urls, reuse_verdicts, update_index
+from metrics import MetricsRecorder, call_tags, report_slice, set_recorder
+from models import BaseModel, get_model
+from retrieval import DEFAULT_INDEX_DIR, ExampleIndex, load_or_build, query_text
+from resilience import CircuitBreaker, CompletionFailedError, ResilientModel, RetryBudget
+from text_processing import count_tokens, get_prompt_messages, parse_analysis, parse_verdict
+
+DEFAULT_CHECKPOINT = "data/output/results.jsonl"
+# Subcommands handled by another module's main(); the module is only
+# imported when its command runs, so e.g. scoring never loads matplotlib.
+COMMANDS = {
+    "score": ("evaluation", "Score model verdicts against the annotator consensus."),
+    "render": ("graph_rendering", "Render argumentation graphs."),
+    "benchmark": ("benchmark", "Benchmark the classification pipeline."),
+}
+
+TaskKey = Tuple[int, str, int]
+
+
+def load_completed(checkpoint: str) -> Set[TaskKey]:
+    """Returns the (row, model, repetition) triples already in `checkpoint`.
+
+    Failed calls are recorded with an "error" field and are not counted, so
+    a restarted run tries them again.
+    """
+    completed = set()
+    if not os.path.exists(checkpoint):
+        return completed
+    with open(checkpoint, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash mid-write can leave a truncated last line.
+                continue
+            if record.get("error"):
+                continue
+            completed.add((record["row"], record["model"], record["repetition"]))
+    return completed
+
+
+def iter_tasks(dataset: str, model_names: List[str], repetitions: int,
+               completed: Set[TaskKey], limit: int = None,
+               skip_urls: Set[str] = None) -> Iterator[Tuple[TaskKey, Dict]]:
+    for row_number, row in enumerate(iter_records(dataset, columns=["url", CLAIM_COLUMN, SUMMARY_COLUMN, REPORT_COLUMN]), start=1):
+        if limit is not None and row_number > limit:
+            break
+        if skip_urls and row.get("url") in skip_urls:
+            continue
+        for model_name in model_names:
+            for repetition in range(repetitions):
+                key = (row_number, model_name, repetition)
+                if key not in completed:
+                    yield key, row
+
+
+def prepare_prompts(rows: List[Dict], max_report_tokens: int = None, structured: bool = False,
+                    cache_control: bool = False) -> List[Tuple[List[Dict], int]]:
+    """Builds the messages for each row and counts its report's tokens."""
+    return [(get_prompt_messages(row.get(REPORT_COLUMN) or "", max_report_tokens=max_report_tokens,
+                                 summary=row.get(SUMMARY_COLUMN), cache_control=cache_control,
+                                 structured=structured),
+             count_tokens(row.get(REPORT_COLUMN) or ""))
+            for row in rows]
+
+
+def iter_prompts(dataset: str = POLITIFACT_DATASET, workers: int = None, max_report_tokens: int = None,
+                 chunk_size: int = 64, structured: bool = False,
+                 cache_control: bool = False) -> Iterator[Tuple[Dict, List[Dict], int]]:
+    """Yields (row, messages, report tokens) for every row of `dataset`.
+
+    The workbook is decoded incrementally by `stream_rows` and prompts are
+    built in a process pool, so preprocessing scales with the number of
+    cores and memory stays bounded for large exports.
+    """
+    pending = deque()
+
+    def remember(rows):
+        # The pool returns results in order, so rows are paired back up in order.
+        for row in rows:
+            pending.append(row)
+            yield row
+
+    prepared = parallel_map_rows(partial(prepare_prompts, max_report_tokens=max_report_tokens,
+                                         structured=structured, cache_control=cache_control),
+                                 remember(stream_rows(dataset)), workers, chunk_size)
+    for messages, tokens in prepared:
+        yield pending.popleft(), messages, tokens
+
+
+def iter_prompt_tasks(dataset: str, model_names: List[str], repetitions: int,
+                      completed: Set[TaskKey], limit: int = None, skip_urls: Set[str] = None,
+                      workers: int = None, **prompt_options) -> Iterator[Tuple[TaskKey, Dict, List[Dict], int]]:
+    """Like `iter_tasks`, but with each row's messages and report tokens built by `iter_prompts`."""
+    prompts = iter_prompts(dataset, workers, **prompt_options)
+    for row_number, (row, messages, tokens) in enumerate(prompts, start=1):
+        if limit is not None and row_number > limit:
+            break
+        if skip_urls and row.get("url") in skip_urls:
+            continue
+        for model_name in model_names:
+            for repetition in range(repetitions):
+                key = (row_number, model_name, repetition)
+                if key not in completed:
+                    yield key, row, messages, tokens
+
+
+def classify(model: BaseModel, row: Dict, repetition: int,
+             max_report_tokens: int = None,
+             vote_samples: Tuple[int, int, float] = None,
+             examples: List[Dict] = None,
+             structured: bool = False,
+             cache_control: bool = False,
+             messages: List[Dict] = None,
+             report_tokens: int = None) -> List[Tuple[int, str, object]]:
+    """Returns (repetition, content, response) for each call made for `row`.
+
+    Without `vote_samples` this is the single call for `repetition`. With
+    `vote_samples` = (min_samples, max_samples, threshold) the model is
+    sampled adaptively by `BaseModel.complete_voting` and every sample is
+    returned.
+    `examples` are few-shot examples to put in the prompt. `structured`
+    requests the JSON analysis of the structured-output mode, and
+    `cache_control` marks the system prompt for Anthropic prompt caching.
+    `messages` and `report_tokens` prepared by `iter_prompts` are used as
+    they are instead of being built here.
+    """
+    # Only set when asked for, so models without the option are unaffected.
+    options = {"structured": True} if structured else {}
+    report = row.get(REPORT_COLUMN) or ""
+    if messages is None:
+        messages = get_prompt_messages(report,
+                                       max_report_tokens=max_report_tokens,
+                                       summary=row.get(SUMMARY_COLUMN),
+                                       cache_control=cache_control,
+                                       examples=examples,
+                                       structured=structured)
+    if report_tokens is None:
+        report_tokens = count_tokens(report)
+    # Calls are tagged with the report's length bucket for the metrics summary.
+    with call_tags(url=row.get("url"), slice=report_slice(report_tokens)):
+        if vote_samples is None:
+            return [(repetition, *model.complete(messages, repetition=repetition, **options))]
+        min_samples, max_samples, threshold = vote_samples
+        vote = model.complete_voting(messages, min_samples=min_samples, max_samples=max_samples,
+                                     threshold=threshold, **options)
+    return [(index, content, response) for index, (content, response) in enumerate(vote.responses)]
+
+
+def response_id(response) -> Optional[str]:
+    """The id of an API response, or of its dict form as served from the cache."""
+    if isinstance(response, dict):
+        return response.get("id")
+    return getattr(response, "id", None)
+
+
+def result_record(row_number: int, url: str, model_name: str, repetition: int, content: str,
+                  response_id: str = None, error: Dict = None) -> Dict:
+    """The checkpoint line for one call, with the verdict parsed from `content`.
+
+    Content holding a valid structured analysis also gets it as "analysis".
+    """
+    verdict = parse_verdict(content)
+    analysis = parse_analysis(content)
+    result = {
+        "row": row_number,
+        "url": url,
+        "model": model_name,
+        "repetition": repetition,
+        "verdict": verdict.label if verdict else None,
+        "verdict_confidence": verdict.confidence if verdict else None,
+        "content": content,
+        "response_id": response_id,
+    }
+    if analysis is not None:
+        result["analysis"] = analysis
+    if error is not None:
+        result["error"] = error
+    return result
+
+
+def run_experiment(model_names: List[str],
+                   dataset: str = POLITIFACT_DATASET,
+                   repetitions: int = 5,
+                   checkpoint: str = DEFAULT_CHECKPOINT,
+                   max_concurrency: int = 8,
+                   limit: int = None,
+                   cache: ResponseCache = None,
+                   max_report_tokens: int = None,
+                   min_samples: int = None,
+                   max_attempts: int = 5,
+                   retry_budget: int = None,
+                   hedge: bool = False,
+                   skip_urls: Set[str] = None,
+                   example_index: ExampleIndex = None,
+                   examples_k: int = 3,
+                   structured: bool = False,
+                   requests_per_minute: Dict[str, float] = None,
+                   cache_control: bool = False,
+                   prompt_workers: int = None,
+                   vote_threshold: float = 1.0) -> int:
+    """Classifies every row of `dataset` with every model `repetitions` times.
+
+    Each finished call is appended to `checkpoint` as one JSON line, and
+    calls already present there are skipped, so an interrupted run can be
+    restarted with the same arguments. If `cache` is given, completions are
+    served from it where possible. Reports longer than `max_report_tokens`
+    are shortened by `get_prompt_messages`. With `min_samples`, each model
+    is sampled adaptively, up to `repetitions` samples per claim: once at
+    least `min_samples` have been drawn and the leading verdict holds
+    `vote_threshold` of them, no further repetitions are drawn.
+
+    Calls are retried with backoff up to `max_attempts` times each and
+    `retry_budget` times in total; `hedge` sends a duplicate request for
+    calls slower than the model's p95 latency. Calls that still fail are
+    written with an "error" record instead of a verdict. Rows whose url is
+    in `skip_urls` (e.g. `dedup.duplicate_urls`) are not classified. With
+    an `example_index`, the `examples_k` most similar annotated claims
+    (never the claim itself) are added to every prompt. `structured` asks
+    for JSON-schema-constrained analyses (see `text_processing.parse_analysis`).
+    `requests_per_minute` caps the request rate of the models it names.
+    `cache_control` adds the prompt-cache breakpoint Anthropic models need.
+    With `prompt_workers`, the sheet is streamed and prompts are built in
+    that many processes (`iter_prompts`); few-shot prompts depend on the
+    example index and are always built per call. Returns the number of new
+    results.
+    """
+    if os.path.dirname(checkpoint):
+        os.makedirs(os.path.dirname(checkpoint), exist_ok=True)
+    completed = load_completed(checkpoint)
+    budget = RetryBudget(retry_budget)
+    rates = requests_per_minute or {}
+    models = {name: ResilientModel(get_model(name, **({"requests_per_minute": rates[name]} if name in rates else {})),
+                                   max_attempts=max_attempts, budget=budget, breaker=CircuitBreaker(), hedge=hedge)
+              for name in model_names}
+    if cache is not None:
+        models = {name: CachedModel(model, cache) for name, model in models.items()}
+    write_lock = threading.Lock()
+    written = 0
+
+    with open(checkpoint, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+
+        def record(key: TaskKey, row: Dict, future):
+            try:
+                samples = future.result()
+            except CompletionFailedError as failure:
+                write(key[0], key[1], key[2], row, None, None, failure.error.to_dict())
+                return
+            for repetition, content, response in samples:
+                write(key[0], key[1], repetition, row, content, response)
+
+        def write(row_number: int, model_name: str, repetition: int, row: Dict, content: str, response,
+                  error: Dict = None):
+            nonlocal written
+            result = result_record(row_number, row.get("url"), model_name, repetition, content,
+                                   response_id(response), error)
+            with write_lock:
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                written += 1
+
+        # In voting mode a (row, model) pair is one task, tracked by repetition 0.
+        vote_samples = (min_samples, repetitions, vote_threshold) if min_samples else None
+        task_repetitions = 1 if vote_samples else repetitions
+
+        if prompt_workers and example_index is None:
+            tasks = iter_prompt_tasks(dataset, model_names, task_repetitions, completed, limit, skip_urls,
+                                      prompt_workers, max_report_tokens=max_report_tokens,
+                                      structured=structured, cache_control=cache_control)
+        else:
+            tasks = ((key, row, None, None)
+                     for key, row in iter_tasks(dataset, model_names, task_repetitions, completed, limit, skip_urls))
+
+        pending = {}
+        for key, row, messages, report_tokens in tasks:
+            # Keep only a bounded number of rows in memory while streaming.
+            if len(pending) >= 2 * max_concurrency:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record(*pending.pop(future), future)
+            examples = example_index.top_k(query_text(row), examples_k, row.get("url")) if example_index else None
+            future = executor.submit(classify, models[key[1]], row, key[2], max_report_tokens, vote_samples,
+                                     examples, structured, cache_control, messages, report_tokens)
+            pending[future] = (key, row)
+        for future in list(pending):
+            record(*pending.pop(future), future)
+
+    return written
+
+
+def reparse_checkpoint(checkpoint: str, output: str) -> int:
+    """Rewrites the parsed fields of every record in `checkpoint` from its content.
+
+    Lets results gathered with an older parser be re-scored without any model
+    calls. Returns the number of records written to `output`.
+    """
+    written = 0
+    with open(checkpoint, encoding="utf-8") as f, open(output, "w", encoding="utf-8") as out:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if not record.get("error"):
+                parsed = result_record(record["row"], record["url"], record["model"], record["repetition"],
+                                       record.get("content"), record.get("response_id"))
+                record.pop("analysis", None)
+                record.update(parsed)
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            written += 1
+    return written
+
+
+def parse_rates(values: Optional[List[str]], model_names: List[str]) -> Dict[str, float]:
+    """Reads "MODEL=RPM" items, plus a bare "RPM" that applies to every other model."""
+    rates, default = {}, None
+    for value in values or []:
+        name, separator, rate = value.rpartition("=")
+        if separator:
+            rates[name] = float(rate)
+        else:
+            default = float(rate)
+    if default is not None:
+        rates = {**{name: default for name in model_names}, **rates}
+    return rates
+
+
+def _add_classify_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--models", nargs="+", required=True,
+                        help='Model strings for models.get_model, e.g. "deepseek/deepseek-r1-0528" or "replay:run.jsonl".')
+    parser.add_argument("--dataset", default=POLITIFACT_DATASET)
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=None, help="Only process the first N rows.")
+    parser.add_argument("--cache", default=None, help="Path of an SQLite response cache to use.")
+    parser.add_argument("--max-report-tokens", type=int, default=None,
+                        help="Shorten fact-check reports to this many tokens.")
+    parser.add_argument("--min-samples", type=int, default=None,
+                        help="Sample adaptively: draw at least this many samples and stop once "
+                             "--vote-threshold of them agree (at most --repetitions samples per claim).")
+    parser.add_argument("--vote-threshold", type=float, default=1.0,
+                        help="With --min-samples, share of the samples drawn that must agree to stop sampling.")
+    parser.add_argument("--max-attempts", type=int, default=5, help="Attempts per call before recording an error.")
+    parser.add_argument("--retry-budget", type=int, default=None, help="Most retries allowed in the whole run.")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Send a duplicate request for calls slower than the model's p95 latency.")
+    parser.add_argument("--dedup-index", default=None,
+                        help="Near-duplicate claim index (updated from --dataset); only the first row "
+                             "of each cluster is classified.")
+    parser.add_argument("--reuse-verdicts", action="store_true",
+                        help="With --dedup-index, copy each cluster's results to its skipped rows.")
+    parser.add_argument("--examples", type=int, default=0,
+                        help="Add this many similar annotated claims to each prompt as solved examples.")
+    parser.add_argument("--example-index", default=DEFAULT_INDEX_DIR,
+                        help="Example index directory (built from the main experiment workbook if missing).")
+    parser.add_argument("--rpm", nargs="+", default=None,
+                        help='Requests per minute, for all models ("30") or per model ("deepseek/deepseek-r1-0528=20").')
+    parser.add_argument("--cache-control", action="store_true",
+                        help="Mark the system prompt as cacheable; needed for prompt caching with Anthropic models.")
+    parser.add_argument("--structured", action="store_true",
+                        help="Request the full analysis as schema-constrained JSON; answers that do not "
+                             "validate are parsed as text.")
+    parser.add_argument("--prompt-workers", type=int, default=None,
+                        help="Stream the sheet and build prompts in this many processes (ignored with --examples).")
+    parser.add_argument("--metrics", default=None, help="Append per-call latency, token and cost records here.")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve Prometheus metrics on this port while running.")
+
+
+def _classify(args: argparse.Namespace):
+    cache = ResponseCache(args.cache) if args.cache else None
+    index = update_index(args.dataset, args.dedup_index) if args.dedup_index else None
+    example_index = load_or_build(args.example_index) if args.examples else None
+    recorder = None
+    if args.metrics or args.metrics_port:
+        recorder = MetricsRecorder(args.metrics)
+        set_recorder(recorder)
+        if args.metrics_port:
+            recorder.serve(args.metrics_port)
+    written = run_experiment(args.models, args.dataset, args.repetitions,
+                             args.checkpoint, args.max_concurrency, args.limit, cache,
+                             args.max_report_tokens, args.min_samples,
+                             args.max_attempts, args.retry_budget, args.hedge,
+                             duplicate_urls(index) if index else None, example_index, args.examples,
+                             args.structured, parse_rates(args.rpm, args.models), args.cache_control,
+                             args.prompt_workers, args.vote_threshold)
+    print(f"Wrote {written} new results to {args.checkpoint}")
+    if index is not None and args.reuse_verdicts:
+        print(f"Reused {reuse_verdicts(index, args.checkpoint, args.dataset)} results for near-duplicate claims")
+    if cache is not None:
+        print(f"Cache: {cache.stats()}")
+    if recorder is not None:
+        print(recorder.summary(["model", "slice"]).to_string())
+        recorder.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    argv = sys.argv[1:] if argv is None else argv
+    # Runs started before the subcommands existed pass the classify options directly.
+    if argv and argv[0].startswith("-") and argv[0] not in ("-h", "--help"):
+        argv = ["classify", *argv]
+
+    parser = argparse.ArgumentParser(description="Classify fact-check reports with LLMs and work with the results.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    _add_classify_arguments(commands.add_parser("classify", help="Classify fact-check reports with LLMs.",
+                                                description="Classify fact-check reports with LLMs."))
+    parse = commands.add_parser("parse", help="Re-parse the verdicts of a results checkpoint without model calls.")
+    parse.add_argument("checkpoint")
+    parse.add_argument("--output", required=True)
+    for name, (_, description) in COMMANDS.items():
+        # Options, including --help, are left to the module's own parser.
+        commands.add_parser(name, help=description, add_help=False)
+    args, rest = parser.parse_known_args(argv)
+
+    if args.command in COMMANDS:
+        importlib.import_module(COMMANDS[args.command][0]).main(rest)
+        return
+    if rest:
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+    if args.command == "parse":
+        print(f"Wrote {reparse_checkpoint(args.checkpoint, args.output)} records to {args.output}")
+    else:
+        _classify(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from entity_graph import B_RELATIONSHIP, VERDICT, EntityGraph
+
+# Distances between neighbouring nodes in a row and between rows.
+NODE_SPACING = 1.6
+LAYER_SPACING = 1.2
+BLOCK_GAP = 0.8
+# Fewest nodes per row when packing unconnected nodes.
+LOOSE_ROW_MIN = 4
+
+Topology = Tuple[Tuple[str, ...], Tuple[Tuple[int, int], ...]]
+
+
+def _refine(colours: List[int], successors: List[List[int]], predecessors: List[List[int]]) -> List[int]:
+    """Splits colour classes by neighbour colours until the partition is stable.
+
+    New colours are ranks of sorted signatures, so they depend only on the
+    structure and the starting colours, never on node indices.
+    """
+    while True:
+        signatures = [(colours[i],
+                       tuple(sorted(colours[j] for j in successors[i])),
+                       tuple(sorted(colours[j] for j in predecessors[i])))
+                      for i in range(len(colours))]
+        ranks = {signature: rank for rank, signature in enumerate(sorted(set(signatures)))}
+        refined = [ranks[signature] for signature in signatures]
+        if len(ranks) == len(set(colours)):
+            return refined
+        colours = refined
+
+
+def _topology(types: List[str], edges: List[Tuple[int, int]], order: List[int]) -> Topology:
+    position = {original: canonical for canonical, original in enumerate(order)}
+    return (tuple(types[i] for i in order),
+            tuple(sorted((position[source], position[target]) for source, target in edges)))
+
+
+def _search(colours: List[int], types: List[str], edges: List[Tuple[int, int]],
+            successors: List[List[int]], predecessors: List[List[int]]) -> Tuple[Topology, List[int]]:
+    colours = _refine(colours, successors, predecessors)
+    classes = defaultdict(list)
+    for i, colour in enumerate(colours):
+        classes[colour].append(i)
+    tied = [members for _, members in sorted(classes.items()) if len(members) > 1]
+    if not tied:
+        order = sorted(range(len(colours)), key=colours.__getitem__)
+        return _topology(types, edges, order), order
+    # Individualize each member of the first tied class and keep the smallest
+    # result. Twins (same neighbours both ways) can be swapped without changing
+    # the graph, so only one of each group of twins needs trying.
+    candidates = {}
+    for i in tied[0]:
+        candidates.setdefault((tuple(sorted(successors[i])), tuple(sorted(predecessors[i]))), i)
+    best = None
+    for i in candidates.values():
+        individualized = [2 * colour + 1 for colour in colours]
+        individualized[i] -= 1
+        result = _search(individualized, types, edges, successors, predecessors)
+        if best is None or result[0] < best[0]:
+            best = result
+    return best
+
+
+def canonical_topology(graph: EntityGraph) -> Tuple[Topology, List[int]]:
+    """Returns a label-independent description of `graph` and its node order.
+
+    Nodes are ordered by colour refinement (Weisfeiler-Lehman) over node
+    types and edge directions; nodes still tied afterwards are individualized
+    in turn and the smallest resulting description wins. Graphs with the same
+    structure therefore get the same topology key regardless of ids, labels or
+    insertion order. The second value lists the original node indices in
+    canonical order.
+    """
+    index = {node.id: i for i, node in enumerate(graph.nodes)}
+    types = [node.type for node in graph.nodes]
+    edges = [(index[edge.source], index[edge.target]) for edge in graph.edges]
+    successors = [[] for _ in graph.nodes]
+    predecessors = [[] for _ in graph.nodes]
+    for source, target in edges:
+        successors[source].append(target)
+        predecessors[target].append(source)
+
+    type_ranks = {node_type: rank for rank, node_type in enumerate(sorted(set(types)))}
+    return _search([type_ranks[t] for t in types], types, edges, successors, predecessors)
+
+
+@lru_cache(maxsize=4096)
+def _layered_positions(topology: Topology) -> np.ndarray:
+    """Computes an (n, 2) position array for a canonical topology in O(V + E).
+
+    Relationships form the middle row. Everything reachable from a
+    relationship without passing through a verdict hangs below it in rows
+    by distance, and verdicts sit on top, above the nodes they point to.
+    """
+    types, edges = topology
+    n = len(types)
+    neighbours = [[] for _ in range(n)]
+    targets = [[] for _ in range(n)]
+    for source, target in edges:
+        neighbours[source].append(target)
+        neighbours[target].append(source)
+        targets[source].append(target)
+
+    is_verdict = [node_type == VERDICT for node_type in types]
+    block = [-1] * n
+    depth = [0] * n
+    roots = [i for i in range(n) if types[i] == B_RELATIONSHIP]
+    roots += [i for i in range(n) if not is_verdict[i] and types[i] != B_RELATIONSHIP]
+
+    # Breadth-first search from every root; each unclaimed root opens a block.
+    blocks = []
+    for root in roots:
+        if block[root] != -1:
+            continue
+        members = [root]
+        block[root] = len(blocks)
+        queue = [root]
+        for current in queue:
+            for neighbour in neighbours[current]:
+                if block[neighbour] == -1 and not is_verdict[neighbour] and types[neighbour] != B_RELATIONSHIP:
+                    block[neighbour] = block[root]
+                    depth[neighbour] = depth[current] + 1
+                    queue.append(neighbour)
+                    members.append(neighbour)
+        blocks.append(members)
+
+    # Nodes connected to nothing but verdicts are packed into rows underneath
+    # instead of each taking a column of its own.
+    loose = [members[0] for members in blocks if len(members) == 1 and types[members[0]] != B_RELATIONSHIP]
+    blocks = [members for members in blocks if not (len(members) == 1 and members[0] in loose)]
+
+    x = np.zeros(n)
+    y = np.zeros(n)
+    start = 0.0
+    for members in blocks:
+        rows = defaultdict(list)
+        for member in members:
+            rows[depth[member]].append(member)
+        width = max(len(row) for row in rows.values())
+        centre = start + (width - 1) * NODE_SPACING / 2
+        for level, row in rows.items():
+            offsets = (np.arange(len(row)) - (len(row) - 1) / 2) * NODE_SPACING
+            x[row] = centre + offsets
+            y[row] = -level * LAYER_SPACING
+        start += width * NODE_SPACING + BLOCK_GAP
+
+    if loose:
+        bottom = min((y[members].min() for members in blocks), default=LAYER_SPACING) - LAYER_SPACING
+        per_row = max(LOOSE_ROW_MIN, int(start // NODE_SPACING))
+        for k, node in enumerate(loose):
+            x[node] = (k % per_row) * NODE_SPACING
+            y[node] = bottom - (k // per_row) * LAYER_SPACING
+
+    verdicts = [i for i in range(n) if is_verdict[i]]
+    if verdicts:
+        overall_centre = x[~np.array(is_verdict)].mean() if len(verdicts) < n else 0.0
+        for i in verdicts:
+            placed = [t for t in targets[i] if not is_verdict[t]]
+            x[i] = x[placed].mean() if placed else overall_centre
+        y[verdicts] = LAYER_SPACING * 1.5
+        # Spread verdicts that would land on the same spot.
+        verdicts.sort(key=lambda i: x[i])
+        for previous, current in zip(verdicts, verdicts[1:]):
+            x[current] = max(x[current], x[previous] + NODE_SPACING)
+
+    positions = np.column_stack([x, y])
+    positions.setflags(write=False)
+    return positions
+
+
+def layered_layout(graph: EntityGraph) -> Dict[str, np.ndarray]:
+    """Returns {node id: (x, y)} with verdicts on top, relationships in the
+    middle and objects, attributes and values below.
+
+    Layouts are cached by `canonical_topology`, so structurally identical
+    graphs reuse the same positions.
+    """
+    if not graph.nodes:
+        return {}
+    topology, order = canonical_topology(graph)
+    positions = _layered_positions(topology)
+    return {graph.nodes[original].id: positions[canonical] for canonical, original in enumerate(order)}
+
+
+def edge_label_positions(graph: EntityGraph, pos: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the midpoint and text angle in degrees of every edge in `graph`.
+
+    Angles are folded into [-90, 90] so labels never read upside down.
+    """
+    if not graph.edges:
+        return np.zeros((0, 2)), np.zeros(0)
+    sources = np.array([pos[edge.source] for edge in graph.edges], dtype=float)
+    targets = np.array([pos[edge.target] for edge in graph.edges], dtype=float)
+    midpoints = (sources + targets) / 2
+    delta = targets - sources
+    angles = np.degrees(np.arctan2(delta[:, 1], delta[:, 0]))
+    angles = np.where(angles > 90, angles - 180, np.where(angles < -90, angles + 180, angles))
+    return midpoints, angles
@@ -0,0 +1,152 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import textwrap
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from entity_graph import B_ATTRIBUTE, B_OBJECT, B_RELATIONSHIP, B_VALUE, VERDICT, EntityGraph
+from graph_layout import edge_label_positions, layered_layout
+
+# Colour, marker and legend text for every node type.
+NODE_STYLES = {
+    B_OBJECT: ("skyblue", "s", "B-object"),
+    B_RELATIONSHIP: ("lightgreen", "D", "B-relationship"),
+    B_ATTRIBUTE: ("orange", "s", "B-attribute"),
+    B_VALUE: ("#ffdd00", "s", "B-value"),
+    VERDICT: ("lightgrey", "s", "Verdict"),
+}
+# Node labels are wrapped to this many characters per line.
+LABEL_WIDTH = 18
+# Label font size, and the smallest marker area (in points squared) used
+# for short labels.
+FONT_SIZE = 10
+MIN_NODE_SIZE = 4000
+# Diamond markers need more room than squares to hold the same text.
+SHAPE_SCALE = {"s": 1.0, "D": 1.45}
+
+
+def wrap_label(label: str) -> str:
+    """Wraps each line of `label` to LABEL_WIDTH, keeping the line breaks it already has."""
+    return "\n".join(textwrap.fill(line, LABEL_WIDTH) for line in label.split("\n"))
+
+
+def node_size(label: str, shape: str = "s") -> float:
+    """Marker area (points squared) large enough to hold the wrapped `label`."""
+    lines = label.split("\n")
+    # Bold capitals are up to about 0.75 em wide and lines 1.2 em high, plus padding.
+    width = 0.75 * FONT_SIZE * max(len(line) for line in lines) + FONT_SIZE
+    height = 1.2 * FONT_SIZE * len(lines) + FONT_SIZE
+    return max(MIN_NODE_SIZE, (SHAPE_SCALE.get(shape, 1.0) * max(width, height)) ** 2)
+
+
+def render_graph(graph: Union[EntityGraph, Dict],
+                 path: str,
+                 pos: Optional[Dict] = None,
+                 dpi: int = 100,
+                 figsize: Optional[Tuple[float, float]] = None) -> str:
+    """Renders an `EntityGraph` (or its dict form) to `path` with the Agg backend.
+
+    The output format follows the file extension, so "graph.svg" gives a
+    headless SVG and "graph.png" a PNG. `pos` overrides the default
+    `layered_layout`. Without `figsize` the figure grows with the layout.
+    """
+    # Drawing libraries are imported on first use, so that graph scripts and
+    # the CLI can import this module without paying for matplotlib.
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import matplotlib.patches as mpatches
+    import networkx as nx
+
+    if isinstance(graph, dict):
+        graph = EntityGraph.from_dict(graph)
+    G = graph.to_networkx()
+    if pos is None:
+        pos = layered_layout(graph)
+
+    if figsize is None:
+        xs, ys = zip(*pos.values()) if pos else ((0,), (0,))
+        figsize = (max(12, 1.6 * (max(xs) - min(xs))), max(9, 1.6 * (max(ys) - min(ys))))
+
+    fig, ax = plt.subplots(figsize=figsize)
+    if graph.title:
+        ax.set_title(graph.title, fontsize=16)
+
+    labels = {node.id: wrap_label(node.label) for node in graph.nodes}
+    sizes = {node.id: node_size(labels[node.id], NODE_STYLES.get(node.type, ("", "s"))[1]) for node in graph.nodes}
+    for node_type, (color, shape, _) in NODE_STYLES.items():
+        nodes = [node.id for node in graph.nodes if node.type == node_type]
+        if nodes:
+            nx.draw_networkx_nodes(G, pos, nodelist=nodes, node_size=[sizes[n] for n in nodes], node_color=color,
+                                   node_shape=shape, edgecolors="black", ax=ax)
+
+    # Arrows stop at the edge of each target's marker.
+    nx.draw_networkx_edges(G, pos, node_size=[sizes[n] for n in G.nodes], arrowstyle="->", arrowsize=20,
+                           edge_color="gray", width=1.5, ax=ax)
+    nx.draw_networkx_labels(G, pos, labels=labels,
+                            font_size=FONT_SIZE, font_weight="bold", ax=ax)
+    midpoints, angles = edge_label_positions(graph, pos)
+    for edge, (x, y), angle in zip(graph.edges, midpoints, angles):
+        if edge.label:
+            ax.text(x, y, edge.label, rotation=angle, fontsize=9, color="darkred",
+                    ha="center", va="center", rotation_mode="anchor",
+                    bbox=dict(facecolor="white", edgecolor="none", alpha=0.7, pad=1))
+
+    used_types = {node.type for node in graph.nodes}
+    legend_patches = [mpatches.Patch(color=color, label=legend)
+                      for node_type, (color, _, legend) in NODE_STYLES.items() if node_type in used_types]
+    ax.legend(handles=legend_patches, loc="best", fontsize=10)
+
+    # Leave room for labels that are wider than their node markers.
+    ax.margins(0.15)
+    ax.axis("off")
+    fig.tight_layout()
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    fig.savefig(path, dpi=dpi)
+    plt.close(fig)
+    return path
+
+
+def _render_job(job: Tuple[Union[EntityGraph, Dict], str]) -> str:
+    return render_graph(*job)
+
+
+def render_many(jobs: Iterable[Tuple[Union[EntityGraph, Dict], str]], workers: Optional[int] = None) -> List[str]:
+    """Renders (graph, path) pairs in a process pool and returns the paths."""
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_render_job, jobs, chunksize=4))
+
+
+def load_graphs(path: str) -> Iterable[EntityGraph]:
+    """Reads graphs from a .json file (one graph) or a .jsonl file (one per line)."""
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield EntityGraph.from_json(line)
+        else:
+            yield EntityGraph.from_dict(json.load(f))
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Render argumentation graphs.")
+    parser.add_argument("inputs", nargs="+", help="Graph .json or .jsonl files.")
+    parser.add_argument("--out-dir", default="data/output/graphs")
+    parser.add_argument("--format", choices=["png", "svg"], default="png")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    jobs = []
+    for input_path in args.inputs:
+        stem = os.path.splitext(os.path.basename(input_path))[0]
+        for index, graph in enumerate(load_graphs(input_path)):
+            name = graph.id or f"{stem}-{index}"
+            jobs.append((graph, os.path.join(args.out_dir, f"{name}.{args.format}")))
+    paths = render_many(jobs, args.workers)
+    print(f"Rendered {len(paths)} graphs to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
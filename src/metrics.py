@@ -0,0 +1,223 @@
+import argparse
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Sequence
+
+# Report-length buckets (in tokens) used as the default dataset slice.
+SLICE_BOUNDS = (1000, 2000, 4000, 8000)
+
+_tags: contextvars.ContextVar = contextvars.ContextVar("metrics_tags", default={})
+_recorder = None
+
+
+@dataclass
+class CallRecord:
+    """Timing, usage and cost of one completion call."""
+    model: str
+    latency: float
+    time_to_first_token: Optional[float] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    reasoning_tokens: Optional[int] = None
+    cost: Optional[float] = None
+    error: Optional[str] = None
+    timestamp: float = field(default_factory=time.time)
+    tags: Dict = field(default_factory=dict)
+
+
+def report_slice(tokens: int) -> str:
+    """Names the SLICE_BOUNDS bucket of a report with `tokens` tokens, e.g. "1000-2000"."""
+    lower = 0
+    for upper in SLICE_BOUNDS:
+        if tokens < upper:
+            return f"{lower}-{upper}"
+        lower = upper
+    return f"{lower}+"
+
+
+@contextmanager
+def call_tags(**tags):
+    """Attaches `tags` (e.g. row=3, slice="1000-2000") to calls made inside the block."""
+    token = _tags.set({**_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+def current_tags() -> Dict:
+    """The tags attached by the enclosing `call_tags` blocks."""
+    return dict(_tags.get())
+
+
+def usage_fields(usage) -> Dict:
+    """Token counts and cost from an OpenAI-style `usage` object or dict."""
+    if usage is None:
+        return {}
+    if not isinstance(usage, dict):
+        usage = usage.model_dump() if hasattr(usage, "model_dump") else vars(usage)
+    details = usage.get("completion_tokens_details") or {}
+    return {
+        "prompt_tokens": usage.get("prompt_tokens"),
+        "completion_tokens": usage.get("completion_tokens"),
+        "reasoning_tokens": details.get("reasoning_tokens"),
+        # OpenRouter reports the charge for the call alongside the token counts.
+        "cost": usage.get("cost"),
+    }
+
+
+class MetricsRecorder:
+    """Collects CallRecords in memory and appends them to a JSONL file."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.records: List[CallRecord] = []
+        self._lock = threading.Lock()
+        self._file = None
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8")
+
+    def record(self, record: CallRecord):
+        with self._lock:
+            self.records.append(record)
+            if self._file is not None:
+                self._file.write(json.dumps(asdict(record), ensure_ascii=False) + "\n")
+                self._file.flush()
+
+    def summary(self, by: Sequence[str] = ("model",)):
+        return summarize(self.records, by)
+
+    def prometheus_text(self) -> str:
+        """Renders per-model totals in the Prometheus text exposition format."""
+        with self._lock:
+            records = list(self.records)
+        totals = {}
+        for record in records:
+            model = totals.setdefault(record.model, dict.fromkeys(
+                ("calls", "errors", "latency_seconds", "prompt_tokens", "completion_tokens",
+                 "reasoning_tokens", "cost_usd"), 0))
+            model["calls"] += 1
+            model["errors"] += record.error is not None
+            model["latency_seconds"] += record.latency
+            model["prompt_tokens"] += record.prompt_tokens or 0
+            model["completion_tokens"] += record.completion_tokens or 0
+            model["reasoning_tokens"] += record.reasoning_tokens or 0
+            model["cost_usd"] += record.cost or 0
+        lines = []
+        for name in ("calls", "errors", "latency_seconds", "prompt_tokens", "completion_tokens",
+                     "reasoning_tokens", "cost_usd"):
+            metric = f"fact_check_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for model, values in totals.items():
+                lines.append(f'{metric}{{model="{model}"}} {values[name]}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Serves `prometheus_text` at http://host:port/metrics from a daemon thread."""
+        recorder = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = recorder.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def set_recorder(recorder: Optional[MetricsRecorder]):
+    """Makes `recorder` receive the CallRecords of every model call."""
+    global _recorder
+    _recorder = recorder
+
+
+def record_call(model: str, start: float, time_to_first_token: Optional[float] = None,
+                usage=None, error: Optional[Exception] = None):
+    """Records a call that started at `start` (time.perf_counter()) with the active recorder."""
+    if _recorder is None:
+        return
+    _recorder.record(CallRecord(model=model,
+                                latency=time.perf_counter() - start,
+                                time_to_first_token=time_to_first_token,
+                                error=type(error).__name__ if error is not None else None,
+                                tags=dict(_tags.get()),
+                                **usage_fields(usage)))
+
+
+def load_records(path: str) -> Iterator[CallRecord]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield CallRecord(**json.loads(line))
+
+
+def _sum_known(values):
+    # Leaves the total empty rather than 0 when no call reported the value.
+    return values.sum(min_count=1)
+
+
+def summarize(records: Sequence[CallRecord], by: Sequence[str] = ("model",)):
+    """Aggregates calls per group; `by` may name CallRecord fields or tags.
+
+    Returns a DataFrame with call and error counts, total, mean and p95
+    latency, mean time to first token, token totals and total cost, sorted
+    by total latency.
+    """
+    import pandas as pd
+
+    rows = []
+    for record in records:
+        row = asdict(record)
+        row.update(row.pop("tags"))
+        rows.append(row)
+    frame = pd.DataFrame(rows) if rows else pd.DataFrame(columns=[*CallRecord.__dataclass_fields__])
+    for column in by:
+        if column not in frame:
+            frame[column] = None
+    frame["failed"] = frame["error"].notna()
+    grouped = frame.groupby(list(by), dropna=False)
+    summary = grouped.agg(calls=("latency", "size"),
+                          errors=("failed", "sum"),
+                          latency_total=("latency", "sum"),
+                          latency_mean=("latency", "mean"),
+                          latency_p95=("latency", lambda values: values.quantile(0.95)),
+                          ttft_mean=("time_to_first_token", "mean"),
+                          prompt_tokens=("prompt_tokens", "sum"),
+                          completion_tokens=("completion_tokens", "sum"),
+                          reasoning_tokens=("reasoning_tokens", _sum_known),
+                          cost=("cost", _sum_known))
+    return summary.sort_values("latency_total", ascending=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise per-call metrics written by the runner.")
+    parser.add_argument("metrics", help="Metrics JSONL file.")
+    parser.add_argument("--by", nargs="+", default=["model", "slice"],
+                        help="Fields or tags to group by.")
+    args = parser.parse_args()
+    print(summarize(list(load_records(args.metrics)), args.by).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,131 @@
 import os
-from dotenv import load_dotenv
-from typing import Dict, List, Tuple, Optional
+from functools import lru_cache
+from typing import Callable, Dict, Iterator, List, Tuple, Optional
+import hashlib
 import json
 from abc import ABC, abstractmethod
+import random
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+from dataclasses import dataclass, field
 
-from openai import OpenAI
+from metrics import current_tags, record_call
+from prompts import ANALYSIS_SCHEMA
+from text_processing import extract_bracketed_text, parse_verdict
 
-load_dotenv()
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+LOCAL_BASE_URL = "http://localhost:8000/v1"
+# Strict mode makes compliant servers constrain decoding to the schema.
+STRUCTURED_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "argumentation_analysis", "strict": True, "schema": ANALYSIS_SCHEMA},
+}
+
+
+class ResponseBlockedError(RuntimeError):
+    """The provider answered without a completion, e.g. after moderation."""
+
+    def __init__(self, response):
+        super().__init__(f"Response blocked: {response}")
+        self.response = response
+
+
+class RateLimiter:
+    """Spaces out calls so that at most `requests_per_minute` start per minute."""
+
+    def __init__(self, requests_per_minute: Optional[float] = None):
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+        self.set_rate(requests_per_minute)
+
+    def set_rate(self, requests_per_minute: Optional[float]):
+        with self._lock:
+            self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# Shared across instances so that several objects talking to the same model
+# (e.g. one per repetition) still respect a single per-model limit.
+_rate_limiters: Dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(model: str, requests_per_minute: Optional[float] = None) -> RateLimiter:
+    """The shared limiter of `model`; a given `requests_per_minute` updates its rate."""
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(model)
+        if limiter is None:
+            limiter = RateLimiter(requests_per_minute)
+            _rate_limiters[model] = limiter
+        elif requests_per_minute is not None:
+            limiter.set_rate(requests_per_minute)
+        return limiter
+
+
+# One client per (base_url, api key) so that all models reuse the same
+# pooled HTTP connections instead of opening a new pool per instance.
+_clients: Dict[Tuple[str, Optional[str]], "OpenAI"] = {}
+_clients_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def load_environment():
+    """Reads the .env file into os.environ, once, when a model first needs a setting."""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+
+def getenv(name: str, default: Optional[str] = None) -> Optional[str]:
+    load_environment()
+    return os.environ.get(name, default)
+
+
+def get_client(base_url: str, api_key: Optional[str]) -> "OpenAI":
+    # The openai package takes most of a second to import, so it is only
+    # loaded once a client is needed; replay runs and scoring never pay for it.
+    from openai import OpenAI
+
+    with _clients_lock:
+        client = _clients.get((base_url, api_key))
+        if client is None:
+            client = OpenAI(base_url=base_url, api_key=api_key)
+            _clients[(base_url, api_key)] = client
+        return client
+
+
+@dataclass
+class StreamResult:
+    content: str
+    # Whether the stop predicate fired and the rest of the response was dropped.
+    stopped: bool
+    latency: float
+    time_to_first_token: Optional[float] = None
+    # Seconds until the stop predicate fired, e.g. when the verdict appeared.
+    time_to_verdict: Optional[float] = None
+
+
+@dataclass
+class VoteResult:
+    # Majority verdict label, or None if no sample contained a verdict.
+    verdict: Optional[str]
+    votes: Dict[str, int]
+    samples: int
+    # Share of samples that voted for `verdict`.
+    agreement: float
+    responses: List[Tuple[Optional[str], object]] = field(default_factory=list)
 
 
 class BaseModel(ABC):
@@ -15,29 +133,413 @@ class BaseModel(ABC):
     def complete(self, **kwargs):
         pass
 
-class OpenRouterModel(BaseModel):
-    def __init__(self, 
-                 model: str = "qwen/qwen2.5-vl-3b-instruct:free",
-                 api_key_name: str = "OPENROUTER_API_KEY"
+    def stream(self, user_messages: List, **kwargs) -> Iterator[str]:
+        """Yields the completion in chunks as they arrive.
+
+        Backends without native streaming yield the whole completion at once.
+        """
+        content, _ = self.complete(user_messages, **kwargs)
+        if content:
+            yield content
+
+    def complete_streaming(self,
+                           user_messages: List,
+                           stop: Optional[Callable[[str], bool]] = None,
+                           **kwargs) -> StreamResult:
+        """Streams a completion, stopping early once `stop` returns True.
+
+        `stop` is called with every new chunk. When it fires the stream is
+        closed, which closes the underlying connection and ends generation.
+        """
+        start = time.perf_counter()
+        chunks = []
+        time_to_first_token = None
+        time_to_verdict = None
+        stream = self.stream(user_messages, **kwargs)
+        try:
+            for chunk in stream:
+                if time_to_first_token is None:
+                    time_to_first_token = time.perf_counter() - start
+                chunks.append(chunk)
+                if stop is not None and stop(chunk):
+                    time_to_verdict = time.perf_counter() - start
+                    break
+        finally:
+            stream.close()
+        return StreamResult(content="".join(chunks),
+                            stopped=time_to_verdict is not None,
+                            latency=time.perf_counter() - start,
+                            time_to_first_token=time_to_first_token,
+                            time_to_verdict=time_to_verdict)
+
+    def complete_voting(self,
+                        user_messages: List,
+                        min_samples: int = 3,
+                        max_samples: int = 5,
+                        threshold: float = 1.0,
+                        **kwargs) -> VoteResult:
+        """Samples completions one at a time until the majority verdict is settled.
+
+        Sampling stops once at least `min_samples` have been drawn and the
+        leading verdict holds at least `threshold` of the votes, or once no
+        other verdict can catch up within `max_samples`. With the defaults a
+        claim whose first 3 samples agree costs 3 calls instead of 5.
+        Samples are passed increasing `repetition` indices so that caches
+        keep them apart.
+        """
+        votes = Counter()
+        responses = []
+        for repetition in range(max_samples):
+            content, response = self.complete(user_messages, repetition=repetition, **kwargs)
+            responses.append((content, response))
+            verdict = parse_verdict(content)
+            votes[verdict.label if verdict else None] += 1
+
+            drawn = repetition + 1
+            ranked = [count for label, count in votes.most_common() if label is not None] + [0, 0]
+            if drawn >= min_samples and ranked[0] / drawn >= threshold:
+                break
+            if ranked[0] > ranked[1] + (max_samples - drawn):
+                break
+
+        del votes[None]
+        verdict, count = votes.most_common(1)[0] if votes else (None, 0)
+        return VoteResult(verdict=verdict,
+                          votes=dict(votes),
+                          samples=len(responses),
+                          agreement=count / len(responses),
+                          responses=responses)
+
+    def complete_many(self,
+                      batch: List[List[Dict]],
+                      max_concurrency: int = 8,
+                      **kwargs) -> List[Tuple[Optional[str], object]]:
+        """Completes every message list in `batch` concurrently.
+
+        Results are returned in the same order as `batch`. At most
+        `max_concurrency` requests are in flight at once.
+        """
+        if not batch:
+            return []
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(batch))) as executor:
+            return list(executor.map(lambda messages: self.complete(messages, **kwargs), batch))
+
+
+class OpenAICompatibleModel(BaseModel):
+    """Any server that speaks the OpenAI chat completions API."""
+
+    def __init__(self,
+                 model: str,
+                 base_url: str = LOCAL_BASE_URL,
+                 api_key_name: Optional[str] = None,
+                 requests_per_minute: Optional[float] = None
                  ):
 
         self.model = model
-        open_router_api_key = os.environ.get(api_key_name)
-        self.client = OpenAI(base_url="https://openrouter.ai/api/v1",
-                             api_key=open_router_api_key)
+        # Local servers usually ignore the key, but the client requires one.
+        api_key = getenv(api_key_name) if api_key_name else "not-needed"
+        self.client = get_client(base_url, api_key)
+        self.rate_limiter = get_rate_limiter(model, requests_per_minute)
         self.temperature = 0
-        
 
-    def complete(self, user_messages: List):
-        response = self.client.chat.completions.create(
-            model= self.model,
-            temperature=self.temperature,
-            messages=user_messages,
-        )
+
+    def complete(self, user_messages: List, repetition: int = 0, structured: bool = False):
+        # `repetition` does not change the request; it only distinguishes
+        # repeated samples for wrappers such as the response cache.
+        # With `structured`, the server is asked for JSON matching
+        # ANALYSIS_SCHEMA; `text_processing.parse_analysis` validates it and
+        # `parse_verdict` falls back to the text patterns when it does not.
+        options = {"response_format": STRUCTURED_RESPONSE_FORMAT} if structured else {}
+        self.rate_limiter.acquire()
+        start = time.perf_counter()
+        try:
+            response = self.client.chat.completions.create(
+                model= self.model,
+                temperature=self.temperature,
+                messages=user_messages,
+                **options,
+            )
+        except Exception as error:
+            record_call(self.model, start, error=error)
+            raise
 
         if not response.id:
-            print(f"Response blocked: {response}")
-            return None, response
+            record_call(self.model, start, error=ResponseBlockedError(response))
+            raise ResponseBlockedError(response)
 
+        record_call(self.model, start, usage=response.usage)
         response_message = response.choices[0].message
         return response_message.content, response
+
+    def stream(self, user_messages: List, repetition: int = 0) -> Iterator[str]:
+        self.rate_limiter.acquire()
+        start = time.perf_counter()
+        time_to_first_token = None
+        usage = None
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            temperature=self.temperature,
+            messages=user_messages,
+            stream=True,
+            # The final chunk then carries the token counts.
+            stream_options={"include_usage": True},
+        )
+        try:
+            for chunk in stream:
+                usage = chunk.usage or usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if time_to_first_token is None:
+                        time_to_first_token = time.perf_counter() - start
+                    yield chunk.choices[0].delta.content
+        finally:
+            stream.close()
+            # A stream stopped early records no usage, only its timings.
+            record_call(self.model, start, time_to_first_token, usage)
+
+
+class OpenRouterModel(OpenAICompatibleModel):
+    def __init__(self,
+                 model: str = "qwen/qwen2.5-vl-3b-instruct:free",
+                 api_key_name: str = "OPENROUTER_API_KEY",
+                 base_url: str = OPENROUTER_BASE_URL,
+                 requests_per_minute: Optional[float] = None
+                 ):
+        super().__init__(model, base_url, api_key_name, requests_per_minute)
+
+
+def messages_key(user_messages: List, repetition: int = 0) -> str:
+    payload = json.dumps([user_messages, repetition], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ReplayModel(BaseModel):
+    """Serves recorded responses from a JSONL file without any network access.
+
+    Each line needs a "content" field. Lines that also carry "messages" (and
+    optionally "repetition") are returned for exactly that request. Runner
+    checkpoint lines are matched on the call's url tag, their "model" and
+    "repetition"; `model` picks the recorded model to serve and may be left
+    out when the file holds only one. A request without a recorded response
+    raises CompletionFailedError.
+    """
+
+    def __init__(self, path: str, model: Optional[str] = None, **kwargs):
+        # Options meant for API backends, such as api_key_name, do not apply.
+        self.model = f"replay:{path}#{model}" if model else f"replay:{path}"
+        self.temperature = 0
+        self.by_key = {}
+        self.by_url = {}
+        recorded_models = set()
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.get("content") is None:
+                    continue
+                repetition = record.get("repetition", 0)
+                if "messages" in record:
+                    self.by_key[messages_key(record["messages"], repetition)] = record
+                elif record.get("url") is not None and (model is None or record.get("model") in (model, None)):
+                    recorded_models.add(record.get("model"))
+                    self.by_url[(record["url"], repetition)] = record
+        if not self.by_key and not self.by_url:
+            raise ValueError(f"No recorded responses in {path}")
+        if len(recorded_models - {None}) > 1:
+            raise ValueError(f"{path} holds responses of several models; "
+                             f"pick one with replay:{path}#MODEL")
+
+    def complete(self, user_messages: List, repetition: int = 0, **kwargs):
+        # Request options such as `structured` are ignored: the recorded
+        # content is served as it is.
+        start = time.perf_counter()
+        record = self.by_key.get(messages_key(user_messages, repetition))
+        if record is None:
+            record = self.by_url.get((current_tags().get("url"), repetition))
+        if record is None:
+            from resilience import CompletionError, CompletionFailedError
+
+            raise CompletionFailedError(CompletionError(
+                model=self.model, kind="ReplayMiss", attempts=1, retryable=False,
+                message=f"No recorded response for url {current_tags().get('url')!r}, "
+                        f"repetition {repetition}"))
+        record_call(self.model, start, usage=record.get("usage"))
+        return record["content"], record
+
+
+class InjectedFailureError(RuntimeError):
+    pass
+
+
+class FaultInjectionModel(BaseModel):
+    """Wraps a model with synthetic latency and random failures.
+
+    Each call sleeps for `latency` seconds plus up to `jitter` seconds and
+    raises InjectedFailureError with probability `failure_rate`. The
+    random generator is seeded so that runs are repeatable.
+    """
+
+    def __init__(self,
+                 inner: BaseModel,
+                 latency: float = 0.0,
+                 jitter: float = 0.0,
+                 failure_rate: float = 0.0,
+                 seed: int = 42):
+        self.inner = inner
+        self.model = inner.model
+        self.temperature = inner.temperature
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def complete(self, user_messages: List, **kwargs):
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            fail = self._random.random() < self.failure_rate
+        time.sleep(delay)
+        if fail:
+            raise InjectedFailureError(f"Injected failure for {self.model}")
+        return self.inner.complete(user_messages, **kwargs)
+
+
+@dataclass
+class CascadeTrace:
+    """How `CascadeModel` arrived at its answer."""
+    verdict: Optional[str]
+    # Model whose answer was kept.
+    model: str
+    # One entry per stage tried: model, verdict, agreement, samples and,
+    # for stages that were passed over, the reason for escalating.
+    stages: List[Dict] = field(default_factory=list)
+
+
+def settle_vote(votes: Counter, drawn: int, samples: int, min_votes: int) -> Tuple[bool, Optional[str]]:
+    """Whether a vote over `samples` samples is decided after `drawn` of them, and its verdict.
+
+    A verdict is accepted when at least `min_votes` samples hold it and it
+    strictly leads every other verdict. `votes` counts the valid verdicts
+    drawn so far. The vote is settled early only once every way the remaining
+    samples could fall gives the same outcome, so the decision never depends
+    on the order in which the samples arrive.
+    """
+    remaining = samples - drawn
+    ranked = [count for _, count in votes.most_common(2)] + [0, 0]
+    if ranked[0] >= min_votes and ranked[0] > ranked[1] + remaining:
+        return True, votes.most_common(1)[0][0]
+    if ranked[0] + remaining < min_votes or remaining == 0:
+        return True, None
+    return False, None
+
+
+class CascadeModel(BaseModel):
+    """Asks cheap models first and escalates only when their answer is doubtful.
+
+    Every stage but the last votes over up to `samples` samples, stopping as
+    soon as the outcome is settled (see `settle_vote`). The cascade moves
+    on when no sample holds a bracketed verdict ("unparsed"), when the
+    brackets hold something outside the catalogue ("off_catalogue"), or
+    when no verdict gets `min_votes` votes and a strict lead
+    ("low_agreement"). `min_votes` defaults to a strict majority of
+    `samples`. The last stage is asked once and always answers.
+    """
+
+    def __init__(self, stages: List[BaseModel], samples: int = 3, min_votes: Optional[int] = None):
+        if not stages:
+            raise ValueError("A cascade needs at least one stage")
+        self.stages = stages
+        self.samples = samples
+        self.min_votes = min_votes if min_votes is not None else samples // 2 + 1
+        self.model = "cascade:" + ",".join(stage.model for stage in stages)
+        self.temperature = stages[0].temperature
+
+    def complete(self, user_messages: List, repetition: int = 0, **kwargs):
+        trace = []
+        for stage in self.stages[:-1]:
+            votes = Counter()
+            contents = []
+            # Samples get their own repetition indices so that caches keep them apart.
+            for sample in range(self.samples):
+                content, _ = stage.complete(user_messages, repetition=sample, **kwargs)
+                contents.append(content or "")
+                verdict = parse_verdict(content)
+                if verdict:
+                    votes[verdict.label] += 1
+                settled, accepted = settle_vote(votes, sample + 1, self.samples, self.min_votes)
+                if settled:
+                    break
+            leader, count = votes.most_common(1)[0] if votes else (None, 0)
+            # Agreement is measured against the full sample budget, however early the vote settled.
+            step = {"model": stage.model, "verdict": leader, "agreement": count / self.samples,
+                    "samples": len(contents)}
+            trace.append(step)
+            if accepted is not None:
+                content = next(c for c in contents if (v := parse_verdict(c)) and v.label == accepted)
+                return content, CascadeTrace(accepted, stage.model, trace)
+            if not votes:
+                step["reason"] = "off_catalogue" if any(map(extract_bracketed_text, contents)) else "unparsed"
+            else:
+                step["reason"] = "low_agreement"
+
+        last = self.stages[-1]
+        content, _ = last.complete(user_messages, repetition=repetition, **kwargs)
+        verdict = parse_verdict(content)
+        trace.append({"model": last.model, "verdict": verdict.label if verdict else None,
+                      "agreement": 1.0, "samples": 1})
+        return content, CascadeTrace(verdict.label if verdict else None, last.model, trace)
+
+
+# Backend factories by prefix. A model string "<prefix>:<rest>" is built by
+# BACKENDS[prefix](rest, **kwargs); strings without a registered prefix
+# (e.g. "qwen/qwen2.5-vl-3b-instruct:free") are OpenRouter model names.
+BACKENDS: Dict[str, Callable[..., BaseModel]] = {}
+
+
+def register_backend(prefix: str):
+    def decorator(factory: Callable[..., BaseModel]):
+        BACKENDS[prefix] = factory
+        return factory
+    return decorator
+
+
+@register_backend("openrouter")
+def _openrouter_backend(model: str, **kwargs) -> BaseModel:
+    return OpenRouterModel(model, **kwargs)
+
+
+@register_backend("local")
+def _local_backend(model: str, **kwargs) -> BaseModel:
+    kwargs.setdefault("base_url", getenv("LOCAL_OPENAI_BASE_URL", LOCAL_BASE_URL))
+    return OpenAICompatibleModel(model, **kwargs)
+
+
+@register_backend("replay")
+def _replay_backend(path: str, **kwargs) -> BaseModel:
+    # "replay:results.jsonl#deepseek/deepseek-r1-0528" serves one model of a checkpoint.
+    path, _, model = path.partition("#")
+    return ReplayModel(path, model or None, **kwargs)
+
+
+@register_backend("cascade")
+def _cascade_backend(specs: str, samples: int = 3, min_votes: Optional[int] = None, **kwargs) -> BaseModel:
+    # "cascade:cheap-model,expensive-model"; model names never contain commas.
+    return CascadeModel([get_model(spec, **kwargs) for spec in specs.split(",")], samples, min_votes)
+
+
+@register_backend("faulty")
+def _faulty_backend(spec: str, latency: float = 0.0, jitter: float = 0.0,
+                    failure_rate: float = 0.0, seed: int = 42, **kwargs) -> BaseModel:
+    return FaultInjectionModel(get_model(spec, **kwargs), latency, jitter, failure_rate, seed)
+
+
+def get_model(spec: str, **kwargs) -> BaseModel:
+    """Builds a model from a string such as "openrouter:deepseek/deepseek-r1-0528",
+    "local:llama3", "replay:data/output/results.jsonl#deepseek/deepseek-r1-0528",
+    "faulty:replay:data/output/results.jsonl" or
+    "cascade:qwen/qwen2.5-vl-3b-instruct:free,deepseek/deepseek-r1-0528".
+    Keyword arguments go to the backend's constructor."""
+    prefix, _, rest = spec.partition(":")
+    if rest and prefix in BACKENDS:
+        return BACKENDS[prefix](rest, **kwargs)
+    return OpenRouterModel(spec, **kwargs)
@@ -79,4 +79,71 @@ Trend -> B-Value: Increasing (This is implied by the association with the first
  
 Verdict argumentation element: <MISLEADING ASSOCIATION> connecting b-relationships spent and expects to spend.
 Fact check to solve:
-"""
\ No newline at end of file
+"""
+
+# Annotated examples retrieved for a claim are put before the fact check.
+examples_header = "Solved examples of similar claims:\n\n"
+example_template = """Claim: {claim}
+If your time is short: {summary}
+Verdict argumentation element: {verdict}
+
+"""
+examples_footer = "Fact check to solve:\n"
+
+# Appended to the system message in structured-output mode, where the answer
+# is a JSON object (ANALYSIS_SCHEMA below) instead of free text.
+structured_instruction = """
+
+Instead of writing the analysis out as text, answer with a single JSON object holding it: the claim, the entities, \
+the relationships between them with their attributes, and the verdict as the catalogue adjective and noun together \
+with the names of the relationships it concerns."""
+
+# The catalogue from `template` in machine-readable form. A verdict is one
+# adjective followed by one noun, e.g. "MISLEADING ASSOCIATION".
+ADJECTIVES = ("MISLEADING", "FALSE", "UNSUBSTANTIATED", "MISSING", "EXAGGERATED")
+NOUNS = ("RELATIONSHIP", "IDENTITY", "SIMILARITY", "ASSOCIATION", "CONTRAST", "ATTRIBUTE",
+         "VALUE", "OBJECT", "TYPE", "SUBSET", "EVENT", "UTTERANCE")
+
+# JSON schema for the structured-output mode: the whole analysis the
+# template walks through, with the verdict split into catalogue enums.
+# Every property is required and no others are allowed, as strict mode needs.
+_ATTRIBUTE_SCHEMA = {
+    "type": "object",
+    "properties": {"attribute": {"type": "string"}, "value": {"type": "string"}},
+    "required": ["attribute", "value"],
+    "additionalProperties": False,
+}
+_RELATIONSHIP_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "subject": {"type": "string"},
+        "object": {"type": "string"},
+        "on_what": {"type": "string"},
+        "when": {"type": "string"},
+        "attributes": {"type": "array", "items": _ATTRIBUTE_SCHEMA},
+    },
+    "required": ["name", "subject", "object", "on_what", "when", "attributes"],
+    "additionalProperties": False,
+}
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "claim": {"type": "string"},
+        "entities": {"type": "array", "items": {"type": "string"}},
+        "relationships": {"type": "array", "items": _RELATIONSHIP_SCHEMA},
+        "verdict": {
+            "type": "object",
+            "properties": {
+                "adjective": {"type": "string", "enum": list(ADJECTIVES)},
+                "noun": {"type": "string", "enum": list(NOUNS)},
+                # Names of the relationships the verdict is about.
+                "relationships": {"type": "array", "items": {"type": "string"}},
+            },
+            "required": ["adjective", "noun", "relationships"],
+            "additionalProperties": False,
+        },
+    },
+    "required": ["claim", "entities", "relationships", "verdict"],
+    "additionalProperties": False,
+}
@@ -0,0 +1,235 @@
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+from models import BaseModel, InjectedFailureError
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits and server errors.
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+@dataclass
+class CompletionError:
+    """What went wrong with a completion, as stored in the results file."""
+    model: str
+    kind: str
+    message: str
+    attempts: int
+    retryable: bool
+    status_code: Optional[int] = None
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+class CompletionFailedError(RuntimeError):
+    """Raised by `ResilientModel` once a completion is given up on."""
+
+    def __init__(self, error: CompletionError):
+        super().__init__(f"{error.model}: {error.kind} after {error.attempts} attempt(s): {error.message}")
+        self.error = error
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (InjectedFailureError, TimeoutError, ConnectionError)):
+        return True
+    # Only errors raised by the client can be openai errors, and by then the
+    # package is loaded; importing it here keeps it out of replay runs.
+    if not type(error).__module__.startswith("openai"):
+        return False
+    from openai import APIConnectionError, APIStatusError
+
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS
+    return isinstance(error, APIConnectionError)
+
+
+class RetryBudget:
+    """Caps the number of retries across a whole run, shared by all models."""
+
+    def __init__(self, max_retries: Optional[int] = None):
+        self.max_retries = max_retries
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def consume(self) -> bool:
+        with self._lock:
+            if self.max_retries is not None and self.used >= self.max_retries:
+                return False
+            self.used += 1
+            return True
+
+
+class CircuitBreaker:
+    """Stops calling a model after `failure_threshold` consecutive failures.
+
+    Once open, no calls are allowed for `reset_timeout` seconds, after
+    which a single trial call is let through; its outcome closes the
+    circuit again or reopens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if not self._trial and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._trial = True
+                return True
+            return False
+
+    def retry_after(self) -> float:
+        """Seconds until `allow` may let a trial call through; 0 if it may now."""
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(self.reset_timeout - (time.monotonic() - self.opened_at), 0.0)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+
+class LatencyTracker:
+    """Keeps the latest `window` call latencies and reports a percentile."""
+
+    def __init__(self, window: int = 200):
+        self.latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, latency: float):
+        with self._lock:
+            self.latencies.append(latency)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if not self.latencies:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ResilientModel(BaseModel):
+    """Wraps a model with retries, a retry budget, hedging and a circuit breaker.
+
+    Retryable errors (rate limits, timeouts, 5xx, dropped connections) are
+    retried up to `max_attempts` times with exponential backoff and full
+    jitter, as long as the shared `budget` has retries left. With `hedge`,
+    a call that is still running after the model's p95 latency gets a
+    duplicate request and the first answer wins; hedging starts after
+    `hedge_min_samples` calls have been timed. Calls that fail for good
+    raise CompletionFailedError with a `CompletionError` record; only
+    retryable errors count towards opening the circuit `breaker`. While the
+    circuit is open, calls wait for it to let a trial call through rather
+    than failing, so an outage delays a run instead of writing it off.
+    """
+
+    def __init__(self,
+                 inner: BaseModel,
+                 max_attempts: int = 5,
+                 base_delay: float = 1.0,
+                 max_delay: float = 60.0,
+                 budget: Optional[RetryBudget] = None,
+                 breaker: Optional[CircuitBreaker] = None,
+                 hedge: bool = False,
+                 hedge_min_samples: int = 20,
+                 seed: Optional[int] = None):
+        self.inner = inner
+        self.model = inner.model
+        self.temperature = inner.temperature
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget or RetryBudget()
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.latency = LatencyTracker()
+        self._random = random.Random(seed)
+        self._executor = ThreadPoolExecutor(thread_name_prefix="hedge") if hedge else None
+
+    def _backoff(self, attempt: int) -> float:
+        return self._random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _call(self, user_messages: List, **kwargs):
+        start = time.perf_counter()
+        result = self.inner.complete(user_messages, **kwargs)
+        self.latency.add(time.perf_counter() - start)
+        return result
+
+    def _hedged_call(self, user_messages: List, **kwargs):
+        threshold = self.latency.percentile(0.95)
+        if threshold is None or len(self.latency.latencies) < self.hedge_min_samples:
+            return self._call(user_messages, **kwargs)
+        # Each request runs in a copy of the caller's context to keep its metrics tags.
+        futures = [self._executor.submit(contextvars.copy_context().run, self._call, user_messages, **kwargs)]
+        done, _ = wait(futures, timeout=threshold)
+        if not done:
+            futures.append(self._executor.submit(contextvars.copy_context().run, self._call,
+                                                 user_messages, **kwargs))
+        # The slower request is left to finish in the background.
+        while True:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None or len(futures) == 1:
+                    return future.result()
+                futures.remove(future)
+
+    def complete(self, user_messages: List, **kwargs):
+        attempt = 0
+        while True:
+            attempt += 1
+            while not self.breaker.allow():
+                # Other calls may hold the trial; poll until it settles the circuit.
+                time.sleep(max(self.breaker.retry_after(), self.breaker.reset_timeout / 10))
+            try:
+                if self.hedge:
+                    result = self._hedged_call(user_messages, **kwargs)
+                else:
+                    result = self._call(user_messages, **kwargs)
+            except CompletionFailedError:
+                # Already settled by the model itself, e.g. a replay miss.
+                self.breaker.record_success()
+                raise
+            except Exception as error:
+                retryable = is_retryable(error)
+                # A blocked or rejected request still means the model answered.
+                if retryable:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                if not retryable or attempt >= self.max_attempts or not self.budget.consume():
+                    raise CompletionFailedError(self._record(error, attempt, retryable)) from error
+                time.sleep(self._backoff(attempt - 1))
+                continue
+            self.breaker.record_success()
+            return result
+
+    def _record(self, error: Exception, attempts: int, retryable: bool) -> CompletionError:
+        return CompletionError(model=self.model,
+                               kind=type(error).__name__,
+                               message=str(error)[:500],
+                               attempts=attempts,
+                               retryable=retryable,
+                               status_code=getattr(error, "status_code", None))
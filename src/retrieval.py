@@ -0,0 +1,172 @@
+import argparse
+import json
+import os
+import re
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from data_loader import CLAIM_COLUMN, MAIN_EXPERIMENT_DATASET, POLITIFACT_DATASET, SUMMARY_COLUMN, iter_records
+from text_processing import normalize_labels, parse_verdicts
+
+DEFAULT_INDEX_DIR = "data/cache/examples"
+SOLUTION_COLUMN = "clean annotators solution"
+# Width of the hashed bag-of-words vectors.
+DIMENSIONS = 4096
+
+_WORD = re.compile(r"\w+")
+
+
+def embed(texts: Sequence[str], dimensions: int = DIMENSIONS) -> np.ndarray:
+    """Unit-length hashed word and word-pair counts, one float32 row per text.
+
+    Counts are log-scaled so repeated words do not dominate, and cosine
+    similarity between rows is a plain dot product.
+    """
+    matrix = np.zeros((len(texts), dimensions), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = _WORD.findall((text or "").casefold())
+        terms = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        for term in terms:
+            matrix[row, zlib.crc32(term.encode("utf-8")) % dimensions] += 1
+    np.log1p(matrix, out=matrix)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def format_solution(solution: str) -> str:
+    """Writes an annotator solution such as "MISLEADING ASSOCIATION, MISSING ATTRIBUTE"
+    in the bracketed form the prompt asks for.
+
+    Misspelled labels are corrected and anything that is not a catalogue
+    verdict is dropped, so examples never teach off-catalogue answers; a
+    solution without any catalogue verdict gives "".
+    """
+    labels = dict.fromkeys(verdict.label for verdict in parse_verdicts(normalize_labels(solution)))
+    return " ".join(f"<{label}>" for label in labels)
+
+
+def query_text(row: Dict) -> str:
+    return f"{row.get(CLAIM_COLUMN) or ''}\n{row.get(SUMMARY_COLUMN) or ''}"
+
+
+class ExampleIndex:
+    """Annotated claims and their vectors, for picking few-shot examples.
+
+    `build` embeds every row that has an annotators' solution; `save` writes
+    the vectors to vectors.npy and the examples to examples.jsonl, and
+    `load` memory-maps the vectors so opening the index costs next to
+    nothing.
+    """
+
+    def __init__(self, vectors: np.ndarray, examples: List[Dict]):
+        self.vectors = vectors
+        self.examples = examples
+        self._urls = np.array([example["url"] for example in examples], dtype=object)
+
+    @classmethod
+    def build(cls, dataset: str = MAIN_EXPERIMENT_DATASET, sheet: str = "main_experiment") -> "ExampleIndex":
+        examples = []
+        for row in iter_records(dataset, sheet, columns=["url", CLAIM_COLUMN, SUMMARY_COLUMN, SOLUTION_COLUMN]):
+            verdict = format_solution(row[SOLUTION_COLUMN] or "")
+            if verdict and row[CLAIM_COLUMN]:
+                examples.append({
+                    "url": row["url"],
+                    "claim": row[CLAIM_COLUMN].strip(),
+                    "summary": (row[SUMMARY_COLUMN] or "").strip(),
+                    "verdict": verdict,
+                })
+        return cls(embed([f"{e['claim']}\n{e['summary']}" for e in examples]), examples)
+
+    def save(self, directory: str = DEFAULT_INDEX_DIR):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "vectors.npy"), self.vectors)
+        with open(os.path.join(directory, "examples.jsonl"), "w", encoding="utf-8") as f:
+            for example in self.examples:
+                f.write(json.dumps(example, ensure_ascii=False) + "\n")
+
+    @classmethod
+    def load(cls, directory: str = DEFAULT_INDEX_DIR) -> "ExampleIndex":
+        vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(directory, "examples.jsonl"), encoding="utf-8") as f:
+            examples = [json.loads(line) for line in f if line.strip()]
+        return cls(vectors, examples)
+
+    def top_k_batch(self, texts: Sequence[str], k: int = 3,
+                    exclude_urls: Optional[Sequence[Optional[str]]] = None) -> List[List[Dict]]:
+        """The `k` most similar examples for each text, most similar first.
+
+        An example whose url equals the text's entry in `exclude_urls` is
+        never returned, so a claim is not given its own solution.
+        """
+        if not texts or not self.examples or k <= 0:
+            return [[] for _ in texts]
+        scores = embed(texts, self.vectors.shape[1]) @ self.vectors.T
+        if exclude_urls is not None:
+            scores[np.asarray(exclude_urls, dtype=object)[:, None] == self._urls[None, :]] = -np.inf
+        k = min(k, len(self.examples))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+        top = np.take_along_axis(top, order, axis=1)
+        return [[self.examples[i] for i, score in zip(row, scores[n, row]) if np.isfinite(score)]
+                for n, row in enumerate(top)]
+
+    def top_k(self, text: str, k: int = 3, exclude_url: Optional[str] = None) -> List[Dict]:
+        return self.top_k_batch([text], k, [exclude_url])[0]
+
+
+def load_or_build(directory: str = DEFAULT_INDEX_DIR, dataset: str = MAIN_EXPERIMENT_DATASET) -> ExampleIndex:
+    if not os.path.exists(os.path.join(directory, "vectors.npy")):
+        ExampleIndex.build(dataset).save(directory)
+    return ExampleIndex.load(directory)
+
+
+def retrieve_for_dataset(index: ExampleIndex, dataset: str = POLITIFACT_DATASET, k: int = 3,
+                         batch_size: int = 1024) -> Iterable[Dict]:
+    """Yields {"url", "examples"} for every row of `dataset`, retrieving in batches."""
+    batch = []
+    for row in iter_records(dataset, columns=["url", CLAIM_COLUMN, SUMMARY_COLUMN]):
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield from _retrieve_batch(index, batch, k)
+            batch = []
+    if batch:
+        yield from _retrieve_batch(index, batch, k)
+
+
+def _retrieve_batch(index: ExampleIndex, rows: List[Dict], k: int) -> Iterable[Dict]:
+    results = index.top_k_batch([query_text(row) for row in rows], k, [row["url"] for row in rows])
+    for row, examples in zip(rows, results):
+        yield {"url": row["url"], "examples": examples}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the few-shot example index and retrieve examples.")
+    parser.add_argument("--examples-dataset", default=MAIN_EXPERIMENT_DATASET,
+                        help="Workbook whose annotated main_experiment rows become examples.")
+    parser.add_argument("--index-dir", default=DEFAULT_INDEX_DIR)
+    parser.add_argument("--rebuild", action="store_true")
+    parser.add_argument("--dataset", default=POLITIFACT_DATASET, help="Claims to retrieve examples for.")
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--output", default=None, help="Write {url, examples} lines to this JSONL file.")
+    args = parser.parse_args()
+
+    if args.rebuild or not os.path.exists(os.path.join(args.index_dir, "vectors.npy")):
+        ExampleIndex.build(args.examples_dataset).save(args.index_dir)
+    index = ExampleIndex.load(args.index_dir)
+
+    start = time.perf_counter()
+    results = list(retrieve_for_dataset(index, args.dataset, args.k))
+    elapsed = time.perf_counter() - start
+    print(f"{len(index.examples)} examples; retrieved {args.k} for {len(results)} claims "
+          f"in {elapsed:.2f}s ({1000 * elapsed / max(len(results), 1):.3f} ms per claim, incl. reading)")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for result in results:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,213 @@
+import json
 import re
-from typing import List, Dict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Iterable, List, Dict, Optional
+
+from prompts import (ADJECTIVES, ANALYSIS_SCHEMA, NOUNS, example_template, examples_footer, examples_header,
+                     structured_instruction, template)
+
+try:
+    import fastjsonschema
+    _validate_analysis = fastjsonschema.compile(ANALYSIS_SCHEMA)
+except ImportError:
+    _validate_analysis = None
+
+# Rough characters-per-token ratio for English text, used without tiktoken.
+CHARS_PER_TOKEN = 4
+TRUNCATION_MARKER = "\n[...]"
+# Share of `max_report_tokens` always kept for the start of the report, where
+# the claim is, however long the summary appended after it.
+MIN_REPORT_SHARE = 0.5
+SUMMARY_HEADER = "\n\nIf your time is short:\n"
+
+BRACKETED_PATTERN = re.compile(r'<(.*?)>')
+
+_adjectives = "|".join(ADJECTIVES)
+_nouns = "|".join(NOUNS)
+# Bracketed verdicts, tolerating markdown emphasis and odd spacing or case.
+VERDICT_PATTERN = re.compile(
+    rf"<[\s*_]*({_adjectives})[\s*_]+({_nouns})[\s*_]*>", re.IGNORECASE)
+# Unbracketed verdicts, only used when the model forgot the brackets.
+BARE_VERDICT_PATTERN = re.compile(rf"\b({_adjectives})\s+({_nouns})\b")
+# Longest possible bracketed verdict plus some slack for emphasis markers.
+MAX_VERDICT_LENGTH = 2 + max(map(len, ADJECTIVES)) + max(map(len, NOUNS)) + 16
+
 
 def extract_bracketed_text(input_string):
-    matches = re.findall(r'<(.*?)>', input_string)
+    matches = BRACKETED_PATTERN.findall(input_string)
     
     if matches:
         return matches
     else:
-        print("No text found inside angle brackets.")
+        return None
+
+
+@dataclass(frozen=True)
+class Verdict:
+    adjective: str
+    noun: str
+    position: int
+    # 1.0 for an exact <ADJECTIVE NOUN>, 0.8 for a bracketed variant with
+    # different case or spacing, 0.5 for a verdict without brackets.
+    confidence: float
+
+    @property
+    def label(self) -> str:
+        return f"{self.adjective} {self.noun}"
+
+    def __str__(self):
+        return self.label
+
+
+def _verdict_from_match(match: re.Match, offset: int = 0, bracketed: bool = True) -> Verdict:
+    adjective, noun = match.group(1).upper(), match.group(2).upper()
+    if not bracketed:
+        confidence = 0.5
+    elif match.group(0) == f"<{adjective} {noun}>":
+        confidence = 1.0
+    else:
+        confidence = 0.8
+    return Verdict(adjective, noun, offset + match.start(), confidence)
+
+
+# Misspellings that occur in the annotation columns.
+LABEL_CORRECTIONS = {
+    "MISSLEADING": "MISLEADING",
+    "MISEALADING": "MISLEADING",
+    "EXAGERRATED": "EXAGGERATED",
+    "RELATIONHIP": "RELATIONSHIP",
+}
+
+
+def normalize_labels(value: Optional[str]) -> str:
+    """Upper-cases annotator labels and fixes the misspellings in LABEL_CORRECTIONS."""
+    value = (value or "").upper()
+    for wrong, right in LABEL_CORRECTIONS.items():
+        value = value.replace(wrong, right)
+    return value
+
+
+def parse_verdicts(text: str) -> List[Verdict]:
+    """Returns every catalogue verdict in `text`, in order of appearance.
+
+    Bracketed spans that are not in the catalogue (e.g. stray HTML) are
+    ignored. Bare "ADJECTIVE NOUN" mentions are only returned when the text
+    contains no bracketed verdict at all.
+    """
+    verdicts = [_verdict_from_match(m) for m in VERDICT_PATTERN.finditer(text)]
+    if not verdicts:
+        verdicts = [_verdict_from_match(m, bracketed=False) for m in BARE_VERDICT_PATTERN.finditer(text)]
+    return verdicts
+
+
+_JSON_TYPES = {"object": dict, "array": list, "string": str}
+
+
+def _schema_errors(value, schema: Dict, path: str = "$") -> Iterable[str]:
+    """Checks `value` against the subset of JSON schema used by ANALYSIS_SCHEMA."""
+    if not isinstance(value, _JSON_TYPES[schema["type"]]):
+        yield f"{path}: expected {schema['type']}"
+        return
+    if "enum" in schema and value not in schema["enum"]:
+        yield f"{path}: {value!r} is not one of {schema['enum']}"
+    if schema["type"] == "array":
+        for index, item in enumerate(value):
+            yield from _schema_errors(item, schema["items"], f"{path}[{index}]")
+    elif schema["type"] == "object":
+        properties = schema["properties"]
+        for name in schema.get("required", ()):
+            if name not in value:
+                yield f"{path}: missing {name!r}"
+        for name, item in value.items():
+            if name in properties:
+                yield from _schema_errors(item, properties[name], f"{path}.{name}")
+            elif schema.get("additionalProperties") is False:
+                yield f"{path}: unexpected {name!r}"
+
+
+def validate_analysis(data) -> Optional[str]:
+    """Returns why `data` does not match ANALYSIS_SCHEMA, or None if it does.
+
+    Uses fastjsonschema when it is installed and a small built-in checker
+    otherwise.
+    """
+    if _validate_analysis is not None:
+        try:
+            _validate_analysis(data)
+        except fastjsonschema.JsonSchemaException as error:
+            return error.message
+        return None
+    return next(iter(_schema_errors(data, ANALYSIS_SCHEMA)), None)
+
+
+def parse_analysis(text: Optional[str]) -> Optional[Dict]:
+    """Returns the structured analysis in `text` if it is valid JSON matching
+    ANALYSIS_SCHEMA, else None so callers can fall back to the text parser."""
+    if not text or not text.lstrip().startswith(("{", "```")):
+        return None
+    text = text.strip()
+    if text.startswith("```"):
+        # Some models wrap JSON in a markdown code fence despite the schema.
+        text = text.strip("`").removeprefix("json").strip()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    return data if validate_analysis(data) is None else None
+
+
+def parse_verdict(text: Optional[str]) -> Optional[Verdict]:
+    """Returns the first most confident verdict in `text`, or None.
+
+    A structured analysis (see `parse_analysis`) gives its verdict with full
+    confidence; anything else goes through the text patterns.
+    """
+    if not text:
+        return None
+    analysis = parse_analysis(text)
+    if analysis is not None:
+        return Verdict(analysis["verdict"]["adjective"], analysis["verdict"]["noun"], 0, 1.0)
+    verdicts = parse_verdicts(text)
+    if not verdicts:
+        return None
+    return max(verdicts, key=lambda verdict: verdict.confidence)
+
+
+def parse_verdicts_bulk(texts: Iterable[Optional[str]]) -> List[Optional[Verdict]]:
+    return [parse_verdict(text) for text in texts]
+
+
+class StreamingVerdictParser:
+    """Finds the first exact catalogue verdict in a stream of text chunks.
+
+    `feed` returns the verdict as soon as it is complete, even when it is
+    split across chunks. Only a short tail of the stream is kept in memory.
+    Variants with odd case or spacing are passed over: `parse_verdict`
+    prefers a later exact match to them, so stopping at one could record a
+    different verdict than parsing the whole response.
+    """
+
+    def __init__(self):
+        self.verdict: Optional[Verdict] = None
+        self._buffer = ""
+        self._offset = 0
+
+    def feed(self, chunk: str) -> Optional[Verdict]:
+        if self.verdict is not None:
+            return self.verdict
+        self._buffer += chunk
+        for match in VERDICT_PATTERN.finditer(self._buffer):
+            verdict = _verdict_from_match(match, self._offset)
+            if verdict.confidence == 1.0:
+                self.verdict = verdict
+                return verdict
+        # Anything before the last MAX_VERDICT_LENGTH characters cannot be
+        # the start of a verdict that is completed by a later chunk.
+        excess = len(self._buffer) - MAX_VERDICT_LENGTH
+        if excess > 0:
+            self._buffer = self._buffer[excess:]
+            self._offset += excess
         return None
 
 
@@ -15,4 +215,88 @@ def get_user_message(text: str) -> List[Dict]:
     return [{
         "role": "user",
         "content": text
-    }]
\ No newline at end of file
+    }]
+
+
+@lru_cache(maxsize=None)
+def _get_encoding():
+    """The tiktoken encoding, loaded on first use, or None to fall back to CHARS_PER_TOKEN.
+
+    Loading can fail without tiktoken and also offline, when the BPE file is
+    not cached yet.
+    """
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Keeps the start of `text` (where the claim is) within `max_tokens`."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        return encoding.decode(tokens[:max_tokens]) + TRUNCATION_MARKER
+    return text[:max_tokens * CHARS_PER_TOKEN] + TRUNCATION_MARKER
+
+
+def get_prompt_messages(fact_check: str,
+                        max_report_tokens: Optional[int] = None,
+                        summary: Optional[str] = None,
+                        cache_control: bool = False,
+                        examples: Optional[List[Dict]] = None,
+                        structured: bool = False) -> List[Dict]:
+    """Builds the messages for classifying one fact-check report.
+
+    The catalogue in `template` never changes between calls, so it is sent as
+    an identical system message that providers can serve from their prompt
+    cache; only the user message differs. Reports longer than
+    `max_report_tokens` are truncated, and when a `summary` (the "If your time
+    is short" box) is given it is appended after the truncated report so the
+    key findings survive the cut. The report keeps `MIN_REPORT_SHARE` of the
+    budget and the summary is cut to fit the rest, so the claim at the start
+    of the report is never lost. `cache_control` adds the explicit cache
+    breakpoint that Anthropic models need on OpenRouter. `examples` (dicts
+    with "claim", "summary" and "verdict", e.g. from `retrieval`) are put
+    before the report, leaving the system message unchanged. `structured` asks
+    for the JSON analysis of the structured-output mode instead of text.
+    """
+    system_content = template + structured_instruction if structured else template
+    if cache_control:
+        system_content = [{"type": "text", "text": system_content, "cache_control": {"type": "ephemeral"}}]
+
+    if max_report_tokens is not None and count_tokens(fact_check) > max_report_tokens:
+        if summary:
+            summary_budget = max_report_tokens - int(max_report_tokens * MIN_REPORT_SHARE)
+            summary_budget -= count_tokens(SUMMARY_HEADER + TRUNCATION_MARKER)
+            summary = truncate_to_tokens(summary, max(summary_budget, 0))
+            report_budget = max_report_tokens - count_tokens(SUMMARY_HEADER + summary)
+            fact_check = truncate_to_tokens(fact_check, report_budget) + SUMMARY_HEADER + summary
+        else:
+            fact_check = truncate_to_tokens(fact_check, max_report_tokens)
+
+    if examples:
+        fact_check = (examples_header + "".join(example_template.format(**example) for example in examples)
+                      + examples_footer + fact_check)
+
+    return [
+        {"role": "system", "content": system_content},
+        {"role": "user", "content": fact_check},
+    ]
+
+
+def stop_at_verdict() -> Callable[[str], bool]:
+    """Returns a stop predicate for `BaseModel.complete_streaming` that fires
+    as soon as an exact catalogue verdict has been streamed."""
+    parser = StreamingVerdictParser()
+    return lambda chunk: parser.feed(chunk) is not None
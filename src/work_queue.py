@@ -0,0 +1,417 @@
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from data_loader import CLAIM_COLUMN, POLITIFACT_DATASET, REPORT_COLUMN, SUMMARY_COLUMN, iter_records
+from fact_checking import classify, parse_rates, response_id, result_record
+from models import get_model
+from resilience import CircuitBreaker, CompletionFailedError, ResilientModel
+from retrieval import DEFAULT_INDEX_DIR, load_or_build, query_text
+
+DEFAULT_QUEUE = "data/output/queue.sqlite"
+DEFAULT_VARIANTS = {"default": {}}
+# Options a prompt variant may set; "examples" is the number of few-shot examples.
+VARIANT_OPTIONS = {"max_report_tokens", "examples", "structured", "cache_control"}
+# How long a claimed shard stays reserved without progress before other
+# workers may take it over.
+LEASE_SECONDS = 600.0
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Autocommit, so that claims can take the write lock with BEGIN IMMEDIATE.
+    conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+class ResultStore:
+    """SQLite table of call results keyed by (row, model, repetition, variant).
+
+    Writing is idempotent: a result replaces an earlier one for the same key
+    only if it succeeded where that one failed, so workers that redo a shard after a lost
+    lease, or stores merged more than once, never duplicate or downgrade
+    results.
+    """
+
+    COLUMNS = ("row", "model", "repetition", "variant", "url", "verdict", "verdict_confidence", "content",
+               "response_id", "analysis", "error", "worker", "created")
+
+    def __init__(self, path: str = DEFAULT_QUEUE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = _connect(path)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                row INTEGER NOT NULL,
+                model TEXT NOT NULL,
+                repetition INTEGER NOT NULL,
+                variant TEXT NOT NULL,
+                url TEXT,
+                verdict TEXT,
+                verdict_confidence REAL,
+                content TEXT,
+                response_id TEXT,
+                analysis TEXT,
+                error TEXT,
+                worker TEXT,
+                created REAL NOT NULL,
+                PRIMARY KEY (row, model, repetition, variant)
+            )""")
+
+    def _upsert(self, select: Optional[str] = None) -> str:
+        updates = ", ".join(f"{column} = excluded.{column}" for column in self.COLUMNS[4:])
+        # SQLite needs a WHERE on the SELECT to tell its ON CONFLICT apart from a join.
+        source = f"{select} WHERE true" if select else f"VALUES ({', '.join('?' * len(self.COLUMNS))})"
+        return (f"INSERT INTO results ({', '.join(self.COLUMNS)}) {source} "
+                f"ON CONFLICT (row, model, repetition, variant) DO UPDATE SET {updates} "
+                f"WHERE results.error IS NOT NULL AND excluded.error IS NULL")
+
+    def write(self, record: Dict, variant: str, worker: Optional[str] = None):
+        """Stores a `fact_checking.result_record` for `variant`."""
+        values = (record["row"], record["model"], record["repetition"], variant, record["url"],
+                  record["verdict"], record["verdict_confidence"], record["content"], record["response_id"],
+                  json.dumps(record["analysis"], ensure_ascii=False) if "analysis" in record else None,
+                  json.dumps(record["error"], ensure_ascii=False) if record.get("error") else None,
+                  worker, time.time())
+        with self._lock:
+            self._conn.execute(self._upsert(), values)
+
+    def completed(self, rows: Sequence[int]) -> set:
+        """(row, model, repetition, variant) keys of successful results for `rows`."""
+        if not rows:
+            return set()
+        with self._lock:
+            found = self._conn.execute(
+                "SELECT row, model, repetition, variant FROM results "
+                "WHERE error IS NULL AND row BETWEEN ? AND ?", (min(rows), max(rows))).fetchall()
+        return set(found)
+
+    def merge_from(self, path: str) -> int:
+        """Copies the results of another store into this one; returns how many rows changed."""
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("ATTACH DATABASE ? AS source", (path,))
+            try:
+                self._conn.execute(self._upsert(f"SELECT {', '.join(self.COLUMNS)} FROM source.results"))
+            finally:
+                self._conn.execute("DETACH DATABASE source")
+            return self._conn.total_changes - before
+
+    def records(self, variant: Optional[str] = None) -> Iterator[Dict]:
+        """Results in checkpoint form (see `fact_checking.result_record`), with their variant."""
+        query = f"SELECT {', '.join(self.COLUMNS[:11])} FROM results"
+        query += " WHERE variant = ?" if variant is not None else ""
+        query += " ORDER BY row, model, variant, repetition"
+        with self._lock:
+            rows = self._conn.execute(query, (variant,) if variant is not None else ()).fetchall()
+        for row in rows:
+            record = dict(zip(self.COLUMNS, row))
+            analysis, error = record.pop("analysis"), record.pop("error")
+            if analysis is not None:
+                record["analysis"] = json.loads(analysis)
+            if error is not None:
+                record["error"] = json.loads(error)
+            yield record
+
+    def export(self, checkpoint: str, variant: Optional[str] = None) -> int:
+        """Writes the results as a JSONL checkpoint that `evaluation` and the runner read."""
+        if os.path.dirname(checkpoint):
+            os.makedirs(os.path.dirname(checkpoint), exist_ok=True)
+        written = 0
+        with open(checkpoint, "w", encoding="utf-8") as out:
+            for record in self.records(variant):
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                written += 1
+        return written
+
+    def close(self):
+        self._conn.close()
+
+
+class WorkQueue:
+    """Shards of dataset rows that workers lease from a shared SQLite file.
+
+    A sweep is created once with `create`; every shard then covers
+    `shard_size` consecutive rows for all models, repetitions and prompt
+    variants. `claim` hands a pending shard, or one whose lease has run out,
+    to exactly one worker; the lease is renewed with `renew` while the
+    worker makes progress. A shard with failed calls goes back to the queue
+    until it has been tried `max_attempts` times, after which it is marked
+    failed until `retry_failed` is called. Any number of processes can
+    share the file on one host, or hosts can share it on a filesystem with
+    working locks.
+    """
+
+    def __init__(self, path: str = DEFAULT_QUEUE):
+        self.path = path
+        self._conn = _connect(path)
+        self._lock = threading.Lock()
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sweep (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS shards (
+                id INTEGER PRIMARY KEY,
+                first_row INTEGER NOT NULL,
+                last_row INTEGER NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT
+            );""")
+
+    def create(self, dataset: str, model_names: List[str], repetitions: int = 5,
+               variants: Optional[Dict[str, Dict]] = None, shard_size: int = 50,
+               limit: Optional[int] = None):
+        """Defines the sweep and its shards; a queue holds one sweep."""
+        variants = variants or DEFAULT_VARIANTS
+        for name, options in variants.items():
+            unknown = set(options) - VARIANT_OPTIONS
+            if unknown:
+                raise ValueError(f"Unknown options for variant {name!r}: {sorted(unknown)}")
+        rows = sum(1 for _ in iter_records(dataset, columns=["url"]))
+        rows = min(rows, limit) if limit is not None else rows
+        sweep = {"dataset": dataset, "models": model_names, "repetitions": repetitions, "variants": variants}
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._conn.execute("SELECT COUNT(*) FROM shards").fetchone()[0]:
+                    raise ValueError(f"{self.path} already holds a sweep")
+                self._conn.executemany("INSERT INTO sweep (key, value) VALUES (?, ?)",
+                                       [(key, json.dumps(value)) for key, value in sweep.items()])
+                self._conn.executemany("INSERT INTO shards (first_row, last_row) VALUES (?, ?)",
+                                       [(first, min(first + shard_size - 1, rows))
+                                        for first in range(1, rows + 1, shard_size)])
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def sweep(self) -> Dict:
+        with self._lock:
+            return {key: json.loads(value) for key, value in self._conn.execute("SELECT key, value FROM sweep")}
+
+    def claim(self, worker: str, lease_seconds: float = LEASE_SECONDS,
+              max_attempts: int = 3) -> Optional[Dict]:
+        """Leases the next available shard to `worker`, or returns None when none is left.
+
+        A shard whose lease ran out `max_attempts` times is marked failed
+        instead of being handed out again, so `retry_failed` can requeue it.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "UPDATE shards SET state = 'failed', lease_expires = NULL, "
+                    "error = 'lease expired ' || attempts || ' time(s)' "
+                    "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?", (now, max_attempts))
+                shard = self._conn.execute(
+                    "SELECT id, first_row, last_row FROM shards "
+                    "WHERE (state = 'pending' OR (state = 'leased' AND lease_expires < ?)) AND attempts < ? "
+                    "ORDER BY id LIMIT 1", (now, max_attempts)).fetchone()
+                if shard is not None:
+                    self._conn.execute(
+                        "UPDATE shards SET state = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                        "WHERE id = ?", (worker, now + lease_seconds, shard[0]))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return dict(zip(("id", "first_row", "last_row"), shard)) if shard else None
+
+    def renew(self, shard_id: int, worker: str, lease_seconds: float = LEASE_SECONDS) -> bool:
+        """Extends the lease; False if another worker has taken the shard over."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE shards SET lease_expires = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+                (time.time() + lease_seconds, shard_id, worker))
+        return cursor.rowcount == 1
+
+    def finish(self, shard_id: int, worker: str, complete: bool, max_attempts: int = 3):
+        """Marks the shard done, or returns it to the queue when some of its calls failed."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE shards SET state = CASE WHEN ? THEN 'done' WHEN attempts >= ? THEN 'failed' "
+                "ELSE 'pending' END, lease_expires = NULL, "
+                "error = CASE WHEN ? THEN NULL ELSE 'calls failed in attempt ' || attempts END "
+                "WHERE id = ? AND worker = ?",
+                (complete, max_attempts, complete, shard_id, worker))
+
+    def retry_failed(self) -> int:
+        """Puts failed shards back in the queue with a fresh attempt count."""
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE shards SET state = 'pending', attempts = 0, error = NULL WHERE state = 'failed'").rowcount
+
+    def status(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT state, COUNT(*) FROM shards GROUP BY state").fetchall())
+
+    def failures(self) -> List[Dict]:
+        """The failed shards with their rows and the reason they were given up on."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, first_row, last_row, error FROM shards WHERE state = 'failed' ORDER BY id").fetchall()
+        return [dict(zip(("id", "first_row", "last_row", "error"), row)) for row in rows]
+
+    def close(self):
+        self._conn.close()
+
+
+def run_worker(queue: WorkQueue, store: ResultStore, worker: Optional[str] = None,
+               api_key_name: Optional[str] = None, max_concurrency: int = 8, max_attempts: int = 5,
+               lease_seconds: float = LEASE_SECONDS, example_index_dir: str = DEFAULT_INDEX_DIR,
+               shard_attempts: int = 3, max_shards: Optional[int] = None,
+               requests_per_minute: Optional[Dict[str, float]] = None) -> int:
+    """Claims and processes shards until the queue is drained; returns the number of results written.
+
+    Models are built with `api_key_name` (see `OpenRouterModel`), so each
+    worker can use its own key and rate limit (`requests_per_minute` by
+    model name). Calls already stored for a
+    shard are skipped, so a shard taken over after a lost lease resumes
+    where its previous worker stopped. `max_attempts` applies to each call
+    and `shard_attempts` to each shard.
+    """
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    sweep = queue.sweep()
+    variants = sweep["variants"]
+    key_options = {"api_key_name": api_key_name} if api_key_name else {}
+    rates = requests_per_minute or {}
+    models = {name: ResilientModel(get_model(name, **key_options,
+                                             **({"requests_per_minute": rates[name]} if name in rates else {})),
+                                   max_attempts=max_attempts, breaker=CircuitBreaker())
+              for name in sweep["models"]}
+    example_index = (load_or_build(example_index_dir)
+                     if any(options.get("examples") for options in variants.values()) else None)
+    columns = ["url", CLAIM_COLUMN, SUMMARY_COLUMN, REPORT_COLUMN]
+    written = 0
+    shards = 0
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        while max_shards is None or shards < max_shards:
+            shard = queue.claim(worker, lease_seconds, shard_attempts)
+            if shard is None:
+                break
+            shards += 1
+            first, last = shard["first_row"], shard["last_row"]
+            rows = islice(iter_records(sweep["dataset"], columns=columns), first - 1, last)
+            completed = store.completed(range(first, last + 1))
+            futures = []
+            for row_number, row in enumerate(rows, start=first):
+                for variant, options in variants.items():
+                    examples = (example_index.top_k(query_text(row), options["examples"], row.get("url"))
+                                if options.get("examples") else None)
+                    for model_name in sweep["models"]:
+                        for repetition in range(sweep["repetitions"]):
+                            if (row_number, model_name, repetition, variant) in completed:
+                                continue
+                            future = executor.submit(classify, models[model_name], row, repetition,
+                                                     options.get("max_report_tokens"), None, examples,
+                                                     options.get("structured", False),
+                                                     options.get("cache_control", False))
+                            futures.append((future, row_number, row, model_name, repetition, variant))
+
+            failed = 0
+            for future, row_number, row, model_name, repetition, variant in futures:
+                try:
+                    ((_, content, response),) = future.result()
+                    record = result_record(row_number, row.get("url"), model_name, repetition, content,
+                                           response_id(response))
+                except CompletionFailedError as failure:
+                    record = result_record(row_number, row.get("url"), model_name, repetition, None,
+                                           error=failure.error.to_dict())
+                    failed += 1
+                store.write(record, variant, worker)
+                written += 1
+                queue.renew(shard["id"], worker, lease_seconds)
+            queue.finish(shard["id"], worker, not failed, shard_attempts)
+    return written
+
+
+def _parse_variants(value: Optional[str]) -> Optional[Dict[str, Dict]]:
+    """Reads variants given inline as JSON or as the path of a JSON file."""
+    if value is None:
+        return None
+    if os.path.exists(value):
+        with open(value, encoding="utf-8") as f:
+            return json.load(f)
+    return json.loads(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an experiment sweep from a shared SQLite work queue.")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    create = commands.add_parser("create", help="Define the sweep and split it into shards.")
+    create.add_argument("--models", nargs="+", required=True)
+    create.add_argument("--dataset", default=POLITIFACT_DATASET)
+    create.add_argument("--repetitions", type=int, default=5)
+    create.add_argument("--variants", default=None,
+                        help='Prompt variants as JSON or a JSON file, e.g. \'{"short": {"max_report_tokens": 1000}, '
+                             '"fewshot": {"examples": 3}, "json": {"structured": true}}\'.')
+    create.add_argument("--shard-size", type=int, default=50, help="Rows per shard.")
+    create.add_argument("--limit", type=int, default=None, help="Only queue the first N rows.")
+
+    work = commands.add_parser("work", help="Process shards until none is left.")
+    work.add_argument("--results", default=None,
+                      help="Result store to write to (default: the queue file); hosts without a shared "
+                           "filesystem can write locally and merge afterwards.")
+    work.add_argument("--worker", default=None, help="Worker name (default: host:pid).")
+    work.add_argument("--api-key-name", default=None, help="Environment variable holding this worker's API key.")
+    work.add_argument("--rpm", nargs="+", default=None,
+                      help='Requests per minute of this worker, for all models ("30") or per model ("model=20").')
+    work.add_argument("--max-concurrency", type=int, default=8)
+    work.add_argument("--max-attempts", type=int, default=5)
+    work.add_argument("--lease-seconds", type=float, default=LEASE_SECONDS)
+    work.add_argument("--shard-attempts", type=int, default=3, help="Tries per shard before it is marked failed.")
+    work.add_argument("--example-index", default=DEFAULT_INDEX_DIR)
+
+    merge = commands.add_parser("merge", help="Merge result stores and export one result table.")
+    merge.add_argument("sources", nargs="*", help="Result stores of other workers.")
+    merge.add_argument("--output", default=None, help="Also write the merged results as a JSONL checkpoint.")
+    merge.add_argument("--variant", default=None, help="Only export this variant.")
+
+    commands.add_parser("status", help="Count shards by state.")
+    commands.add_parser("retry", help="Put failed shards back in the queue.")
+    args = parser.parse_args()
+
+    queue = WorkQueue(args.queue)
+    if args.command == "create":
+        queue.create(args.dataset, args.models, args.repetitions, _parse_variants(args.variants),
+                     args.shard_size, args.limit)
+        print(f"Queued {sum(queue.status().values())} shards in {args.queue}")
+    elif args.command == "work":
+        store = ResultStore(args.results or args.queue)
+        written = run_worker(queue, store, args.worker, args.api_key_name, args.max_concurrency,
+                             args.max_attempts, args.lease_seconds, args.example_index, args.shard_attempts,
+                             requests_per_minute=parse_rates(args.rpm, queue.sweep()["models"]))
+        print(f"Wrote {written} results to {store.path}")
+        store.close()
+    elif args.command == "merge":
+        store = ResultStore(args.queue)
+        for source in args.sources:
+            print(f"Merged {store.merge_from(source)} results from {source}")
+        if args.output:
+            print(f"Exported {store.export(args.output, args.variant)} results to {args.output}")
+        store.close()
+    elif args.command == "retry":
+        print(f"Requeued {queue.retry_failed()} failed shards")
+    else:
+        print(queue.status())
+        for shard in queue.failures():
+            print(f"Shard {shard['id']} (rows {shard['first_row']}-{shard['last_row']}) failed: {shard['error']}")
+    queue.close()
+
+
+if __name__ == "__main__":
+    main()
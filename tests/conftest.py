@@ -0,0 +1,130 @@
+import json
+import os
+import sys
+import threading
+import time
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The modules in src/ import each other as top-level modules.
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    """Runs each test from the repository root, where the dataset paths are relative to."""
+    monkeypatch.chdir(ROOT)
+
+
+class OpenAIStub(BaseHTTPRequestHandler):
+    """Answers OpenAI chat completion requests and remembers when each arrived.
+
+    It also serves the files and batches endpoints of the Batch API. A batch
+    completes as soon as it is created, and requests for a model whose name
+    ends in "-failing" are listed in its error file.
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body: Dict):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers["Content-Length"]))
+
+    def do_POST(self):
+        if self.path.endswith("/chat/completions"):
+            body = json.loads(self._body())
+            self.server.requests.append((time.monotonic(), body))
+            self._send(completion(body))
+        elif self.path.endswith("/files"):
+            form = BytesParser().parsebytes(f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+                                            + self._body())
+            content = next(part.get_payload(decode=True) for part in form.get_payload()
+                           if part.get_param("name", header="content-disposition") == "file")
+            self._send(self.server.add_file(content.decode("utf-8")))
+        elif self.path.endswith("/batches"):
+            self._send(self.server.run_batch(json.loads(self._body())))
+        else:
+            self.send_error(404)
+
+    def do_GET(self):
+        parts = self.path.split("/")
+        if parts[-2] == "batches":
+            self._send(self.server.batches[parts[-1]])
+        elif parts[-1] == "content":
+            payload = self.server.files[parts[-2]]["content"].encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        else:
+            self.send_error(404)
+
+
+class OpenAIStubServer(ThreadingHTTPServer):
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), OpenAIStub)
+        self.base_url = f"http://127.0.0.1:{self.server_port}/v1"
+        self.requests = []
+        self.files = {}
+        self.batches = {}
+
+    def add_file(self, content: str) -> Dict:
+        file_id = f"file-{len(self.files)}"
+        self.files[file_id] = {"id": file_id, "object": "file", "bytes": len(content), "created_at": 0,
+                               "filename": "requests.jsonl", "purpose": "batch", "status": "processed",
+                               "content": content}
+        return {key: value for key, value in self.files[file_id].items() if key != "content"}
+
+    def run_batch(self, request: Dict) -> Dict:
+        output, errors = [], []
+        for line in self.files[request["input_file_id"]]["content"].splitlines():
+            line = json.loads(line)
+            if line["body"]["model"].endswith("-failing"):
+                errors.append({"id": "batch_req", "custom_id": line["custom_id"],
+                               "response": {"status_code": 500, "body": {"error": {"code": "server_error",
+                                                                                   "message": "Boom"}}},
+                               "error": None})
+            else:
+                output.append({"id": "batch_req", "custom_id": line["custom_id"], "error": None,
+                               "response": {"status_code": 200, "body": completion(line["body"])}})
+        batch_id = f"batch_{len(self.batches)}"
+        self.batches[batch_id] = {
+            "id": batch_id, "object": "batch", "endpoint": request["endpoint"],
+            "input_file_id": request["input_file_id"], "completion_window": request["completion_window"],
+            "created_at": 0, "status": "completed",
+            "output_file_id": self.add_file("".join(json.dumps(line) + "\n" for line in output))["id"],
+            "error_file_id": self.add_file("".join(json.dumps(line) + "\n" for line in errors))["id"],
+        }
+        return self.batches[batch_id]
+
+
+def completion(body: Dict) -> Dict:
+    return {"id": f"chatcmpl-{len(body['messages'])}", "object": "chat.completion", "created": 0,
+            "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": "Verdict: <FALSE VALUE>"}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}}
+
+
+@pytest.fixture
+def openai_server():
+    """A local OpenAI-compatible server; `requests` holds the (arrival time, body) of each completion."""
+    server = OpenAIStubServer()
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
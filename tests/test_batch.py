@@ -0,0 +1,105 @@
+import json
+
+from batch import (LocalBatchBackend, OpenAIBatchBackend, build_requests, custom_id, merge_results, parse_custom_id,
+                   wait_for_batch, write_batch_file)
+from data_loader import POLITIFACT_DATASET, iter_records
+from fact_checking import load_completed
+
+VERDICTS = ["FALSE VALUE", "MISSING EVENT"]
+
+
+def run_batch(backend, tmp_path, requests) -> str:
+    input_path = str(tmp_path / "requests.jsonl")
+    assert write_batch_file(requests, input_path) == len(requests)
+    batch_id = backend.submit(input_path)
+    assert wait_for_batch(backend, batch_id, poll_interval=0.01) == "completed"
+    return backend.download(batch_id, str(tmp_path / "output.jsonl"))
+
+
+def read(path) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_custom_id_round_trip():
+    key = (12, "openrouter:deepseek/deepseek-r1-0528", 3)
+    assert parse_custom_id(custom_id(key)) == key
+
+
+def test_build_requests_skips_completed_calls(tmp_path):
+    checkpoint = str(tmp_path / "results.jsonl")
+    with open(checkpoint, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"row": 1, "model": "gpt-test", "repetition": 0}) + "\n")
+        f.write(json.dumps({"row": 1, "model": "gpt-test", "repetition": 1, "error": {"kind": "Timeout"}}) + "\n")
+    requests = list(build_requests(["gpt-test"], POLITIFACT_DATASET, 2, checkpoint, limit=2))
+    # The failed call is requested again.
+    assert [request["custom_id"] for request in requests] == ["1:1:gpt-test", "2:0:gpt-test", "2:1:gpt-test"]
+    streamed = list(build_requests(["gpt-test"], POLITIFACT_DATASET, 2, checkpoint, limit=2, workers=1))
+    assert streamed == requests
+
+
+def test_openai_batch_round_trip(tmp_path, openai_server, monkeypatch):
+    monkeypatch.setenv("STUB_API_KEY", "test")
+    backend = OpenAIBatchBackend("STUB_API_KEY", openai_server.base_url)
+    checkpoint = str(tmp_path / "results.jsonl")
+    requests = list(build_requests(["gpt-test", "gpt-failing"], POLITIFACT_DATASET, 2, checkpoint, limit=3))
+    output_path = run_batch(backend, tmp_path, requests)
+
+    assert merge_results(output_path, POLITIFACT_DATASET, checkpoint) == 12
+    results = read(checkpoint)
+    succeeded = [result for result in results if "error" not in result]
+    assert sorted((result["row"], result["repetition"]) for result in succeeded) == \
+        [(row, repetition) for row in (1, 2, 3) for repetition in (0, 1)]
+    assert all(result["model"] == "gpt-test" and result["verdict"] == "FALSE VALUE" for result in succeeded)
+    assert all(result["response_id"] for result in succeeded)
+    failed = [result for result in results if "error" in result]
+    assert {result["model"] for result in failed} == {"gpt-failing"}
+    assert failed[0]["error"] == {"kind": "server_error", "message": "Boom"}
+
+    # Failed calls stay open: merging again only adds them, and only they are requested again.
+    assert merge_results(output_path, POLITIFACT_DATASET, checkpoint) == 6
+    assert len([result for result in read(checkpoint) if "error" not in result]) == 6
+    retried = list(build_requests(["gpt-test", "gpt-failing"], POLITIFACT_DATASET, 2, checkpoint, limit=3))
+    assert {parse_custom_id(request["custom_id"])[1] for request in retried} == {"gpt-failing"}
+    assert len(load_completed(checkpoint)) == 6
+
+
+def write_replay(path, rows: int):
+    """Answers repetitions 0 and 1 of the first `rows` claims, differently for each repetition."""
+    with open(path, "w", encoding="utf-8") as f:
+        for number, row in enumerate(iter_records(POLITIFACT_DATASET, columns=["url"])):
+            if number == rows:
+                break
+            for repetition, verdict in enumerate(VERDICTS):
+                f.write(json.dumps({"url": row["url"], "repetition": repetition,
+                                    "content": f"Verdict: <{verdict}>"}) + "\n")
+    return f"replay:{path}"
+
+
+def test_local_batch_with_replay(tmp_path):
+    model = write_replay(tmp_path / "replay.jsonl", rows=2)
+    requests = list(build_requests([model], POLITIFACT_DATASET, 2, str(tmp_path / "none.jsonl"), limit=2))
+    backend = LocalBatchBackend(str(tmp_path / "work"), POLITIFACT_DATASET)
+    output_path = run_batch(backend, tmp_path, requests)
+
+    checkpoint = str(tmp_path / "results.jsonl")
+    assert merge_results(output_path, POLITIFACT_DATASET, checkpoint) == 4
+    # Requests keep their url and repetition, so each gets its own recorded answer.
+    assert sorted((r["row"], r["repetition"], r["verdict"]) for r in read(checkpoint)) == \
+        [(row, repetition, verdict) for row in (1, 2) for repetition, verdict in enumerate(VERDICTS)]
+
+
+def test_local_batch_with_failed_requests_fails(tmp_path):
+    model = write_replay(tmp_path / "replay.jsonl", rows=1)
+    requests = list(build_requests([model, "replay:missing.jsonl"], POLITIFACT_DATASET, 1,
+                                   str(tmp_path / "none.jsonl"), limit=2))
+    backend = LocalBatchBackend(str(tmp_path / "work"), POLITIFACT_DATASET)
+    input_path = str(tmp_path / "requests.jsonl")
+    write_batch_file(requests, input_path)
+    batch_id = backend.submit(input_path)
+    assert wait_for_batch(backend, batch_id, poll_interval=0.01) == "failed"
+
+    errors = {line["custom_id"]: line["error"] for line in read(backend.download(batch_id, input_path + ".out"))}
+    assert errors[custom_id((1, model, 0))] is None
+    assert errors[custom_id((2, model, 0))]["code"] == "CompletionFailedError"
+    assert errors[custom_id((1, "replay:missing.jsonl", 0))]["code"] == "FileNotFoundError"
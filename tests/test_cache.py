@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from cache import CachedModel, ResponseCache
+from data_loader import POLITIFACT_DATASET, iter_records
+from fact_checking import run_experiment
+from models import BaseModel
+
+MESSAGES = [{"role": "user", "content": "Classify this report."}]
+
+
+class CountingModel(BaseModel):
+    """Answers with the repetition it was asked for and counts its calls."""
+
+    def __init__(self):
+        self.model = "counting"
+        self.temperature = 0
+        self.calls = []
+
+    def complete(self, user_messages, repetition: int = 0, **kwargs):
+        self.calls.append((repetition, kwargs))
+        return f"Answer {repetition}", {"id": f"response-{repetition}"}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"))
+    yield cache
+    cache.close()
+
+
+def test_repetitions_are_cached_separately(cache):
+    inner = CountingModel()
+    model = CachedModel(inner, cache)
+    assert [model.complete(MESSAGES, repetition=i)[0] for i in range(3)] == ["Answer 0", "Answer 1", "Answer 2"]
+    assert [repetition for repetition, _ in inner.calls] == [0, 1, 2]
+    # Hits return the stored response as a dict.
+    assert model.complete(MESSAGES, repetition=1) == ("Answer 1", {"id": "response-1"})
+    assert len(inner.calls) == 3
+    assert cache.stats()["hits"] == 1
+
+
+def test_request_options_enter_the_key(cache):
+    inner = CountingModel()
+    model = CachedModel(inner, cache)
+    model.complete(MESSAGES)
+    model.complete(MESSAGES, structured=True)
+    model.complete(MESSAGES, structured=False)
+    # Unset options leave the key of a plain request unchanged.
+    assert inner.calls == [(0, {}), (0, {"structured": True})]
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"), max_entries=2)
+    cache.put("a", "first")
+    cache.put("b", "second")
+    assert cache.get("a")["content"] == "first"
+    cache.put("c", "third")
+    assert cache.get("b") is None
+    assert cache.stats()["entries"] == 2
+    cache.close()
+
+
+def test_cached_replay_run_keeps_repetitions(tmp_path):
+    replay = tmp_path / "replay.jsonl"
+    answers = ["Verdict: <FALSE VALUE>", "Verdict: <MISLEADING SUBSET>", "Verdict: <MISSING EVENT>"]
+    url = next(iter_records(POLITIFACT_DATASET, columns=["url"]))["url"]
+    with open(replay, "w", encoding="utf-8") as f:
+        for repetition, answer in enumerate(answers):
+            f.write(json.dumps({"url": url, "repetition": repetition, "content": answer}) + "\n")
+
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"))
+    for run in ("cold", "warm"):
+        checkpoint = tmp_path / f"{run}.jsonl"
+        run_experiment([f"replay:{replay}"], repetitions=3, checkpoint=str(checkpoint), limit=1, cache=cache)
+        with open(checkpoint, encoding="utf-8") as f:
+            results = sorted((record["repetition"], record["content"]) for record in map(json.loads, f))
+        assert results == list(enumerate(answers))
+    assert cache.stats()["hits"] == 3
+    cache.close()
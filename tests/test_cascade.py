@@ -0,0 +1,79 @@
+from collections import Counter
+from itertools import permutations
+
+import numpy as np
+import pytest
+
+from cascade import simulate, vote
+from models import BaseModel, CascadeModel, settle_vote
+
+MESSAGES = [{"role": "user", "content": "Classify this report."}]
+
+
+class ScriptedModel(BaseModel):
+    """Answers repetition i with the i-th scripted verdict."""
+
+    def __init__(self, name: str, verdicts):
+        self.model = name
+        self.temperature = 0
+        self.verdicts = verdicts
+        self.calls = 0
+
+    def complete(self, user_messages, repetition: int = 0, **kwargs):
+        self.calls += 1
+        verdict = self.verdicts[repetition]
+        return (f"Verdict: <{verdict}>" if verdict else "No verdict."), None
+
+
+@pytest.mark.parametrize("order", sorted(set(permutations(["FALSE VALUE", "FALSE VALUE", "FALSE CONTRAST"]))))
+def test_two_of_three_is_accepted_in_any_order(order):
+    cheap = ScriptedModel("cheap", order)
+    expensive = ScriptedModel("expensive", ["MISSING EVENT"])
+    _, trace = CascadeModel([cheap, expensive]).complete(MESSAGES)
+    assert (trace.verdict, trace.model) == ("FALSE VALUE", "cheap")
+    assert trace.stages[0]["agreement"] == pytest.approx(2 / 3)
+    assert expensive.calls == 0
+    # Two agreeing samples settle the vote before the third is drawn.
+    assert cheap.calls == (2 if order[:2] == ("FALSE VALUE", "FALSE VALUE") else 3)
+
+
+@pytest.mark.parametrize("verdicts, reason", [
+    (["FALSE VALUE", "FALSE CONTRAST", "MISSING EVENT"], "low_agreement"),
+    ([None, None, None], "unparsed"),
+])
+def test_doubtful_votes_escalate(verdicts, reason):
+    cheap = ScriptedModel("cheap", verdicts)
+    _, trace = CascadeModel([cheap, ScriptedModel("expensive", ["MISSING EVENT"])]).complete(MESSAGES)
+    assert (trace.verdict, trace.model) == ("MISSING EVENT", "expensive")
+    assert trace.stages[0]["reason"] == reason
+
+
+def _count(sequence):
+    return Counter(label for label in sequence if label is not None)
+
+
+def test_settled_votes_match_the_full_vote():
+    # Every early decision must equal the decision over all samples.
+    labels = ["A", "B", None]
+    for samples, min_votes in [(3, 2), (4, 3), (5, 3), (5, 4)]:
+        for draws in np.ndindex(*[len(labels)] * samples):
+            sequence = [labels[i] for i in draws]
+            full = settle_vote(_count(sequence), samples, samples, min_votes)
+            for drawn in range(1, samples + 1):
+                settled, verdict = settle_vote(_count(sequence[:drawn]), drawn, samples, min_votes)
+                if settled:
+                    assert verdict == full[1]
+                    break
+
+
+def test_replay_matches_the_live_cascade():
+    codes = np.array([[0, 0, 1], [0, 1, 0], [1, 0, 0], [0, 1, 2], [-1, -1, 0], [2, 2, 2]])
+    verdict, agreement, drawn = vote(codes, min_votes=2)
+    assert verdict.tolist() == [0, 0, 0, -1, -1, 2]
+    assert drawn.tolist() == [2, 3, 3, 3, 2, 2]
+    assert agreement.tolist() == pytest.approx([2 / 3, 2 / 3, 2 / 3, 1 / 3, 0, 2 / 3])
+
+    data = {"consensus": np.zeros((6, 1)), "cheap": codes, "expensive": np.full((6, 1), 3)}
+    result = simulate(data, ["cheap", "expensive"])
+    assert result["predictions"].tolist() == [0, 0, 0, 3, 3, 2]
+    assert result["calls"].tolist() == [15, 2]
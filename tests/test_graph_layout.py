@@ -0,0 +1,70 @@
+import random
+
+import numpy as np
+
+from entity_graph import B_ATTRIBUTE, B_OBJECT, B_RELATIONSHIP, B_VALUE, VERDICT, EntityGraph
+from graph_layout import _layered_positions, canonical_topology, layered_layout
+
+NODES = [
+    ("r1", B_RELATIONSHIP), ("r2", B_RELATIONSHIP),
+    ("o1", B_OBJECT), ("o2", B_OBJECT), ("o3", B_OBJECT),
+    ("a1", B_ATTRIBUTE), ("a2", B_ATTRIBUTE), ("a3", B_ATTRIBUTE),
+    ("v1", B_VALUE), ("v2", B_VALUE), ("v3", B_VALUE),
+    ("verdict", VERDICT),
+]
+EDGES = [
+    ("r1", "o1"), ("r1", "o2"), ("r2", "o2"), ("r2", "o3"),
+    ("o1", "a1"), ("o2", "a2"), ("o3", "a3"),
+    ("a1", "v1"), ("a2", "v2"), ("a3", "v3"),
+    ("verdict", "r1"), ("verdict", "r2"),
+]
+
+
+def build(seed: int, prefix: str = "") -> EntityGraph:
+    rng = random.Random(seed)
+    nodes, edges = list(NODES), list(EDGES)
+    rng.shuffle(nodes)
+    rng.shuffle(edges)
+    graph = EntityGraph()
+    for id, node_type in nodes:
+        graph.add_node(prefix + id, node_type, label=f"{id} {seed}")
+    for source, target in edges:
+        graph.add_edge(prefix + source, prefix + target)
+    return graph
+
+
+def test_insertion_order_and_ids_do_not_change_the_topology():
+    reference, _ = canonical_topology(build(0))
+    for seed in range(1, 30):
+        topology, order = canonical_topology(build(seed, prefix=f"g{seed}-"))
+        assert topology == reference
+        assert sorted(order) == list(range(len(NODES)))
+
+
+def test_structurally_different_graphs_get_different_topologies():
+    graph = build(0)
+    graph.edges.pop()
+    assert canonical_topology(graph)[0] != canonical_topology(build(0))[0]
+
+
+def test_twin_leaves_do_not_multiply_the_search():
+    graph = EntityGraph()
+    graph.add_node("r", B_RELATIONSHIP)
+    for i in range(40):
+        graph.add_node(f"o{i}", B_OBJECT)
+        graph.add_edge("r", f"o{i}")
+    types, edges = canonical_topology(graph)[0]
+    assert types == (B_OBJECT,) * 40 + (B_RELATIONSHIP,)
+    assert edges == tuple((40, i) for i in range(40))
+
+
+def test_layout_is_shared_between_insertion_orders():
+    _layered_positions.cache_clear()
+    first = layered_layout(build(1))
+    second = layered_layout(build(2, prefix="x-"))
+    assert _layered_positions.cache_info().hits == 1
+    # Symmetric nodes may swap places, but the set of positions and the
+    # unique verdict are the same.
+    assert sorted(map(tuple, first.values())) == sorted(map(tuple, second.values()))
+    assert np.allclose(first["verdict"], second["x-verdict"])
+    assert first["verdict"][1] > first["r1"][1] > first["o1"][1]
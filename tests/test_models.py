@@ -0,0 +1,54 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from models import STRUCTURED_RESPONSE_FORMAT, get_model, get_rate_limiter
+
+MESSAGES = [{"role": "user", "content": "Classify this report."}]
+
+
+def test_rate_limit_spaces_requests(openai_server):
+    model = get_model("local:rate-limited", base_url=openai_server.base_url, requests_per_minute=600)
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda _: model.complete(MESSAGES), range(5)))
+    assert [content for content, _ in results] == ["Verdict: <FALSE VALUE>"] * 5
+    # 600 requests per minute is one every 0.1s, so the fifth starts 0.4s in
+    # however many threads are waiting.
+    arrivals = sorted(arrived for arrived, _ in openai_server.requests)
+    assert arrivals[-1] - start >= 0.4
+    assert arrivals[-1] - arrivals[1] >= 0.3 * 0.9
+
+
+def test_models_share_one_limiter_per_model(openai_server):
+    first = get_model("local:shared", base_url=openai_server.base_url, requests_per_minute=600)
+    second = get_model("local:shared", base_url=openai_server.base_url)
+    assert first.rate_limiter is second.rate_limiter is get_rate_limiter("shared")
+    # A new rate updates the shared limiter instead of replacing it.
+    third = get_model("local:shared", base_url=openai_server.base_url, requests_per_minute=1200)
+    assert third.rate_limiter is first.rate_limiter
+    assert first.rate_limiter.interval == 0.05
+
+    start = time.monotonic()
+    for model in (first, second, third, first):
+        model.complete(MESSAGES)
+    assert time.monotonic() - start >= 0.14
+
+
+def test_unlimited_model_does_not_wait(openai_server):
+    model = get_model("local:unlimited", base_url=openai_server.base_url)
+    start = time.monotonic()
+    for _ in range(3):
+        model.complete(MESSAGES)
+    assert model.rate_limiter.interval == 0.0
+    assert len(openai_server.requests) == 3
+    assert time.monotonic() - start < 1.0
+
+
+def test_structured_requests_ask_for_the_analysis_schema(openai_server):
+    model = get_model("local:structured", base_url=openai_server.base_url)
+    model.complete(MESSAGES)
+    model.complete(MESSAGES, structured=True)
+    plain, structured = (body for _, body in openai_server.requests)
+    assert "response_format" not in plain
+    assert structured["response_format"] == STRUCTURED_RESPONSE_FORMAT
+    assert structured["response_format"]["json_schema"]["strict"] is True
@@ -0,0 +1,115 @@
+import time
+
+import pytest
+
+from models import BaseModel, InjectedFailureError
+from resilience import CircuitBreaker, CompletionError, CompletionFailedError, ResilientModel, RetryBudget
+
+MESSAGES = [{"role": "user", "content": "Classify this report."}]
+
+
+class ScriptedModel(BaseModel):
+    """Raises or returns the scripted outcomes in turn, repeating the last one."""
+
+    def __init__(self, *outcomes):
+        self.model = "scripted"
+        self.temperature = 0
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def complete(self, user_messages, **kwargs):
+        outcome = self.outcomes[min(self.calls, len(self.outcomes) - 1)]
+        self.calls += 1
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome, {"id": f"response-{self.calls}"}
+
+
+def resilient(inner, **kwargs) -> ResilientModel:
+    return ResilientModel(inner, base_delay=0.0, seed=0, **kwargs)
+
+
+def test_retryable_errors_are_retried_until_success():
+    inner = ScriptedModel(InjectedFailureError("injected"), TimeoutError("slow"), "Verdict: <FALSE VALUE>")
+    budget = RetryBudget()
+    model = resilient(inner, budget=budget)
+    assert model.complete(MESSAGES) == ("Verdict: <FALSE VALUE>", {"id": "response-3"})
+    assert inner.calls == 3
+    assert budget.used == 2
+    assert model.breaker.failures == 0
+
+
+def test_non_retryable_errors_fail_at_once():
+    inner = ScriptedModel(ValueError("bad request"), "unused")
+    model = resilient(inner)
+    with pytest.raises(CompletionFailedError) as raised:
+        model.complete(MESSAGES)
+    assert raised.value.error == CompletionError(model="scripted", kind="ValueError", message="bad request",
+                                                 attempts=1, retryable=False)
+    assert inner.calls == 1
+    # The model answered, so the circuit has nothing to count.
+    assert model.breaker.failures == 0
+
+
+def test_attempts_are_capped():
+    inner = ScriptedModel(ConnectionError("reset"))
+    model = resilient(inner, max_attempts=3, breaker=CircuitBreaker(failure_threshold=10))
+    with pytest.raises(CompletionFailedError) as raised:
+        model.complete(MESSAGES)
+    assert raised.value.error.attempts == 3
+    assert raised.value.error.retryable
+    assert inner.calls == 3
+
+
+def test_retry_budget_is_shared_between_models():
+    budget = RetryBudget(max_retries=1)
+    first = resilient(ScriptedModel(TimeoutError("slow"), "first"), budget=budget)
+    second = resilient(ScriptedModel(TimeoutError("slow"), "second"), budget=budget)
+    assert first.complete(MESSAGES)[0] == "first"
+    with pytest.raises(CompletionFailedError) as raised:
+        second.complete(MESSAGES)
+    assert raised.value.error.attempts == 1
+    assert budget.used == 1
+
+
+def test_settled_failures_pass_through_unchanged():
+    error = CompletionFailedError(CompletionError("scripted", "ReplayMiss", "no record", 1, False))
+    inner = ScriptedModel(error)
+    model = resilient(inner)
+    with pytest.raises(CompletionFailedError) as raised:
+        model.complete(MESSAGES)
+    assert raised.value is error
+    assert inner.calls == 1
+
+
+def test_circuit_opens_and_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow() and breaker.retry_after() == 0.0
+    breaker.record_failure()
+    assert not breaker.allow()
+    assert 0.0 < breaker.retry_after() <= 0.05
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    # Only one trial at a time; a failed trial reopens the circuit at once.
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.allow() and breaker.allow()
+    assert breaker.failures == 0
+
+
+def test_open_circuit_delays_calls_instead_of_failing():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+    breaker.record_failure()
+    inner = ScriptedModel("Verdict: <MISSING EVENT>")
+    model = resilient(inner, breaker=breaker)
+    start = time.monotonic()
+    assert model.complete(MESSAGES)[0] == "Verdict: <MISSING EVENT>"
+    assert time.monotonic() - start >= 0.09
+    assert breaker.opened_at is None
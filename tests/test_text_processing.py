@@ -0,0 +1,152 @@
+import copy
+import json
+
+import pytest
+
+from prompts import structured_instruction, template
+from text_processing import (MIN_REPORT_SHARE, SUMMARY_HEADER, TRUNCATION_MARKER, StreamingVerdictParser, count_tokens,
+                             get_prompt_messages, parse_analysis, parse_verdict, stop_at_verdict, validate_analysis)
+
+CLAIM = "Says electric cars stall in snowstorm traffic jams."
+REPORT = CLAIM + " " + "The report goes on about batteries and cold weather. " * 200
+SUMMARY = "EVs kept their occupants warm for hours. " * 10
+ANALYSIS = {
+    "claim": CLAIM,
+    "entities": ["electric cars", "snowstorm traffic jams"],
+    "relationships": [{
+        "name": "stall in",
+        "subject": "electric cars",
+        "object": "snowstorm traffic jams",
+        "on_what": "",
+        "when": "",
+        "attributes": [{"attribute": "outcome", "value": "stalled"}],
+    }],
+    "verdict": {"adjective": "FALSE", "noun": "EVENT", "relationships": ["stall in"]},
+}
+
+
+def user_message(*args, **kwargs) -> str:
+    return get_prompt_messages(*args, **kwargs)[1]["content"]
+
+
+def test_short_reports_are_sent_as_they_are():
+    assert user_message(CLAIM, max_report_tokens=100, summary=SUMMARY) == CLAIM
+
+
+def test_truncated_report_keeps_the_claim_first_and_the_summary_after():
+    content = user_message(REPORT, max_report_tokens=300, summary=SUMMARY)
+    assert content.startswith(CLAIM)
+    report, summary = content.split(SUMMARY_HEADER)
+    assert report.endswith(TRUNCATION_MARKER)
+    assert summary == SUMMARY
+    assert count_tokens(content) <= 300 + 5
+
+
+def test_long_summary_is_cut_instead_of_the_report():
+    content = user_message(REPORT, max_report_tokens=100, summary=SUMMARY * 20)
+    report, summary = content.split(SUMMARY_HEADER)
+    assert report.startswith(CLAIM)
+    assert count_tokens(report) >= 100 * MIN_REPORT_SHARE - 5
+    assert summary.endswith(TRUNCATION_MARKER)
+    assert count_tokens(content) <= 100 + 5
+
+
+def test_examples_come_before_the_report():
+    example = {"claim": "Wind turbines cause cancer.", "summary": "They do not.", "verdict": "<FALSE VALUE>"}
+    content = user_message(CLAIM, examples=[example])
+    assert content.index("Wind turbines cause cancer.") < content.index(CLAIM)
+    assert content.endswith(CLAIM)
+
+
+@pytest.mark.parametrize("text, label, confidence", [
+    ("Verdict: <FALSE VALUE>", "FALSE VALUE", 1.0),
+    ("Verdict: <**false  value**>", "FALSE VALUE", 0.8),
+    ("The verdict is FALSE CONTRAST.", "FALSE CONTRAST", 0.5),
+    # An exact match beats an earlier variant.
+    ("First <false contrast>, then <FALSE VALUE>.", "FALSE VALUE", 1.0),
+])
+def test_parse_verdict(text, label, confidence):
+    verdict = parse_verdict(text)
+    assert (verdict.label, verdict.confidence) == (label, confidence)
+
+
+def test_parse_verdict_without_verdict():
+    assert parse_verdict("No idea.") is None
+    assert parse_verdict("<NOT A LABEL>") is None
+    assert parse_verdict(None) is None
+
+
+@pytest.mark.parametrize("text", [
+    "Verdict: <FALSE VALUE> and nothing else.",
+    "First <false contrast>, then <FALSE VALUE>, then <MISSING EVENT>.",
+    "Only a variant: <False Value>.",
+])
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 1000])
+def test_streaming_stop_agrees_with_parse_verdict(text, chunk_size):
+    stop = stop_at_verdict()
+    streamed = ""
+    for start in range(0, len(text), chunk_size):
+        streamed += text[start:start + chunk_size]
+        if stop(text[start:start + chunk_size]):
+            break
+    # Whatever was streamed before stopping parses to the verdict of the whole text.
+    assert parse_verdict(streamed) == parse_verdict(text)
+
+
+def test_streaming_parser_finds_verdicts_split_across_chunks():
+    parser = StreamingVerdictParser()
+    padding = "x" * 500
+    assert parser.feed(padding + "Verdict: <FALSE") is None
+    verdict = parser.feed(" VALUE> more text")
+    assert verdict.label == "FALSE VALUE"
+    assert verdict.position == len(padding) + len("Verdict: ")
+
+
+@pytest.mark.parametrize("text", [json.dumps(ANALYSIS), "  " + json.dumps(ANALYSIS, indent=2),
+                                  "```json\n" + json.dumps(ANALYSIS) + "\n```"])
+def test_parse_analysis(text):
+    assert parse_analysis(text) == ANALYSIS
+    verdict = parse_verdict(text)
+    assert (verdict.label, verdict.confidence) == ("FALSE EVENT", 1.0)
+
+
+def invalid(path, value):
+    analysis = copy.deepcopy(ANALYSIS)
+    *parents, last = path
+    target = analysis
+    for key in parents:
+        target = target[key]
+    if value is None:
+        del target[last]
+    else:
+        target[last] = value
+    return analysis
+
+
+@pytest.mark.parametrize("analysis, error", [
+    (invalid(["verdict", "adjective"], "WRONG"), "$.verdict.adjective: 'WRONG' is not one of"),
+    (invalid(["verdict", "noun"], None), "$.verdict: missing 'noun'"),
+    (invalid(["relationships", 0, "attributes"], "none"), "$.relationships[0].attributes: expected array"),
+    (invalid(["confidence"], "high"), "$: unexpected 'confidence'"),
+    (invalid(["entities"], [1]), "$.entities[0]: expected string"),
+])
+def test_invalid_analysis_is_rejected(analysis, error):
+    assert validate_analysis(analysis).startswith(error)
+    assert parse_analysis(json.dumps(analysis)) is None
+
+
+def test_text_answers_are_not_analyses():
+    assert validate_analysis(ANALYSIS) is None
+    assert parse_analysis("Verdict: <FALSE EVENT>") is None
+    assert parse_analysis('{"claim": "cut off') is None
+    # Invalid JSON falls back to the text patterns.
+    text = '{"verdict": "broken"} Verdict: <MISSING EVENT>'
+    assert parse_verdict(text).label == "MISSING EVENT"
+
+
+def test_structured_prompt_only_changes_the_system_message():
+    plain = get_prompt_messages(REPORT, max_report_tokens=300, summary=SUMMARY)
+    structured = get_prompt_messages(REPORT, max_report_tokens=300, summary=SUMMARY, structured=True)
+    assert plain[0]["content"] == template
+    assert structured[0]["content"] == template + structured_instruction
+    assert structured[1] == plain[1]
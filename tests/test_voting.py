@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from data_loader import POLITIFACT_DATASET, iter_records
+from fact_checking import run_experiment
+from models import BaseModel
+
+MESSAGES = [{"role": "user", "content": "Classify this report."}]
+SAMPLES = ["FALSE VALUE", "FALSE CONTRAST", "FALSE VALUE", "FALSE VALUE", "FALSE VALUE"]
+
+
+class ScriptedModel(BaseModel):
+    """Answers repetition i with the i-th scripted verdict."""
+
+    def __init__(self, verdicts):
+        self.model = "scripted"
+        self.temperature = 0
+        self.verdicts = verdicts
+
+    def complete(self, user_messages, repetition: int = 0, **kwargs):
+        verdict = self.verdicts[repetition]
+        return (f"Verdict: <{verdict}>" if verdict else "No verdict."), None
+
+
+@pytest.mark.parametrize("threshold, samples", [(1.0, 4), (0.6, 3), (0.5, 2)])
+def test_threshold_decides_when_sampling_stops(threshold, samples):
+    vote = ScriptedModel(SAMPLES).complete_voting(MESSAGES, min_samples=2, max_samples=5, threshold=threshold)
+    assert vote.verdict == "FALSE VALUE"
+    assert vote.samples == samples
+    assert vote.agreement == pytest.approx(vote.votes["FALSE VALUE"] / samples)
+
+
+def test_agreeing_samples_stop_at_min_samples():
+    vote = ScriptedModel(["MISSING EVENT"] * 5).complete_voting(MESSAGES, min_samples=3, max_samples=5)
+    assert (vote.verdict, vote.samples, vote.agreement) == ("MISSING EVENT", 3, 1.0)
+
+
+def test_unparsed_samples_do_not_vote():
+    vote = ScriptedModel([None, "FALSE VALUE", None]).complete_voting(MESSAGES, min_samples=3, max_samples=3)
+    assert vote.votes == {"FALSE VALUE": 1}
+    assert vote.agreement == pytest.approx(1 / 3)
+    assert ScriptedModel([None] * 3).complete_voting(MESSAGES, min_samples=3, max_samples=3).verdict is None
+
+
+@pytest.mark.parametrize("threshold, samples", [(1.0, 4), (0.5, 2)])
+def test_runner_passes_the_vote_threshold(tmp_path, threshold, samples):
+    replay = tmp_path / "replay.jsonl"
+    url = next(iter_records(POLITIFACT_DATASET, columns=["url"]))["url"]
+    with open(replay, "w", encoding="utf-8") as f:
+        for repetition, verdict in enumerate(SAMPLES):
+            f.write(json.dumps({"url": url, "repetition": repetition, "content": f"Verdict: <{verdict}>"}) + "\n")
+    checkpoint = tmp_path / "results.jsonl"
+    written = run_experiment([f"replay:{replay}"], repetitions=5, checkpoint=str(checkpoint), limit=1,
+                             min_samples=2, vote_threshold=threshold)
+    assert written == samples
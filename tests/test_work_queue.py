@@ -0,0 +1,138 @@
+import json
+import time
+
+import pytest
+
+from data_loader import POLITIFACT_DATASET, iter_records
+from fact_checking import result_record
+from work_queue import ResultStore, WorkQueue, run_worker
+
+ROWS = 4
+
+
+@pytest.fixture
+def replay(tmp_path):
+    """A replay file answering repetition 0 of the first ROWS claims."""
+    path = tmp_path / "replay.jsonl"
+    with open(path, "w", encoding="utf-8") as f:
+        for number, row in enumerate(iter_records(POLITIFACT_DATASET, columns=["url"])):
+            if number == ROWS:
+                break
+            f.write(json.dumps({"url": row["url"], "repetition": 0, "content": "Verdict: <FALSE VALUE>"}) + "\n")
+    return f"replay:{path}"
+
+
+@pytest.fixture
+def queue(tmp_path, replay):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"))
+    queue.create(POLITIFACT_DATASET, [replay], repetitions=1, shard_size=2, limit=ROWS)
+    yield queue
+    queue.close()
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultStore(str(tmp_path / "queue.sqlite"))
+    yield store
+    store.close()
+
+
+def record(row: int, content=None, error=None):
+    return result_record(row, f"https://example.org/{row}", "replay:test", 0, content,
+                         error={"kind": error} if error else None)
+
+
+def test_claim_hands_each_shard_to_one_worker(queue):
+    first = queue.claim("a")
+    second = queue.claim("b")
+    assert (first["first_row"], first["last_row"]) == (1, 2)
+    assert (second["first_row"], second["last_row"]) == (3, 4)
+    assert queue.claim("c") is None
+    assert queue.status() == {"leased": 2}
+
+
+def test_expired_lease_is_taken_over(queue):
+    shard = queue.claim("a", lease_seconds=0.01)
+    time.sleep(0.02)
+    assert queue.claim("b")["id"] == shard["id"]
+    # The first worker has lost the shard: it can neither renew nor finish it.
+    assert not queue.renew(shard["id"], "a")
+    queue.finish(shard["id"], "a", complete=True)
+    assert queue.status() == {"leased": 1, "pending": 1}
+    assert queue.renew(shard["id"], "b")
+    queue.finish(shard["id"], "b", complete=True)
+    assert queue.status() == {"done": 1, "pending": 1}
+
+
+def test_shard_is_failed_after_max_attempts(queue):
+    for _ in range(2):
+        shard = queue.claim("a", max_attempts=2)
+        assert shard["id"] == 1
+        queue.finish(shard["id"], "a", complete=False, max_attempts=2)
+    assert queue.status() == {"failed": 1, "pending": 1}
+    assert queue.claim("a", max_attempts=2)["id"] == 2
+    assert queue.retry_failed() == 1
+    assert queue.claim("a", max_attempts=2)["id"] == 1
+
+
+def test_lease_expiring_max_attempts_times_fails_the_shard(queue):
+    # Three workers crash in turn without finishing shard 1.
+    for worker in ("a", "b", "c"):
+        assert queue.claim(worker, lease_seconds=0.01)["id"] == 1
+        time.sleep(0.02)
+    assert queue.claim("d")["id"] == 2
+    queue.finish(2, "d", complete=True)
+    assert queue.claim("d") is None
+    assert queue.status() == {"done": 1, "failed": 1}
+    assert queue.failures() == [{"id": 1, "first_row": 1, "last_row": 2, "error": "lease expired 3 time(s)"}]
+    assert queue.retry_failed() == 1
+    assert queue.claim("d")["id"] == 1
+    assert queue.failures() == []
+
+
+def test_write_never_duplicates_or_downgrades(store):
+    store.write(record(1, error="RateLimitError"), "default")
+    store.write(record(1, "Verdict: <FALSE VALUE>"), "default")
+    store.write(record(1, error="RateLimitError"), "default")
+    store.write(record(1, "Verdict: <FALSE CONTRAST>"), "default")
+    (stored,) = store.records()
+    assert stored["verdict"] == "FALSE VALUE"
+    assert "error" not in stored
+
+
+def test_merge_from_is_idempotent(tmp_path, store):
+    other = ResultStore(str(tmp_path / "other.sqlite"))
+    other.write(record(1, "Verdict: <FALSE VALUE>"), "default")
+    other.write(record(2, error="RateLimitError"), "default")
+    other.close()
+    store.write(record(1, error="RateLimitError"), "default")
+    store.write(record(2, "Verdict: <FALSE CONTRAST>"), "default")
+
+    # Only the failed row 1 is replaced; row 2 keeps its successful result.
+    assert store.merge_from(str(tmp_path / "other.sqlite")) == 1
+    assert store.merge_from(str(tmp_path / "other.sqlite")) == 0
+    assert [r["verdict"] for r in store.records()] == ["FALSE VALUE", "FALSE CONTRAST"]
+
+
+def test_worker_resumes_a_taken_over_shard(queue, store, replay):
+    # A worker that lost its lease had already stored the first row of shard 1.
+    queue.claim("lost", lease_seconds=0.01)
+    store.write(result_record(1, None, replay, 0, "Verdict: <FALSE CONTRAST>"), "default", "lost")
+    time.sleep(0.02)
+
+    assert run_worker(queue, store, "b", api_key_name="UNUSED_KEY") == ROWS - 1
+    assert queue.status() == {"done": 2}
+    verdicts = [(r["row"], r["verdict"]) for r in store.records()]
+    assert verdicts == [(1, "FALSE CONTRAST"), (2, "FALSE VALUE"), (3, "FALSE VALUE"), (4, "FALSE VALUE")]
+
+
+def test_worker_returns_shards_with_failed_calls(tmp_path, store, replay):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"))
+    # Repetition 1 is not in the replay file, so every second call fails.
+    queue.create(POLITIFACT_DATASET, [replay], repetitions=2, shard_size=2, limit=ROWS)
+    queue.claim("other")
+    run_worker(queue, store, "b", max_attempts=1, shard_attempts=1)
+    assert queue.status() == {"leased": 1, "failed": 1}
+    errors = [r["error"]["kind"] for r in store.records() if "error" in r]
+    assert errors == ["ReplayMiss", "ReplayMiss"]
+    queue.close()